@@ -1,16 +1,98 @@
 from flask import Flask, request, jsonify
 from datetime import datetime, timedelta
-import pika, json, math, threading, time
+import argparse, asyncio, base64, gc, logging, pika, json, math, os, threading, time
+
+from services.alert_coalescer import AlertCoalescer
+from services.location_history import LocationHistory
+from services.logs import SampledLogger, setup_logging
+from services.partitioning import LOCATION_PARTITIONS, partition_queue
+from services.session_snapshot import PackedRoute, SnapshotGate, dump_session, load_session, read_snapshot, write_snapshot
+from services.session_store import SessionStore
+from services.smoothing import TrackSmoother
+from services.trajectory_store import TrajectoryStore
+from services.route_index import RouteIndex
+from services.route_artifact import load_route_artifact
+from services.user_lanes import UserLanes
+from services.batch_scorer import match_batch
+from services.deadlines import DeadlineScheduler
+from services.fix_codec import decode_fixes
+from services.geometry_pool import GeometryPool
+from services.hazard_zones import HazardLayer
+from services.metrics import LAG_BUCKETS, Registry, instrument_flask
+from services.publisher import QueuedPublisher, event_age, make_event
+from services.risk_pipeline import (DETECTORS, DwellDetector, JumpFilter, OffRouteDetector, ReversalDetector,
+                                    RiskPipeline, SpeedDetector, parse_weights)
 
 # =========================
 # Flask app
 # =========================
 app = Flask(__name__)
 
+# -------------------------
+# Logging: handlers only enqueue records; one writer thread formats and prints
+# them (set up in __main__). Per-fix lines are sampled, alerts and errors are not.
+# -------------------------
+LOG_SAMPLE_FIXES = int(os.environ.get("ANALYTICS_LOG_SAMPLE_FIXES", "1000"))   # log 1 fix in N (1 = all)
+
+log = logging.getLogger("safewalkie.analytics")
+fix_log = SampledLogger(logging.getLogger("safewalkie.analytics.fix"), LOG_SAMPLE_FIXES)
+
+# -------------------------
+# Metrics: GET /metrics (Prometheus text format) on the same app
+# -------------------------
+METRICS_SAMPLE_EVERY = int(os.environ.get("ANALYTICS_METRICS_SAMPLE", "8"))   # per-fix histograms time 1 fix in N
+
+metrics = Registry()
+instrument_flask(app, metrics, "analytics")
+ANALYSIS_SECONDS       = metrics.histogram("analytics_safety_analysis_seconds", "perform_safety_analysis time per fix",
+                                           sample_every=METRICS_SAMPLE_EVERY)
+BATCH_ANALYSIS_SECONDS = metrics.histogram("analytics_batch_analysis_seconds", "perform_batch_safety_analysis time per batch")
+CONSUMER_LAG_SECONDS   = metrics.histogram("analytics_consumer_lag_seconds", "Event timestamp to handling", LAG_BUCKETS,
+                                           sample_every=METRICS_SAMPLE_EVERY)
+PUBLISH_SECONDS        = metrics.histogram("analytics_publish_seconds", "publish() to broker commit, oldest message of each batch",
+                                           LAG_BUCKETS)
+ROUTE_LENGTH_M         = metrics.histogram("analytics_route_length_meters", "Route length per walk.started",
+                                           (250, 500, 1000, 2000, 3000, 5000, 10000, 20000))
+ROUTE_POINTS           = metrics.histogram("analytics_route_points", "Route vertices per walk.started (after simplification)",
+                                           (10, 30, 100, 300, 1000, 3000, 10000))
+EVENTS                 = metrics.counter("analytics_events_total", "Queue events consumed by type", label="type")
+ALERTS_RAISED          = metrics.counter("analytics_alerts_raised_total", "Alerts raised by detectors by type", label="type")
+ALERTS_PUBLISHED       = metrics.counter("analytics_alerts_published_total", "Alert events published by type", label="type")
+metrics.gauge("analytics_active_sessions", "Sessions in memory", lambda: len(active_sessions))
+metrics.counter_fn("analytics_published_total", "Events committed to RabbitMQ", lambda: publisher.published)
+metrics.counter_fn("analytics_publish_retries_total", "Failed publish batches retried", lambda: publisher.retries)
+metrics.counter_fn("analytics_publish_rejected_total", "Alerts dropped with the buffer full (asyncio mode: failed publishes)", lambda: publisher.rejected)
+metrics.gauge("analytics_publish_pending", "Events waiting for the publisher thread", lambda: publisher.pending())
+metrics.counter_fn("analytics_alerts_withheld_total", "Alert raises not published", lambda: {
+    "coalesced": alert_coalescer.coalesced, "throttled": alert_coalescer.throttled}, label="reason")
+metrics.gauge("analytics_hazard_zones", "Zones in the loaded hazard layer",
+              lambda: len(hazard_layer.index) if hazard_layer is not None else 0)
+metrics.counter_fn("analytics_hazard_reloads_total", "Hazard layer loads",
+                   lambda: hazard_layer.version if hazard_layer is not None else 0)
+
+def observe_event(etype, event):
+    """Count a consumed event and record how long it took to get here."""
+    EVENTS.inc(etype)
+    if CONSUMER_LAG_SECONDS.due():
+        lag = event_age(event)
+        if lag is not None:
+            CONSUMER_LAG_SECONDS.observe(lag)
+
 # -------------------------
 # In-memory sessions
 # -------------------------
+HISTORY_CAPACITY         = 128   # most recent fixes kept per session
+HISTORY_ARCHIVE_CAPACITY = 64    # downsampled older fixes kept per session
+HISTORY_ARCHIVE_EVERY    = 10    # keep 1 in N evicted fixes (0 = no archive)
+
 class WalkSession:
+    __slots__ = (
+        "user_id", "route_id", "walking_session_id", "route", "start_time", "is_active",
+        "locations", "last_update", "_route_cache", "_last_seg_idx",
+        "_last_seg_t", "distance_along_m", "remaining_m", "last_speed_mps", "risk",
+        "smoother", "alerts", "hazards",
+    )
+
     def __init__(self, user_id, route=None, route_id=None):
         self.user_id = user_id
         self.route_id = route_id
@@ -18,61 +100,139 @@ class WalkSession:
         self.route = route or []
         self.start_time = datetime.utcnow()
         self.is_active = True
-        self.locations = []
+        self.locations = LocationHistory(HISTORY_CAPACITY, HISTORY_ARCHIVE_CAPACITY, HISTORY_ARCHIVE_EVERY)
         self.last_update = None
-        self.last_alert_time = {}
+        self._route_cache = None                # RouteIndex, built on walk.started
+        self._last_seg_idx = None
+        self._last_seg_t = 0.0                  # progress fraction along _last_seg_idx
+        self.distance_along_m = None
+        self.remaining_m = None
+        self.last_speed_mps = None
+        self.risk = None                        # detector state for this walk, made on the first fix
+        self.smoother = None
+        self.alerts = None                      # AlertState, made on the first alert
+        self.hazards = None                     # ids of the hazard zones the last fix was in
+
 
+SESSION_SHARDS  = 16             # lock stripes in the session store
+SESSION_TTL_SEC = 2 * 3600       # drop sessions with no events for this long
 
-active_sessions = {}
+active_sessions = SessionStore(shards=SESSION_SHARDS, ttl=SESSION_TTL_SEC)
 
 # =========================
-# RabbitMQ (publisher) — own connection (thread-safe via lock)
+# RabbitMQ (publisher) — own connection, owned by the publisher thread
 # =========================
 RABBIT_PARAMS = pika.ConnectionParameters("localhost")
 LOCATION_QUEUE = "location_updates"
 ALERT_QUEUE = "alert_events"
 
-# --- heuristics (only off-route) ---
+# --- heuristics ---
 OFF_ROUTE_THRESHOLD_M = 35.0     # distance from polyline to count as off-route
 OFF_ROUTE_SUSTAIN_S   = 20.0     # must stay off-route for this long
 TICK_SEC              = 10       # recompute about every 10s
+ROUTE_WINDOW_BACK     = 2        # segments behind the last match to re-check
+ROUTE_WINDOW_AHEAD    = 8        # segments ahead of the last match to check
 
-class RabbitPublisher:
-    def __init__(self, params):
-        self.params = params
-        self._lock = threading.Lock()
-        self._connect()
-
-    def _connect(self):
-        self.conn = pika.BlockingConnection(self.params)
-        self.ch = self.conn.channel()
-        self.ch.queue_declare(queue=LOCATION_QUEUE)
-        self.ch.queue_declare(queue=ALERT_QUEUE)
-
-    def publish(self, queue, event_type, data):
-        event = {
-            "type": event_type,
-            "timestamp": datetime.utcnow().isoformat(),
-            "data": data
-        }
-        body = json.dumps(event)
-        with self._lock:
-            try:
-                self.ch.basic_publish(exchange="", routing_key=queue, body=body)
-            except Exception:
-                # reconnect once and retry
-                try:
-                    self._connect()
-                    self.ch.basic_publish(exchange="", routing_key=queue, body=body)
-                except Exception as e:
-                    print(f"[!] Publish failed: {e}")
-                    return
-        print(f"[x] Published {event_type} → {queue}: {event}")
-
-publisher = RabbitPublisher(RABBIT_PARAMS)
+# --- risk pipeline: detector stages run on every fix, in this order ---
+RISK_DETECTORS      = os.environ.get("ANALYTICS_DETECTORS", "jump,off_route,speed,dwell,reversal")
+RISK_WEIGHTS        = parse_weights(os.environ.get("ANALYTICS_RISK_WEIGHTS", ""))  # e.g. "speed=0.8,dwell=0"
+RISK_ALERT_SCORE    = float(os.environ.get("ANALYTICS_RISK_ALERT", "0.6"))     # publish risk_score at or above this
+JUMP_MAX_SPEED_MPS  = float(os.environ.get("ANALYTICS_JUMP_MAX_SPEED", "50"))  # faster than this is a GPS glitch…
+JUMP_MIN_M          = float(os.environ.get("ANALYTICS_JUMP_MIN_M", "250"))     # …if the step is also this long
+WALK_MAX_SPEED_MPS  = float(os.environ.get("ANALYTICS_WALK_MAX_SPEED", "2.5"))
+VEHICLE_SPEED_MPS   = float(os.environ.get("ANALYTICS_VEHICLE_SPEED", "8"))
+DWELL_RADIUS_M      = float(os.environ.get("ANALYTICS_DWELL_RADIUS_M", "20"))
+DWELL_MIN_SEC       = float(os.environ.get("ANALYTICS_DWELL_MIN_SEC", "120"))
+DWELL_MAX_SEC       = float(os.environ.get("ANALYTICS_DWELL_MAX_SEC", "600"))
+
+# --- smoothing and decimation: fixes are alpha-beta filtered before analysis, and
+# route matching is skipped while the smoothed position stays within
+# DECIMATE_MIN_M of the last check for up to DECIMATE_MAX_SEC (0 m = match every fix)
+SMOOTH_ALPHA     = float(os.environ.get("ANALYTICS_SMOOTH_ALPHA", "0.5"))   # 1 = no smoothing
+SMOOTH_BETA      = float(os.environ.get("ANALYTICS_SMOOTH_BETA", "0.1"))
+DECIMATE_MIN_M   = float(os.environ.get("ANALYTICS_DECIMATE_MIN_M", "5"))
+DECIMATE_MAX_SEC = float(os.environ.get("ANALYTICS_DECIMATE_MAX_SEC", "10"))
+
+def new_smoother():
+    return TrackSmoother(SMOOTH_ALPHA, SMOOTH_BETA)
+
+def build_risk_pipeline(names=RISK_DETECTORS, weights=RISK_WEIGHTS):
+    """RiskPipeline from a comma-separated list of detector names (any registered in DETECTORS)."""
+    configured = {
+        "jump": lambda: JumpFilter(JUMP_MAX_SPEED_MPS, JUMP_MIN_M),
+        "off_route": lambda: OffRouteDetector(OFF_ROUTE_THRESHOLD_M, OFF_ROUTE_SUSTAIN_S),
+        "speed": lambda: SpeedDetector(WALK_MAX_SPEED_MPS, VEHICLE_SPEED_MPS),
+        "dwell": lambda: DwellDetector(DWELL_RADIUS_M, DWELL_MIN_SEC, DWELL_MAX_SEC),
+        "reversal": ReversalDetector,
+    }
+    names = [n.strip() for n in names.split(",") if n.strip()]
+    unknown = [n for n in names if n not in configured and n not in DETECTORS]
+    if unknown:
+        raise ValueError(f"Unknown risk detector(s) {', '.join(unknown)}; "
+                         f"valid: {', '.join(sorted(configured.keys() | DETECTORS.keys()))}")
+    return RiskPipeline([configured.get(n, DETECTORS.get(n))() for n in names], weights)
+
+risk_pipeline = build_risk_pipeline()
+
+# --- batch mode (drain backlogs in one go; 0 = per-message consumer) ---
+BATCH_MAX_MESSAGES = int(os.environ.get("ANALYTICS_BATCH_MAX", "0"))
+BATCH_LINGER_SEC   = 0.05        # stop filling a batch once the queue is idle this long
+VECTORIZE_MIN_FIXES = 64         # uploads with fewer fixes are scored fix by fix
+
+# Worker processes for route matching in batch scoring (0 = match in-process).
+# Routes are shared with them once per walk; small batches stay in-process.
+GEOMETRY_WORKERS   = int(os.environ.get("ANALYTICS_GEOMETRY_WORKERS", "0"))
+GEOMETRY_MIN_FIXES = 256
+geometry_pool = None             # GeometryPool, started in __main__
+
+# Parallel consumer threads on location_updates. Handlers are safe to run
+# concurrently, but RabbitMQ round-robins one queue across consumers, so a
+# user's fixes are only guaranteed in order with a single consumer.
+CONSUMER_THREADS = int(os.environ.get("ANALYTICS_CONSUMERS", "1"))
+
+# Alerts waiting for the publisher thread; beyond this they are dropped, not blocked on.
+PUBLISH_BUFFER = int(os.environ.get("ANALYTICS_PUBLISH_BUFFER", "10000"))
+
+publisher = QueuedPublisher(RABBIT_PARAMS, declare=(LOCATION_QUEUE, ALERT_QUEUE), maxsize=PUBLISH_BUFFER,
+                            on_commit=lambda n, waited: PUBLISH_SECONDS.observe(waited))
 
 def publish_event(queue, event_type, data):
-    publisher.publish(queue, event_type, data)
+    if not publisher.publish_event(queue, event_type, data):
+        log.warning("[!] Publish buffer full, dropped %s → %s", event_type, queue)
+        return
+    log.info("[x] Published %s → %s: %s", event_type, queue, data)
+
+# -------------------------
+# Alert coalescing: detectors raise alerts freely; each session publishes one
+# event per severity change (or per cooldown while alerts persist), within a
+# per-session and a global token bucket.
+# -------------------------
+ALERT_SEVERITY       = {"no_movement": 1, "off_route": 2, "hazard_zone": 2, "risk_score": 3}
+ALERT_HOLD_SEC       = float(os.environ.get("ANALYTICS_ALERT_HOLD_SEC", "20"))      # alert stays active this long after its last raise
+ALERT_COOLDOWN_SEC   = float(os.environ.get("ANALYTICS_ALERT_COOLDOWN_SEC", "30"))  # re-send an unchanged severity after this long
+ALERT_SESSION_RATE   = float(os.environ.get("ANALYTICS_ALERT_SESSION_RATE", "0.1")) # events/s per session…
+ALERT_SESSION_BURST  = 3                                                            # …with this many in hand
+ALERT_GLOBAL_RATE    = float(os.environ.get("ANALYTICS_ALERT_GLOBAL_RATE", "200"))  # events/s over all sessions…
+ALERT_GLOBAL_BURST   = 1000
+
+alert_coalescer = AlertCoalescer(ALERT_HOLD_SEC, ALERT_COOLDOWN_SEC, ALERT_SESSION_RATE, ALERT_SESSION_BURST,
+                                 ALERT_GLOBAL_RATE, ALERT_GLOBAL_BURST)
+
+def raise_alert(user_id, session, alert_type, data, severity=None, force=False):
+    """Hand an alert to the session's coalescer; publishes whatever event that produces.
+
+    severity overrides ALERT_SEVERITY for this one alert; force publishes it
+    even if the coalescer would fold it in or throttle it.
+    """
+    if session.alerts is None:
+        session.alerts = alert_coalescer.new_state()
+    ALERTS_RAISED.inc(alert_type)
+    if severity is None:
+        severity = ALERT_SEVERITY.get(alert_type, 1)
+    event = alert_coalescer.raise_alert(session.alerts, alert_type, severity, data, force)
+    if event is not None:
+        ALERTS_PUBLISHED.inc(event[0])
+        publish_event(ALERT_QUEUE, *event)
 
 # =========================
 # Utilities
@@ -86,14 +246,6 @@ def haversine(lat1, lon1, lat2, lon2):
     a = math.sin(dphi/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(dlambda/2)**2
     return R * (2 * math.atan2(math.sqrt(a), math.sqrt(1 - a)))
 
-def rate_limited(session: WalkSession, alert_type: str, min_interval_sec: int) -> bool:
-    """Return True if we should SKIP sending (too soon)."""
-    last = session.last_alert_time.get(alert_type)
-    if last and (datetime.utcnow() - last).total_seconds() < min_interval_sec:
-        return True
-    session.last_alert_time[alert_type] = datetime.utcnow()
-    return False
-
 # =========================
 # Real-time analytics (per-message)
 # =========================
@@ -149,27 +301,227 @@ def _point_segment_distance_xy(px, py, ax, ay, bx, by):
     return math.hypot(dx, dy), t, projx, projy
 
 
+def match_route(session: WalkSession, lat, lon):
+    """Match a fix to the session's route, tracking progress; return distance (m) from the route.
+
+    Walkers move along the route, so we first search a small window around the
+    last matched segment and only fall back to the full indexed search when the
+    window says we're off-route.
+    """
+    if session._route_cache is None:
+        session._route_cache = RouteIndex(session.route)
+    idx = session._route_cache
+
+    hit = None
+    if session._last_seg_idx is not None:
+        hit = idx.nearest_in_window(lat, lon, session._last_seg_idx, ROUTE_WINDOW_BACK, ROUTE_WINDOW_AHEAD)
+    if hit is None or hit[0] > OFF_ROUTE_THRESHOLD_M:
+        hit = idx.nearest(lat, lon)
+    if hit is None:
+        return None
+
+    dist, seg, t = hit
+    session._last_seg_idx, session._last_seg_t = seg, t
+    session.distance_along_m = idx.along(seg, t)
+    session.remaining_m = idx.total_m - session.distance_along_m
+    return dist
+
+
 def perform_safety_analysis(user_id: str, session: WalkSession):
-    """Simplified safety + off-route checks."""
-    if len(session.locations) < 2:
+    """Run the newest fix through the risk pipeline: jump filter, off-route, speed, dwell, reversal."""
+    timed = ANALYSIS_SECONDS.due()
+    t0 = time.perf_counter() if timed else 0.0
+    fix = _accept_fix(user_id, session, *session.locations[-1]) if len(session.locations) else None
+    if fix is not None:
+        # Simple off-route alert, on the smoothed position (decimated)
+        if session.route:
+            if session.smoother.due(DECIMATE_MIN_M, DECIMATE_MAX_SEC):
+                dist_from_route = session.smoother.route_dist = match_route(session, fix.lat, fix.lon)
+                if dist_from_route and dist_from_route > OFF_ROUTE_THRESHOLD_M:
+                    _publish_off_route(user_id, session, dist_from_route, session.distance_along_m, session.remaining_m, fix.ts)
+            fix.route_dist = session.smoother.route_dist
+        if hazard_layer is not None:
+            _check_hazards(user_id, session, fix)
+
+        _score_risk(user_id, session, fix)
+    if timed:
+        ANALYSIS_SECONDS.observe(time.perf_counter() - t0)
+
+
+def _accept_fix(user_id, session, lat, lon, ts):
+    """Risk pipeline gates on the raw fix, then smoothing; the Fix (at the smoothed position) or None."""
+    if session.risk is None:
+        session.risk, session.smoother = risk_pipeline.new_state(), new_smoother()
+    rejected = session.risk.rejected
+    fix = risk_pipeline.observe(session.risk, lat, lon, ts)
+    if fix is None:
+        if session.risk.rejected != rejected:
+            fix_log.info("[~] %s GPS jump ignored (%.6f, %.6f)", user_id, lat, lon)
+        return None
+    if trajectories is not None:
+        trajectories.append(user_id, session.walking_session_id, lat, lon, ts)
+    fix.lat, fix.lon = session.smoother.update(lat, lon, ts)
+    session.last_speed_mps = session.smoother.speed()
+    return fix
+
+
+def perform_batch_safety_analysis(groups):
+    """perform_safety_analysis over many sessions' new fixes at once, alerting in fix order.
+
+    groups: [(user_id, session, fixes), ...] where fixes are the (lat, lon, ts)
+    that arrived in this batch; distance and speed are measured from the last
+    fix the session's risk state accepted. Fixes are gated, smoothed and decimated one by one; route matching for
+    the fixes still due runs vectorized over the whole batch; the risk
+    pipeline then scores every accepted fix in order.
+    """
+    t0 = time.perf_counter()
+    try:
+        _analyze_batch(groups)
+    finally:
+        BATCH_ANALYSIS_SECONDS.observe(time.perf_counter() - t0)
+
+
+def _analyze_batch(groups):
+    tracks, lats, lons, routed = [], [], [], []
+    for user_id, session, fixes in groups:
+        with active_sessions.lock(user_id):
+            accepted, checked = [], []
+            for lat, lon, t in fixes:
+                fix = _accept_fix(user_id, session, lat, lon, t)
+                if fix is not None:
+                    accepted.append(fix)
+                    checked.append(bool(session.route) and session.smoother.due(DECIMATE_MIN_M, DECIMATE_MAX_SEC))
+        tracks.append((user_id, session, accepted, checked))
+        if not any(checked):
+            continue
+        if session._route_cache is None:
+            session._route_cache = RouteIndex(session.route)
+        if session._route_cache.n_segments:
+            start = len(lats)
+            for fix, c in zip(accepted, checked):
+                if c:
+                    lats.append(fix.lat); lons.append(fix.lon)
+            routed.append((user_id, session, start, len(lats)))
+
+    matched = {}
+    if routed:
+        matched = dict(zip((id(s) for _, s, _, _ in routed), _match_routed(routed, lats, lons)))
+
+    for user_id, session, accepted, checked in tracks:
+        hit = matched.get(id(session))
+        with active_sessions.lock(user_id):
+            if hit is not None:
+                dists, segs, ts = hit
+                idx = session._route_cache
+                session._last_seg_idx, session._last_seg_t = int(segs[-1]), float(ts[-1])
+                session.distance_along_m = idx.along(session._last_seg_idx, session._last_seg_t)
+                session.remaining_m = idx.total_m - session.distance_along_m
+
+            k = 0
+            for fix, c in zip(accepted, checked):
+                if c and hit is not None:
+                    d = session.smoother.route_dist = float(dists[k])
+                    if d > OFF_ROUTE_THRESHOLD_M:
+                        along = idx.along(int(segs[k]), float(ts[k]))
+                        _publish_off_route(user_id, session, d, along, idx.total_m - along, fix.ts)
+                    k += 1
+                if session.route:
+                    fix.route_dist = session.smoother.route_dist
+                if hazard_layer is not None:
+                    _check_hazards(user_id, session, fix)
+                _score_risk(user_id, session, fix)
+
+
+def _match_routed(routed, lats, lons):
+    """(dists, segs, ts) per routed session for its slice of lats/lons, in one vectorized pass."""
+    args = (
+        [s._route_cache for _, s, _, _ in routed],
+        [s._last_seg_idx for _, s, _, _ in routed],
+        [lats[a:b] for _, _, a, b in routed],
+        [lons[a:b] for _, _, a, b in routed],
+        OFF_ROUTE_THRESHOLD_M,
+    )
+    if geometry_pool is not None and len(lats) >= GEOMETRY_MIN_FIXES:
+        sids = [s.walking_session_id for _, s, _, _ in routed]
+        return geometry_pool.match(sids, *args, back=ROUTE_WINDOW_BACK, ahead=ROUTE_WINDOW_AHEAD)
+    return match_batch(*args, back=ROUTE_WINDOW_BACK, ahead=ROUTE_WINDOW_AHEAD)
+
+
+def _score_risk(user_id, session, fix):
+    score = risk_pipeline.score(session.risk, fix)
+    if score >= RISK_ALERT_SCORE:
+        factors = risk_pipeline.factors(session.risk)
+        raise_alert(user_id, session, "risk_score", {
+            "user_id": user_id,
+            "walking_session_id": session.walking_session_id,
+            "fix_ts": fix.ts,
+            "risk_score": round(score, 3),
+            "factors": factors,
+            "message": f"Risk score {score:.2f} (" + ", ".join(f"{k} {v}" for k, v in factors.items()) + ")"
+        })
+
+
+def _publish_off_route(user_id, session, dist_from_route, distance_along_m, remaining_m, fix_ts):
+    raise_alert(user_id, session, "off_route", {
+        "user_id": user_id,
+        "walking_session_id": session.walking_session_id,
+        "fix_ts": fix_ts,
+        "distance_along_m": distance_along_m,
+        "remaining_m": remaining_m,
+        "message": f"Off-route by ~{int(dist_from_route)} m (>{OFF_ROUTE_THRESHOLD_M} m threshold)"
+    })
+
+
+# =========================
+# Hazard zones: known unsafe areas (GeoJSON polygons), checked on every accepted fix
+# =========================
+HAZARD_ZONES_PATH = os.environ.get("ANALYTICS_HAZARD_ZONES", "")                 # "" = no hazard checks
+HAZARD_RELOAD_SEC = float(os.environ.get("ANALYTICS_HAZARD_RELOAD_SEC", "30"))   # look for a changed file this often
+HAZARD_CELL_DEG   = 0.002        # index grid cell, ~220 m north-south
+HAZARD_MAX_SEVERITY = ALERT_SEVERITY["risk_score"]   # a zone's severity property, clamped to 1..this
+
+hazard_layer = HazardLayer(HAZARD_ZONES_PATH, HAZARD_CELL_DEG) if HAZARD_ZONES_PATH else None
+
+def _check_hazards(user_id, session, fix):
+    """Alert when the (smoothed) fix is in a hazard zone the previous fix wasn't in.
+
+    Raised once per entry, so the alert bypasses coalescing and throttling:
+    folded into an earlier event it would expire while the walker is still inside.
+    """
+    zones = hazard_layer.index.zones_at(fix.lat, fix.lon)
+    if not zones:
+        session.hazards = None
         return
+    previous = session.hazards or ()
+    entered = [z for z in zones if z.id not in previous]
+    session.hazards = frozenset(z.id for z in zones)
+    if entered:
+        worst = max(entered, key=lambda z: z.severity)
+        raise_alert(user_id, session, "hazard_zone", {
+            "user_id": user_id,
+            "walking_session_id": session.walking_session_id,
+            "fix_ts": fix.ts,
+            "zones": [z.as_dict() for z in entered],
+            "message": f"Entered hazard zone {worst.name or worst.id}" + (f" ({worst.category})" if worst.category else "")
+        }, severity=min(max(worst.severity, 1), HAZARD_MAX_SEVERITY), force=True)
 
-    last = session.locations[-1]
-    prev = session.locations[-2]
+def load_hazards(freeze=False):
+    """(Re)load the hazard layer if its file changed; keeps the previous layer if the new one fails.
 
-    # Compute basic speed
-    dist = haversine(prev["lat"], prev["lon"], last["lat"], last["lon"])
-    dt = max(1e-6, (datetime.fromisoformat(last["timestamp"]) - datetime.fromisoformat(prev["timestamp"])).total_seconds())
+    freeze=True (startup only) keeps the index out of the GC's full collections.
+    """
+    try:
+        if hazard_layer.reload(freeze=freeze):
+            log.info("[⚠] hazard layer v%d: %d zones from %s in %.0f ms", hazard_layer.version,
+                     len(hazard_layer.index), HAZARD_ZONES_PATH, hazard_layer.load_seconds * 1e3)
+    except Exception as e:
+        log.error("[!] Hazard layer load error (%s): %s", HAZARD_ZONES_PATH, e)
 
-    # Simple off-route alert
-    if session.route:
-        dist_from_route = nearest_point_distance(last["lat"], last["lon"], session.route)
-        if dist_from_route and dist_from_route > OFF_ROUTE_THRESHOLD_M and not rate_limited(session, "off_route", 5):
-            publish_event(ALERT_QUEUE, "off_route", {
-                "user_id": user_id,
-                "walking_session_id": session.walking_session_id,
-                "message": f"Off-route by ~{int(dist_from_route)} m (>{OFF_ROUTE_THRESHOLD_M} m threshold)"
-            })
+def hazard_reload_loop():
+    """Rebuild the index off the consumer threads; they switch to it once it is complete."""
+    while True:
+        time.sleep(HAZARD_RELOAD_SEC)
+        load_hazards()
 
 
 # =========================
@@ -177,24 +529,63 @@ def perform_safety_analysis(user_id: str, session: WalkSession):
 # =========================
 # --- Inactivity config (env overrideable) ---
 INACTIVITY_THRESHOLD_SEC = 15   # alert after 15s idle
-WATCHDOG_INTERVAL_SEC   = 5 # check every 5s
-NO_MOVE_ALERT_COOLDOWN  = 30 # avoid spam
+NO_MOVE_ALERT_COOLDOWN  = 30 # re-raise no_movement this often while idle
+SESSION_EVICT_GRACE_SEC = 300   # drop sessions this long after walk.stopped
+
+# user_id -> next deadline: "idle" while walking, "evict" once stopped;
+# plus one recurring "sweep" that applies the session store TTL
+session_deadlines = DeadlineScheduler()
+_TTL_SWEEP = "__ttl_sweep__"
+
+def _release_geometry(session):
+    if geometry_pool is not None and session.walking_session_id:
+        geometry_pool.unload(session.walking_session_id)
+
+def _arm_inactivity(user_id):
+    session_deadlines.schedule_in(user_id, INACTIVITY_THRESHOLD_SEC, "idle")
+
+def _on_session_deadline(user_id, kind):
+    session = active_sessions.get(user_id)
+    if session is None:
+        return
+
+    if kind == "evict":
+        if not session.is_active:
+            active_sessions.pop(user_id, None)
+            _release_geometry(session)
+            log.info("[🧹] evicted stopped session user=%s", user_id)
+        return
+
+    if not session.is_active:
+        session_deadlines.schedule_in(user_id, SESSION_EVICT_GRACE_SEC, "evict")
+        return
+
+    idle = (datetime.utcnow() - session.last_update).total_seconds()
+    if idle < INACTIVITY_THRESHOLD_SEC:
+        return                      # a fix raced in; it has re-armed the deadline
+    raise_alert(user_id, session, "no_movement", {
+        "user_id": user_id,
+        "walking_session_id": session.walking_session_id,
+        "message": f"No movement detected for {INACTIVITY_THRESHOLD_SEC}+ seconds."
+    })
+    # keep reminding while the walker stays idle
+    if session_deadlines.deadline(user_id) is None:
+        session_deadlines.schedule_in(user_id, NO_MOVE_ALERT_COOLDOWN, "idle")
 
 def watchdog_inactivity_check():
-    """Every WATCHDOG_INTERVAL_SEC: if a user hasn't updated for > INACTIVITY_THRESHOLD_SEC, alert."""
+    """Sleep until the next session deadline: alert on "idle", drop stopped sessions on "evict"."""
+    session_deadlines.schedule_in(_TTL_SWEEP, SESSION_TTL_SEC / 4, "sweep")
     while True:
-        now = datetime.utcnow()
-        for user_id, session in list(active_sessions.items()):
-            if not session.is_active or not session.last_update:
+        for user_id, kind, _ in session_deadlines.wait_due():
+            if kind == "sweep":
+                for expired, session in active_sessions.evict_expired():
+                    session_deadlines.cancel(expired)
+                    _release_geometry(session)
+                    log.info("[🧹] expired idle session user=%s", expired)
+                session_deadlines.schedule_in(_TTL_SWEEP, SESSION_TTL_SEC / 4, "sweep")
                 continue
-
-            idle = (now - session.last_update).total_seconds()
-            if idle > INACTIVITY_THRESHOLD_SEC and not rate_limited(session, "no_movement", NO_MOVE_ALERT_COOLDOWN):
-                publish_event(ALERT_QUEUE, "no_movement", {
-                    "user_id": user_id,
-                    "message": f"No movement detected for {INACTIVITY_THRESHOLD_SEC}+ seconds."
-                })
-        time.sleep(WATCHDOG_INTERVAL_SEC)
+            with active_sessions.lock(user_id):
+                _on_session_deadline(user_id, kind)
 
 # =========================
 # RabbitMQ consumer (separate thread & connection)
@@ -207,68 +598,125 @@ def on_location_update(ch, method, properties, body):
         user_id = str(data["user_id"])
         lat, lon = float(data["lat"]), float(data["lon"])
     except Exception as e:
-        print(f"[!] Bad message, skipping: {e} | body={body!r}")
+        log.warning("[!] Bad message, skipping: %s | body=%r", e, body)
         return
+    observe_event(event.get("type"), event)
 
-    # Ensure session exists
-    session = active_sessions.get(user_id)
-    if not session:
-        session = WalkSession(user_id)
-        active_sessions[user_id] = session
+    with active_sessions.lock(user_id):
+        # Ensure session exists
+        session = active_sessions.get_or_create(user_id, WalkSession)
 
-    # Update session state
-    loc = {"lat": lat, "lon": lon, "timestamp": datetime.utcnow().isoformat()}
-    session.locations.append(loc)
-    session.last_update = datetime.utcnow()
+        # Update session state
+        session.locations.append(lat, lon, time.time())
+        session.last_update = datetime.utcnow()
+        _arm_inactivity(user_id)
 
-    print(f"[📍] {user_id} → ({lat:.6f}, {lon:.6f})")
-    perform_safety_analysis(user_id, session)
+        fix_log.info("[📍] %s → (%.6f, %.6f)", user_id, lat, lon)
+        perform_safety_analysis(user_id, session)
 
 def _handle_walk_started(data):
     user_id = str(data["user_id"])
     sid = data.get("walking_session_id")
-    route = data.get("route") or []  # [{lat, lon}, ...]
+    artifact = data.get("route_artifact")  # precomputed by /start_walk
+    route = data.get("route") or []  # [{lat, lon}, ...], from publishers without artifacts
 
-    session = active_sessions.get(user_id)
-    if not session:
-        session = WalkSession(user_id)
-        active_sessions[user_id] = session
+    session = active_sessions.get_or_create(user_id, WalkSession)
+    if session.walking_session_id != sid:
+        _release_geometry(session)
+        if trajectories is not None:
+            trajectories.end_session(user_id, session.walking_session_id)
 
     session.walking_session_id = sid
-    session.route = route
+    if artifact:
+        try:
+            session.route, session._route_cache = load_route_artifact(artifact)
+        except (ValueError, KeyError, TypeError) as e:
+            log.warning("[!] Bad route artifact sid=%s: %s", sid, e)
+            session.route, session._route_cache = [], None
+    else:
+        session.route = PackedRoute.from_points(route)   # packed, so snapshots copy it as bytes
+        session._route_cache = RouteIndex(route) if route else None   # project once per walk
     session.is_active = True
-    session._route_cache = None       # force rebuild
+    session_deadlines.cancel(user_id)           # a pending eviction no longer applies
+    session.risk = risk_pipeline.new_state()
+    session.smoother = new_smoother()
+    session.alerts = None
+    if geometry_pool is not None and sid and session._route_cache:
+        geometry_pool.load(sid, session._route_cache)
     session._last_seg_idx = None
-    print(f"[🏁] walk.started user={user_id} sid={sid} route_pts={len(route)}")
+    session._last_seg_t = 0.0
+    session.distance_along_m = None
+    session.remaining_m = None
+    if session._route_cache is not None:
+        ROUTE_LENGTH_M.observe(session._route_cache.total_m)
+        ROUTE_POINTS.observe(len(session.route))
+    log.info("[🏁] walk.started user=%s sid=%s route_pts=%d", user_id, sid, len(session.route))
 
 def _handle_walk_stopped(data):
     user_id = str(data["user_id"])
     session = active_sessions.get(user_id)
     if session:
         session.is_active = False
-        print(f"[🛑] walk.stopped user={user_id} sid={getattr(session,'walking_session_id',None)}")
+        session_deadlines.schedule_in(user_id, SESSION_EVICT_GRACE_SEC, "evict")
+        if trajectories is not None:
+            trajectories.end_session(user_id, session.walking_session_id)
+        log.info("[🛑] walk.stopped user=%s sid=%s", user_id, getattr(session, "walking_session_id", None))
+
+def _event_fixes(data, now):
+    """(lat, lon, ts) fixes in a location.update: a packed "fixes" upload, or one lat/lon stamped with the client "ts" if sent."""
+    packed = data.get("fixes")
+    if packed:
+        return decode_fixes(base64.b64decode(packed))
+    return [(float(data["lat"]), float(data["lon"]), float(data.get("ts") or now))]
 
 def _handle_location_update(data):
     user_id = str(data["user_id"])
-    lat, lon = float(data["lat"]), float(data["lon"])
+    fixes = _event_fixes(data, time.time())
 
-    session = active_sessions.get(user_id)
-    if not session:
-        # create a shell session; route may arrive later
-        session = WalkSession(user_id)
-        active_sessions[user_id] = session
+    session = active_sessions.get_or_create(user_id, WalkSession)
 
     # remember sid if client sends it here first
     sid = data.get("walking_session_id")
     if sid and not getattr(session, "walking_session_id", None):
         session.walking_session_id = sid
 
-    loc = {"lat": lat, "lon": lon, "timestamp": datetime.utcnow().isoformat()}
-    session.locations.append(loc)
     session.last_update = datetime.utcnow()
+    _arm_inactivity(user_id)
+
+    lat, lon, _ = fixes[-1]
+    fix_log.info("[📍] %s → (%.6f, %.6f) +%d fixes sid=%s", user_id, lat, lon, len(fixes), session.walking_session_id)
+    if len(fixes) < VECTORIZE_MIN_FIXES:
+        for lat, lon, ts in fixes:
+            session.locations.append(lat, lon, ts)
+            perform_safety_analysis(user_id, session)
+    else:
+        for lat, lon, ts in fixes:
+            session.locations.append(lat, lon, ts)
+        perform_batch_safety_analysis([(user_id, session, fixes)])
 
-    print(f"[📍] {user_id} → ({lat:.6f}, {lon:.6f}) sid={session.walking_session_id}")
-    perform_safety_analysis(user_id, session)
+def _handle_location_batch(pending):
+    """Batch counterpart of _handle_location_update; pending maps user_id -> [(lat, lon, ts, data), ...]."""
+    groups = []
+    now = datetime.utcnow()
+    for user_id, updates in pending.items():
+        with active_sessions.lock(user_id):
+            session = active_sessions.get_or_create(user_id, WalkSession)
+
+            if not getattr(session, "walking_session_id", None):
+                session.walking_session_id = next((d.get("walking_session_id") for *_, d in updates if d.get("walking_session_id")), None)
+
+            fixes = []
+            for lat, lon, ts, _ in updates:
+                session.locations.append(lat, lon, ts)
+                fixes.append((lat, lon, ts))
+            session.last_update = now
+            _arm_inactivity(user_id)
+        groups.append((user_id, session, fixes))
+
+        lat, lon, _, _ = updates[-1]
+        fix_log.info("[📍] %s → (%.6f, %.6f) +%d fixes sid=%s", user_id, lat, lon, len(updates), session.walking_session_id)
+
+    perform_batch_safety_analysis(groups)
 
 def on_queue_message(ch, method, properties, body):
     """Dispatch based on event['type']."""
@@ -277,42 +725,378 @@ def on_queue_message(ch, method, properties, body):
         etype = event.get("type")
         data = event.get("data", {}) or {}
     except Exception as e:
-        print(f"[!] Bad JSON: {e} | body={body!r}")
+        log.warning("[!] Bad JSON: %s | body=%r", e, body)
         return
+    observe_event(etype, event)
+    handle_event(etype, data)
 
+def handle_event(etype, data):
     try:
-        if etype == "walk.started":
-            _handle_walk_started(data)
-        elif etype == "walk.stopped":
-            _handle_walk_stopped(data)
-        elif etype == "location.update":
-            _handle_location_update(data)
-        else:
-            print(f"[~] Ignoring unknown event type: {etype}")
+        # one user's events are handled under that user's shard lock
+        with active_sessions.lock(str(data.get("user_id"))):
+            if etype == "walk.started":
+                _handle_walk_started(data)
+            elif etype == "walk.stopped":
+                _handle_walk_stopped(data)
+            elif etype == "location.update":
+                _handle_location_update(data)
+            else:
+                log.info("[~] Ignoring unknown event type: %s", etype)
     except Exception as e:
-        print(f"[!] Handler error for {etype}: {e}")
+        log.error("[!] Handler error for %s: %s", etype, e)
+
+def on_queue_batch(bodies):
+    """Dispatch a drained batch of messages, scoring each user's location updates together.
+
+    Updates are grouped per user; pending updates are flushed before any
+    walk.started / walk.stopped for a user with fixes pending, so per-user
+    ordering is kept.
+    """
+    pending = {}  # user_id -> [(lat, lon, ts, data), ...]
+    now = time.time()
+
+    def flush():
+        try:
+            _handle_location_batch(pending)
+        except Exception as e:
+            log.error("[!] Handler error for location.update batch: %s", e)
+        pending.clear()
+
+    for body in bodies:
+        try:
+            event = json.loads(body)
+            etype = event.get("type")
+            data = event.get("data", {}) or {}
+        except Exception as e:
+            log.warning("[!] Bad JSON: %s | body=%r", e, body)
+            continue
+        observe_event(etype, event)
+
+        if etype == "location.update":
+            try:
+                fixes = _event_fixes(data, now)
+                pending.setdefault(str(data["user_id"]), []).extend((lat, lon, ts, data) for lat, lon, ts in fixes)
+            except Exception as e:
+                log.error("[!] Handler error for %s: %s", etype, e)
+            continue
+
+        if str(data.get("user_id")) in pending:
+            flush()
+        try:
+            with active_sessions.lock(str(data.get("user_id"))):
+                if etype == "walk.started":
+                    _handle_walk_started(data)
+                elif etype == "walk.stopped":
+                    _handle_walk_stopped(data)
+                else:
+                    log.info("[~] Ignoring unknown event type: %s", etype)
+        except Exception as e:
+            log.error("[!] Handler error for %s: %s", etype, e)
+
+    if pending:
+        flush()
+
+def _acker(conn, ch, tag):
+    """ack() for every delivery on ch up to tag; callable from any thread."""
+    def ack():
+        try:
+            conn.add_callback_threadsafe(lambda: ch.basic_ack(delivery_tag=tag, multiple=True))
+        except Exception as e:
+            log.warning("[!] Ack failed, broker will redeliver: %s", e)
+    return ack
 
-def consumer_loop():
+def consumer_loop(queue=LOCATION_QUEUE):
+    """Consume one message at a time with manual acks (deferred to the next snapshot if enabled)."""
     while True:
+        ch = None
         try:
             conn = pika.BlockingConnection(RABBIT_PARAMS)
             ch = conn.channel()
-            ch.queue_declare(queue=LOCATION_QUEUE)
+            ch.queue_declare(queue=queue)
             ch.queue_declare(queue=ALERT_QUEUE)
-            ch.basic_consume(queue=LOCATION_QUEUE, on_message_callback=on_queue_message, auto_ack=True)
-            print("[*] Consumer: listening to 'location_updates'…")
+
+            def on_message(ch, method, properties, body):
+                snapshot_gate.run(ch, lambda: on_queue_message(ch, method, properties, body),
+                                  _acker(conn, ch, method.delivery_tag))
+
+            ch.basic_consume(queue=queue, on_message_callback=on_message, auto_ack=False)
+            log.info("[*] Consumer: listening to '%s'…", queue)
             ch.start_consuming()
         except Exception as e:
-            print(f"[!] Consumer error: {e}. Reconnecting in 3s…")
+            snapshot_gate.forget(ch)
+            log.warning("[!] Consumer error: %s. Reconnecting in 3s…", e)
             time.sleep(3)
 
+def batch_consumer_loop(queue=LOCATION_QUEUE, batch_max=BATCH_MAX_MESSAGES):
+    """Like consumer_loop, but drains up to batch_max messages at a time and acks them together."""
+    while True:
+        ch = None
+        try:
+            conn = pika.BlockingConnection(RABBIT_PARAMS)
+            ch = conn.channel()
+            ch.queue_declare(queue=queue)
+            ch.queue_declare(queue=ALERT_QUEUE)
+            # deferred acks pile up until the next snapshot, so a prefetch cap would stall
+            ch.basic_qos(prefetch_count=0 if snapshot_gate.deferred else batch_max)
+            log.info("[*] Consumer: draining '%s' in batches of up to %d…", queue, batch_max)
+            while True:
+                bodies, last_tag = [], None
+                for method, properties, body in ch.consume(queue, inactivity_timeout=BATCH_LINGER_SEC):
+                    if method is None:
+                        break
+                    bodies.append(body)
+                    last_tag = method.delivery_tag
+                    if len(bodies) >= batch_max:
+                        break
+                if bodies:
+                    snapshot_gate.run(ch, lambda: on_queue_batch(bodies), _acker(conn, ch, last_tag))
+        except Exception as e:
+            snapshot_gate.forget(ch)
+            log.warning("[!] Consumer error: %s. Reconnecting in 3s…", e)
+            time.sleep(3)
+
+
+# =========================
+# Snapshots: active_sessions dumped to a local file for fast restart
+# =========================
+SNAPSHOT_PATH  = os.environ.get("ANALYTICS_SNAPSHOT_PATH", "")       # "" = no snapshots, ack right away
+SNAPSHOT_SEC   = float(os.environ.get("ANALYTICS_SNAPSHOT_SEC", "30"))
+SNAPSHOT_FIXES = int(os.environ.get("ANALYTICS_SNAPSHOT_FIXES", "32"))   # newest fixes kept per session
+
+# Messages are acked only once a snapshot that includes their effects is on disk
+snapshot_gate = SnapshotGate(deferred=bool(SNAPSHOT_PATH))
+
+def take_snapshot(path=SNAPSHOT_PATH):
+    """Capture every session with handlers paused, write it, then send the acks it covers."""
+    t0 = time.perf_counter()
+    with snapshot_gate.paused() as acks:
+        now, touch_now, alert_now = session_deadlines.clock(), active_sessions.clock(), alert_coalescer.clock()
+        records = []
+        for user_id, session in active_sessions.snapshot():
+            with active_sessions.lock(user_id):
+                touched = active_sessions.last_touch(user_id)
+                deadline = session_deadlines.peek(user_id)
+                records.append(dump_session(
+                    session, touch_now - touched if touched is not None else 0.0,
+                    (deadline[0] - now, deadline[1]) if deadline else None, SNAPSHOT_FIXES, alert_now))
+        written_at = time.time()
+    paused_ms = (time.perf_counter() - t0) * 1e3
+    try:
+        write_snapshot(path, records, written_at)
+    except OSError as e:
+        snapshot_gate.retry(acks)
+        log.error("[!] Snapshot failed: %s", e)
+        return
+    for ack in acks.values():
+        ack()
+    log.info("[💾] snapshot: %d sessions, paused %.0f ms, total %.0f ms", len(records), paused_ms, (time.perf_counter() - t0) * 1e3)
+
+def restore_snapshot(path=SNAPSHOT_PATH):
+    """Load sessions, their touch times and deadlines from the last snapshot; returns how many."""
+    try:
+        snap = read_snapshot(path)
+    except ValueError as e:
+        log.warning("[!] Ignoring unreadable snapshot %s: %s", path, e)
+        return 0
+    if snap is None:
+        return 0
+    written_at, records = snap
+    elapsed = max(0.0, time.time() - written_at)
+    alert_now = alert_coalescer.clock() - elapsed     # alert ages count the downtime too
+    sessions, deadlines = [], []
+    gc.disable()                    # nothing to collect here; repeated GC passes would dominate
+    try:
+        for buf in records:
+            # load_session overwrites what the snapshot holds; going through __init__
+            # gives every other slot (detector state, hazards…) its default
+            session, age, deadline = load_session(buf, WalkSession, alert_coalescer.new_state, alert_now)
+            sessions.append((session.user_id, session, age + elapsed))
+            if deadline:
+                deadlines.append((session.user_id, deadline[0] - elapsed, deadline[1]))
+        active_sessions.put_many(sessions)
+        session_deadlines.schedule_many_in(deadlines)
+    finally:
+        gc.enable()
+    return len(sessions)
+
+def snapshot_loop():
+    while True:
+        time.sleep(SNAPSHOT_SEC)
+        try:
+            take_snapshot()
+        except Exception as e:
+            log.error("[!] Snapshot error: %s", e)
+
+
+# =========================
+# Walk history: accepted raw fixes, written in batches to day-partitioned SQLite files
+# =========================
+TRAJECTORY_DIR       = os.environ.get("ANALYTICS_TRAJECTORY_DIR", "")    # "" = don't record walks
+TRAJECTORY_FLUSH_SEC = float(os.environ.get("ANALYTICS_TRAJECTORY_FLUSH_SEC", "60"))  # max buffering per walk
+TRAJECTORY_CHUNK     = 600       # fixes per stored chunk (10 min at 1 Hz)
+
+trajectories = TrajectoryStore(TRAJECTORY_DIR, TRAJECTORY_CHUNK) if TRAJECTORY_DIR else None
+
+def trajectory_loop():
+    """Write walks' buffered fixes: ended walks within a second, ongoing ones every TRAJECTORY_FLUSH_SEC."""
+    while True:
+        time.sleep(1)
+        try:
+            trajectories.flush(TRAJECTORY_FLUSH_SEC)
+        except Exception as e:
+            log.error("[!] Trajectory write error: %s", e)
+
+
+# =========================
+# asyncio mode (aio-pika): python analytics.py --asyncio
+# =========================
+ASYNC_PREFETCH = int(os.environ.get("ANALYTICS_PREFETCH", "16"))   # unacked messages in flight
+
+class AsyncAlertPublisher:
+    """publish_event() for asyncio mode: each alert is published as a task on the loop.
+
+    While a lane processes a message, its alert tasks are collected so the
+    message is only acked once they are confirmed. Calls from other threads
+    (the watchdog) are handed over to the loop. Keeps QueuedPublisher's
+    counters for /metrics: there are no retries here, and a publish that
+    fails counts as rejected.
+    """
+
+    def __init__(self, publish, loop):
+        self.publish = publish              # async publish(routing_key, body)
+        self.loop = loop
+        self.collect = None
+        self._loop_thread = threading.get_ident()
+        self._background = set()
+        self.published = self.retries = self.rejected = 0
+        self._in_flight = 0                 # only touched on the loop
+
+    def pending(self):
+        return self._in_flight
+
+    async def _confirmed(self, queue, body):
+        self._in_flight += 1
+        t0 = time.monotonic()
+        try:
+            await self.publish(queue, body)
+        except Exception:
+            self.rejected += 1
+            raise
+        finally:
+            self._in_flight -= 1
+        self.published += 1
+        PUBLISH_SECONDS.observe(time.monotonic() - t0)
+
+    def publish_event(self, queue, event_type, data):
+        coro = self._confirmed(queue, json.dumps(make_event(event_type, data)).encode())
+        if threading.get_ident() != self._loop_thread:
+            asyncio.run_coroutine_threadsafe(coro, self.loop)
+            return True
+        task = self.loop.create_task(coro)
+        if self.collect is not None:
+            self.collect.append(task)
+        else:
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+        return True
+
+class AsyncConsumer:
+    """Routes deliveries into per-user lanes; acks each message after its handler ran and its alerts were confirmed."""
+
+    def __init__(self, publisher):
+        self.publisher = publisher
+        self.lanes = UserLanes(self._process)
+
+    async def on_message(self, message):
+        try:
+            event = json.loads(message.body)
+            etype = event.get("type")
+            data = event.get("data", {}) or {}
+        except Exception as e:
+            log.warning("[!] Bad JSON: %s | body=%r", e, message.body)
+            await message.ack()
+            return
+        observe_event(etype, event)
+        self.lanes.submit(str(data.get("user_id")), (message, etype, data))
+
+    async def _process(self, item):
+        message, etype, data = item
+        alerts = self.publisher.collect = []
+        try:
+            handle_event(etype, data)
+        finally:
+            self.publisher.collect = None
+        if alerts:
+            for result in await asyncio.gather(*alerts, return_exceptions=True):
+                if isinstance(result, Exception):
+                    log.warning("[!] Alert publish failed: %s", result)
+        await message.ack()
+
+async def async_main(queues, prefetch=ASYNC_PREFETCH):
+    import aio_pika                         # only needed in asyncio mode
+    global publisher
+
+    connection = await aio_pika.connect_robust(host="localhost")
+    publish_channel = await connection.channel(publisher_confirms=True)
+    await publish_channel.declare_queue(ALERT_QUEUE)
+
+    async def publish(routing_key, body):
+        await publish_channel.default_exchange.publish(aio_pika.Message(body=body), routing_key=routing_key)
+
+    publisher = AsyncAlertPublisher(publish, asyncio.get_running_loop())
+    consumer = AsyncConsumer(publisher)
+
+    channel = await connection.channel()
+    await channel.set_qos(prefetch_count=prefetch)
+    for name in queues:
+        queue = await channel.declare_queue(name)
+        await queue.consume(consumer.on_message)
+        log.info("[*] Async consumer: listening to '%s' (prefetch %d)…", name, prefetch)
+    await asyncio.Future()
 
-# Start background threads
-threading.Thread(target=consumer_loop, daemon=True).start()
-threading.Thread(target=watchdog_inactivity_check, daemon=True).start()
 
 # =========================
 # Run
 # =========================
 if __name__ == "__main__":
-    app.run(debug=True, port=5002, use_reloader=False)  # <— add use_reloader=False
+    parser = argparse.ArgumentParser(description="SafeWalkie analytics worker")
+    parser.add_argument("--partitions", default=None,
+                        help=f"comma-separated location_updates partitions to consume (default: all {LOCATION_PARTITIONS})")
+    parser.add_argument("--port", type=int, default=5002)
+    parser.add_argument("--asyncio", action="store_true",
+                        help="consume with aio-pika: per-user lanes, manual acks, async alert publishing")
+    args = parser.parse_args()
+    partitions = [int(p) for p in args.partitions.split(",")] if args.partitions else range(LOCATION_PARTITIONS)
+
+    # Fork the geometry workers first: setup_logging starts the log listener thread
+    if GEOMETRY_WORKERS > 0:
+        geometry_pool = GeometryPool(GEOMETRY_WORKERS)
+        geometry_pool.warm_up()
+
+    setup_logging(os.environ.get("LOG_LEVEL", "INFO"), json_lines=os.environ.get("LOG_FORMAT") == "json")
+
+    if SNAPSHOT_PATH:
+        t0 = time.perf_counter()
+        restored = restore_snapshot()
+        log.info("[💾] restored %d sessions from %s in %.0f ms", restored, SNAPSHOT_PATH, (time.perf_counter() - t0) * 1e3)
+
+    if hazard_layer is not None:
+        load_hazards(freeze=True)
+
+    # Start background threads
+    if args.asyncio:
+        queues = [partition_queue(LOCATION_QUEUE, p) for p in partitions]
+        threading.Thread(target=asyncio.run, args=(async_main(queues),), daemon=True).start()
+    else:
+        loop = batch_consumer_loop if BATCH_MAX_MESSAGES > 0 else consumer_loop
+        for p in partitions:
+            for _ in range(CONSUMER_THREADS):
+                threading.Thread(target=loop, args=(partition_queue(LOCATION_QUEUE, p),), daemon=True).start()
+    threading.Thread(target=watchdog_inactivity_check, daemon=True).start()
+    if SNAPSHOT_PATH:
+        threading.Thread(target=snapshot_loop, daemon=True).start()
+    if trajectories is not None:
+        threading.Thread(target=trajectory_loop, daemon=True).start()
+    if hazard_layer is not None:
+        threading.Thread(target=hazard_reload_loop, daemon=True).start()
+    app.run(debug=True, port=args.port, use_reloader=False)  # <— add use_reloader=False
@@ -0,0 +1,167 @@
+"""Alert messages published for the test-events.py scenarios at WALKERS walkers: per-type cooldowns vs coalescing.
+
+    python -m benchmarks.alert_coalescing
+
+Walkers cycle through test-events.py's TC-1..TC-3 plus "lost": walks TC-1,
+drifts ~150 m off the route, lingers there LINGER_SEC, then goes silent
+for SILENT_SEC. Each walk.started carries the scenario's route, fixes
+arrive at the scenario's pace (walkers start at random offsets within the
+first second), and while a walker sends nothing the watchdog's no_movement
+raises are replayed on its schedule. Everything runs on a simulated clock.
+
+"raised" counts alerts the detectors raised. "cooldowns" is the old
+behaviour, with each type rate limited on its own (off_route 5 s,
+risk_score and no_movement 30 s). "coalesced" is AlertCoalescer with the
+analytics defaults. Messages are what reaches alert_events. Each one is
+also a latest_risk overwrite in location-api.
+"""
+import heapq, math, os, random, runpy, time
+
+import analytics
+from benchmarks.common import M_PER_DEG_LAT, quiet_logging
+from services.alert_coalescer import AlertCoalescer
+
+WALKERS = 1000
+LINGER_SEC = 300
+SILENT_SEC = 180
+T0 = 1_760_000_000.0
+TEST_CASES = runpy.run_path(os.path.join(os.path.dirname(__file__), "..", "test-events.py"))["TEST_CASES"]
+LEGACY_COOLDOWNS = {"off_route": 5, "risk_score": 30, "no_movement": 30}
+
+
+class SimClock:
+    def __init__(self):
+        self.now = T0
+
+    def __call__(self):
+        return self.now
+
+
+class CooldownLimiter:
+    """The old rate_limited(): each alert type on its own min interval."""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.raised = self.sent = 0
+
+    def new_state(self):
+        return {}
+
+    def raise_alert(self, state, alert_type, severity, data):
+        now = self.clock()
+        self.raised += 1
+        last = state.get(alert_type)
+        if last is not None and now - last < LEGACY_COOLDOWNS[alert_type]:
+            return None
+        state[alert_type] = now
+        self.sent += 1
+        return alert_type, data
+
+
+class CountingPublisher:
+    def __init__(self):
+        self.sent = {}
+
+    def publish_event(self, queue, event_type, data):
+        self.sent[data["walking_session_id"]] = self.sent.get(data["walking_session_id"], 0) + 1
+        return True
+
+
+def scenario(name, tc):
+    """(route as [{"lat", "lon"}], [(offset s, lat, lon)], end offset)."""
+    route = [{"lat": lat, "lon": lon} for lon, lat in tc["route"]]
+    fixes, t = [], 0.0
+    for i, (lon, lat) in enumerate(tc["route"]):
+        fixes.append((t, lat, lon))
+        t += tc.get("pause_seconds", 0) if i == tc.get("pause_after_index") else tc.get("delay_between_points_sec", 1.0)
+    if name == "lost":
+        lat, lon = route[-1]["lat"], route[-1]["lon"]
+        m_per_deg_lon = M_PER_DEG_LAT * math.cos(math.radians(lat))
+        for k in range(120):                            # drift ~150 m away over 2 minutes
+            fixes.append((t, lat - 1.25 * k / M_PER_DEG_LAT, lon + 0.4 * k / m_per_deg_lon))
+            t += 1.0
+        lat, lon = fixes[-1][1:]
+        rng = random.Random(0)
+        for _ in range(LINGER_SEC):
+            fixes.append((t, lat + rng.gauss(0, 4) / M_PER_DEG_LAT, lon + rng.gauss(0, 4) / m_per_deg_lon))
+            t += 1.0
+        t += SILENT_SEC
+    return route, fixes, t
+
+
+def timeline():
+    """Heap-ordered (t, seq, walker, kind, payload) for every walker."""
+    kinds = [(tc["name"].split()[0], tc) for tc in TEST_CASES] + [("lost", TEST_CASES[0])]
+    shapes = {name: scenario(name, tc) for name, tc in kinds}
+    rng = random.Random(1)
+    events, seq, walkers = [], 0, []
+    for u in range(WALKERS):
+        name = kinds[u % len(kinds)][0]
+        route, fixes, end = shapes[name]
+        start = T0 + rng.random()
+        walkers.append((f"user-{u}", f"sid-{u}", name, route))
+        times = [start + off for off, _, _ in fixes] + [start + end]
+        for (off, lat, lon), nxt in zip(fixes, times[1:]):
+            events.append((start + off, seq, u, "fix", (lat, lon))); seq += 1
+            idle = start + off + analytics.INACTIVITY_THRESHOLD_SEC
+            while idle < nxt:                           # watchdog: first at 15 s idle, then every 30 s
+                events.append((idle, seq, u, "idle", None)); seq += 1
+                idle += analytics.NO_MOVE_ALERT_COOLDOWN
+    heapq.heapify(events)
+    return walkers, events
+
+
+def run(policy, clock, walkers, events):
+    analytics.alert_coalescer = policy
+    analytics.publisher = CountingPublisher()
+    analytics.active_sessions.clear()
+    for uid, sid, _, route in walkers:
+        analytics._handle_walk_started({"user_id": uid, "walking_session_id": sid, "route": route})
+    sessions = [analytics.active_sessions.get(uid) for uid, *_ in walkers]
+    events = list(events)
+    elapsed = 0.0
+    while events:
+        t, _, u, kind, payload = heapq.heappop(events)
+        clock.now = t
+        uid, session = walkers[u][0], sessions[u]
+        t0 = time.perf_counter()
+        if kind == "fix":
+            session.locations.append(payload[0], payload[1], t)
+            analytics.perform_safety_analysis(uid, session)
+        else:
+            analytics.raise_alert(uid, session, "no_movement", {
+                "user_id": uid, "walking_session_id": session.walking_session_id, "message": "No movement"})
+        elapsed += time.perf_counter() - t0
+    return analytics.publisher.sent, elapsed
+
+
+def main():
+    walkers, events = timeline()
+    clock = SimClock()
+    saved = analytics.alert_coalescer, analytics.publisher
+    try:
+        with quiet_logging():
+            legacy = CooldownLimiter(clock)
+            legacy_sent, _ = run(legacy, clock, walkers, events)
+            clock.now = T0
+            coalescer = AlertCoalescer(analytics.ALERT_HOLD_SEC, analytics.ALERT_COOLDOWN_SEC, analytics.ALERT_SESSION_RATE,
+                                       analytics.ALERT_SESSION_BURST, analytics.ALERT_GLOBAL_RATE,
+                                       analytics.ALERT_GLOBAL_BURST, clock=clock)
+            new_sent, elapsed = run(coalescer, clock, walkers, events)
+    finally:
+        analytics.alert_coalescer, analytics.publisher = saved
+
+    print(f"{WALKERS} walkers, {len(events)} fixes + idle checks, simulated clock")
+    print(f"{'scenario':>9} {'walkers':>8} {'cooldowns':>10} {'coalesced':>10} {'reduction':>10}")
+    for name in dict.fromkeys(w[2] for w in walkers):
+        sids = [w[1] for w in walkers if w[2] == name]
+        a, b = sum(legacy_sent.get(s, 0) for s in sids), sum(new_sent.get(s, 0) for s in sids)
+        print(f"{name:>9} {len(sids):>8} {a:>10} {b:>10} {1 - b / a if a else 0:>10.0%}")
+    a, b = sum(legacy_sent.values()), sum(new_sent.values())
+    print(f"{'total':>9} {WALKERS:>8} {a:>10} {b:>10} {1 - b / a if a else 0:>10.0%}")
+    print(f"raised {coalescer.raised}, coalesced away {coalescer.coalesced}, held by token buckets {coalescer.throttled}; "
+          f"{elapsed / len(events) * 1e6:.1f} us per fix/idle check end to end")
+
+
+if __name__ == "__main__":
+    main()
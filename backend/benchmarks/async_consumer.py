@@ -0,0 +1,130 @@
+"""Threaded consumer_loop vs the asyncio consumer (per-user lanes, manual acks).
+
+    python -m benchmarks.async_consumer
+
+Both modes consume the batch_scorer workload: interleaved fixes from many
+walkers, some detouring. A local broker stand-in replaces RabbitMQ:
+- threaded: on_queue_message per delivery with auto-ack, like
+  consumer_loop. Alerts go through a QueuedPublisher whose stub broker
+  confirms a batch in CONFIRM_MS.
+- asyncio: AsyncConsumer with at most `prefetch` unacked deliveries. Each
+  delivery is acked after its alerts are confirmed, and every confirm takes
+  CONFIRM_MS.
+Reports backlog drain rate and p99 delivery-to-done latency at an open-loop
+arrival rate of LOAD_FRACTION of the threaded drain rate.
+"""
+import asyncio, queue, threading, time
+
+import analytics
+from benchmarks.batch_scorer import build_backlog
+from benchmarks.common import quiet_logging
+from benchmarks.publisher_load import StubConnection
+from services.publisher import QueuedPublisher
+
+CONFIRM_MS = 2.0
+PREFETCH = [1, 16, 128]
+LOAD_FRACTION = 0.7
+
+
+def p99(xs):
+    xs = sorted(xs)
+    return xs[int(len(xs) * 0.99)] * 1e3
+
+
+def reset(started):
+    analytics.active_sessions.clear()
+    for body in started:
+        analytics.on_queue_message(None, None, None, body)
+
+
+def run_threaded(started, backlog, rate=None):
+    reset(started)
+    analytics.publisher = QueuedPublisher(connect=StubConnection)
+    deliveries = queue.Queue()
+    latencies = []
+
+    def consumer():
+        while True:
+            item = deliveries.get()
+            if item is None:
+                return
+            arrival, body = item
+            analytics.on_queue_message(None, None, None, body)
+            latencies.append(time.perf_counter() - arrival)
+
+    t = threading.Thread(target=consumer)
+    t.start()
+    t0 = time.perf_counter()
+    for i, body in enumerate(backlog):
+        arrival = t0 if rate is None else t0 + i / rate
+        delay = arrival - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        deliveries.put((arrival, body))
+    deliveries.put(None)
+    t.join()
+    return len(backlog) / (time.perf_counter() - t0), p99(latencies)
+
+
+class StandInMessage:
+    def __init__(self, body, arrival, done):
+        self.body = body
+        self.arrival = arrival
+        self.done = done
+
+    async def ack(self):
+        self.done(self)
+
+
+async def _run_async(started, backlog, prefetch, rate):
+    reset(started)
+
+    async def publish(routing_key, body):
+        await asyncio.sleep(CONFIRM_MS / 1e3)
+
+    loop = asyncio.get_running_loop()
+    analytics.publisher = analytics.AsyncAlertPublisher(publish, loop)
+    consumer = analytics.AsyncConsumer(analytics.publisher)
+    window = asyncio.Semaphore(prefetch)
+    latencies = []
+
+    def done(message):
+        latencies.append(time.perf_counter() - message.arrival)
+        window.release()
+
+    t0 = time.perf_counter()
+    for i, body in enumerate(backlog):
+        arrival = t0 if rate is None else t0 + i / rate
+        delay = arrival - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await window.acquire()
+        await consumer.on_message(StandInMessage(body, arrival, done))
+    await consumer.lanes.join()
+    return len(backlog) / (time.perf_counter() - t0), p99(latencies)
+
+
+def run_async(started, backlog, prefetch, rate=None):
+    return asyncio.run(_run_async(started, backlog, prefetch, rate))
+
+
+def main():
+    started, backlog = build_backlog()
+    rows = []
+    with quiet_logging():
+        drain, _ = run_threaded(started, backlog)
+        rate = drain * LOAD_FRACTION
+        _, lat = run_threaded(started, backlog, rate)
+        rows.append(("threaded, auto-ack", drain, lat))
+        for prefetch in PREFETCH:
+            drain_a, _ = run_async(started, backlog, prefetch)
+            _, lat_a = run_async(started, backlog, prefetch, rate)
+            rows.append((f"asyncio, prefetch {prefetch}", drain_a, lat_a))
+    print(f"{len(backlog)} messages, confirm {CONFIRM_MS} ms, latency at {rate:.0f} msgs/s offered")
+    print(f"{'mode':>22} {'drain msgs/s':>13} {'p99 ms':>9}")
+    for name, d, lat in rows:
+        print(f"{name:>22} {d:>13.0f} {lat:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
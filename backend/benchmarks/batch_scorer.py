@@ -0,0 +1,80 @@
+"""Backlog drain throughput: per-message on_queue_message vs on_queue_batch.
+
+    python -m benchmarks.batch_scorer
+
+Simulates a backed-up location_updates queue (interleaved fixes from many
+walkers, some detouring) and reports fixes/sec. Publishing is replaced by a
+counter and console output is discarded so only analysis cost is measured.
+"""
+import json, random, time
+
+import analytics
+from benchmarks.common import fixes_along, M_PER_DEG_LAT, quiet_logging, synthetic_route
+
+N_USERS = 200
+FIXES_PER_USER = 100
+ROUTE_POINTS = 1000
+BATCH_SIZES = [64, 512, 4096]
+T0 = 1_700_000_000.0         # fixes are 1 s apart from here, as stamped by location-api
+
+
+class CountingPublisher:
+    def __init__(self):
+        self.count = 0
+
+    def publish_event(self, queue, event_type, data):
+        self.count += 1
+
+
+def build_backlog(seed=0):
+    rng = random.Random(seed)
+    started, streams = [], []
+    for u in range(N_USERS):
+        uid = f"u{u}"
+        route = synthetic_route(ROUTE_POINTS, seed=u)
+        started.append(json.dumps({"type": "walk.started", "data": {
+            "user_id": uid, "walking_session_id": f"sid-{u}", "route": route}}))
+        fixes = fixes_along(route[: FIXES_PER_USER * 2], FIXES_PER_USER, seed=u)
+        detour_at = rng.randrange(FIXES_PER_USER // 2)
+        msgs = []
+        for k, (lat, lon) in enumerate(fixes):
+            if detour_at <= k < detour_at + 10:
+                lat += 80 / M_PER_DEG_LAT
+            msgs.append(json.dumps({"type": "location.update", "data": {
+                "user_id": uid, "lat": lat, "lon": lon, "ts": T0 + k, "walking_session_id": f"sid-{u}"}}))
+        streams.append(msgs)
+    # interleave users like a real backlog
+    backlog = [s[k] for k in range(FIXES_PER_USER) for s in streams]
+    return started, backlog
+
+
+def run(started, backlog, batch_size):
+    analytics.active_sessions.clear()
+    analytics.publisher = CountingPublisher()
+    with quiet_logging():
+        for body in started:
+            analytics.on_queue_message(None, None, None, body)
+        t0 = time.perf_counter()
+        if batch_size is None:
+            for body in backlog:
+                analytics.on_queue_message(None, None, None, body)
+        else:
+            for i in range(0, len(backlog), batch_size):
+                analytics.on_queue_batch(backlog[i:i + batch_size])
+        elapsed = time.perf_counter() - t0
+    return len(backlog) / elapsed, analytics.publisher.count
+
+
+def main():
+    started, backlog = build_backlog()
+    print(f"{len(backlog)} fixes from {N_USERS} walkers, {ROUTE_POINTS}-vertex routes")
+    print(f"{'mode':>12} {'fixes/sec':>11} {'alerts':>7}")
+    rate, alerts = run(started, backlog, None)
+    print(f"{'per-message':>12} {rate:>11.0f} {alerts:>7}")
+    for b in BATCH_SIZES:
+        rate, alerts = run(started, backlog, b)
+        print(f"{'batch ' + str(b):>12} {rate:>11.0f} {alerts:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""Time to first guardian call: the old synchronous handler vs the dispatcher, against a stub Twilio.
+
+    python -m benchmarks.call_dispatch
+
+A werkzeug server on a thread stands in for Twilio's REST API. It answers
+POST .../Calls.json and .../Messages.json after TWILIO_LATENCY_SEC, as
+the real API takes a few hundred ms to create a call. twilio-api is loaded
+with TWILIO_API_BASE pointing at it, so the real twilio Client, HTTP pool
+and place() are used; nothing reaches Twilio.
+
+"before" is what the old handler did: one calls.create per guardian, in
+turn, before answering. "dispatcher" posts all guardians to
+/api/call_emergency, which answers 202 at once, and polls the job. Times
+are from the request until the stub has created the first and the last call.
+
+Then: the same request posted DUPLICATES times (a user mashing the SOS
+button) places each call once, and with the stub failing every first
+attempt (503) each call still goes out, one retry later.
+"""
+import importlib.util, json, os, re, threading, time
+
+from werkzeug.serving import WSGIRequestHandler, make_server
+from werkzeug.wrappers import Request, Response
+
+TWILIO_LATENCY_SEC = 0.3
+GUARDIANS = (1, 10)
+ROUNDS = 3
+DUPLICATES = 6
+RETRY_BASE_SEC = 0.2
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class StubTwilio:
+    """Enough of the REST API for calls.create / messages.create; records when each arrives."""
+
+    PATH = re.compile(r"/2010-04-01/Accounts/(\w+)/(Calls|Messages)\.json$")
+
+    def __init__(self):
+        self.arrivals = []              # (perf_counter, kind, to)
+        self.fail_first = False
+        self._seen = set()
+        self._lock = threading.Lock()
+
+    def reset(self, fail_first=False):
+        with self._lock:
+            self.arrivals, self.fail_first, self._seen = [], fail_first, set()
+
+    def __call__(self, environ, start_response):
+        req = Request(environ)
+        m = self.PATH.match(req.path)
+        if req.method != "POST" or not m:
+            return Response(json.dumps({"status": 404, "message": "not found"}), 404,
+                            content_type="application/json")(environ, start_response)
+        kind, to = m.group(2), req.form.get("To")
+        time.sleep(TWILIO_LATENCY_SEC)
+        with self._lock:
+            first = (kind, to) not in self._seen
+            self._seen.add((kind, to))
+            if self.fail_first and first:
+                body, status = {"status": 503, "code": 20503, "message": "Service unavailable"}, 503
+            else:
+                self.arrivals.append((time.perf_counter(), kind, to))
+                body = {"sid": ("CA" if kind == "Calls" else "SM") + os.urandom(16).hex(),
+                        "account_sid": m.group(1), "to": to, "status": "queued"}
+                status = 201
+        return Response(json.dumps(body), status, content_type="application/json")(environ, start_response)
+
+
+def load_twilio_api(base):
+    os.environ.update({"TWILIO_API_BASE": base, "TWILIO_ACCOUNT_SID": "AC" + "0" * 32,
+                       "TWILIO_AUTH_TOKEN": "stub", "TWILIO_PHONE_NUMBER": "+15005550006"})
+    spec = importlib.util.spec_from_file_location("twilio_api", os.path.join(os.path.dirname(__file__), "..", "twilio-api.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def phones(n, offset=0):
+    return [f"+1613555{offset + i:04d}" for i in range(n)]
+
+
+def wait_job(api, job_id, timeout=30):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        job = api.dispatcher.get(job_id)
+        if job["status"] not in ("queued", "in_progress"):
+            return job
+        time.sleep(0.01)
+    raise TimeoutError(job_id)
+
+
+def sequential(api, stub, n):
+    """The old handler: each guardian's call created in turn before the response."""
+    stub.reset()
+    t0 = time.perf_counter()
+    for to in phones(n):
+        api.place("call", to)
+    answered = time.perf_counter() - t0
+    times = sorted(t for t, _, _ in stub.arrivals)
+    return answered, times[0] - t0, times[-1] - t0
+
+
+def dispatched(api, stub, client, n, walk):
+    stub.reset()
+    t0 = time.perf_counter()
+    resp = client.post("/api/call_emergency", json={"walking_session_id": walk, "guardians": phones(n)})
+    answered = time.perf_counter() - t0
+    wait_job(api, resp.get_json()["job_id"])
+    times = sorted(t for t, _, _ in stub.arrivals)
+    return answered, times[0] - t0, times[-1] - t0
+
+
+def main():
+    stub = StubTwilio()
+    server = make_server("127.0.0.1", 0, stub, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    api = load_twilio_api(f"http://127.0.0.1:{server.server_port}")
+    api.dispatcher.retry_base_s = RETRY_BASE_SEC
+    client = api.app.test_client()
+
+    print(f"stub Twilio answering in {TWILIO_LATENCY_SEC * 1e3:.0f} ms, "
+          f"{api.CALL_WORKERS} workers, median of {ROUNDS}")
+    print(f"{'mode':>12} {'guardians':>9} {'response ms':>12} {'first call ms':>14} {'all calls ms':>13}")
+    for n in GUARDIANS:
+        for label in ("before", "dispatcher"):
+            runs = sorted((sequential(api, stub, n) if label == "before"
+                           else dispatched(api, stub, client, n, f"walk-{n}-{r}")) for r in range(ROUNDS))
+            answered, first, last = (sorted(col)[ROUNDS // 2] for col in zip(*runs))
+            print(f"{label:>12} {n:>9} {answered * 1e3:>12.0f} {first * 1e3:>14.0f} {last * 1e3:>13.0f}")
+
+    print()
+    stub.reset()
+    body = {"walking_session_id": "walk-dup", "guardians": phones(3),
+            "channels": ["call", "sms"], "idempotency_key": "sos-1"}
+    replies = [client.post("/api/call_emergency", json=body) for _ in range(DUPLICATES)]
+    job = wait_job(api, replies[-1].get_json()["job_id"])
+    print(f"{DUPLICATES} identical requests -> status codes {[r.status_code for r in replies]}, "
+          f"{len(stub.arrivals)} calls/SMS created for {len(job['tasks'])} tasks, job {job['status']}")
+
+    stub.reset(fail_first=True)
+    t0 = time.perf_counter()
+    resp = client.post("/api/call_emergency", json={"walking_session_id": "walk-retry", "guardians": phones(5)})
+    job = wait_job(api, resp.get_json()["job_id"])
+    attempts = [t["attempts"] for t in job["tasks"]]
+    print(f"every first attempt 503 -> job {job['status']}, attempts {attempts}, "
+          f"first call at {job['first_placed_ms']} ms, all after {(max(t for t, _, _ in stub.arrivals) - t0) * 1e3:.0f} ms")
+    print(f"dispatcher counters: placed={api.dispatcher.placed} retried={api.dispatcher.retried} "
+          f"failed={api.dispatcher.failed} deduplicated={api.dispatcher.deduplicated}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
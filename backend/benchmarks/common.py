@@ -0,0 +1,58 @@
+"""Shared helpers for the backend benchmarks (run from backend/: python -m benchmarks.<name>)."""
+import contextlib, logging, math, random, time
+
+ORIGIN = (43.763708, -79.344895)   # same neighbourhood as test-events.py
+M_PER_DEG_LAT = 111195.0
+
+
+def synthetic_route(n_points, step_m=10.0, seed=0, origin=ORIGIN):
+    """Meandering walking route of n_points vertices ~step_m apart, as [{"lat", "lon"}, ...]."""
+    rng = random.Random(seed)
+    lat, lon = origin
+    m_per_deg_lon = M_PER_DEG_LAT * math.cos(math.radians(lat))
+    heading = rng.uniform(0, 2 * math.pi)
+    route = []
+    for _ in range(n_points):
+        route.append({"lat": lat, "lon": lon})
+        heading += rng.gauss(0, 0.25)
+        lat += step_m * math.cos(heading) / M_PER_DEG_LAT
+        lon += step_m * math.sin(heading) / m_per_deg_lon
+    return route
+
+
+def fixes_along(route, n_fixes, jitter_m=8.0, seed=1):
+    """n_fixes (lat, lon) samples walking the route in order, with GPS-like noise."""
+    rng = random.Random(seed)
+    lat0 = route[0]["lat"]
+    m_per_deg_lon = M_PER_DEG_LAT * math.cos(math.radians(lat0))
+    out = []
+    for k in range(n_fixes):
+        f = k * (len(route) - 1) / max(1, n_fixes - 1)
+        i = min(int(f), len(route) - 2)
+        t = f - i
+        a, b = route[i], route[i + 1]
+        lat = a["lat"] + t * (b["lat"] - a["lat"]) + rng.gauss(0, jitter_m) / M_PER_DEG_LAT
+        lon = a["lon"] + t * (b["lon"] - a["lon"]) + rng.gauss(0, jitter_m) / m_per_deg_lon
+        out.append((lat, lon))
+    return out
+
+
+def per_call_us(fn, args_list, repeat=3):
+    """Best-of-repeat mean microseconds per fn(*args) over args_list."""
+    best = math.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for args in args_list:
+            fn(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best / len(args_list) * 1e6
+
+
+@contextlib.contextmanager
+def quiet_logging():
+    """Drop log records while replaying traffic, so the services' warnings stay out of the results."""
+    logging.disable(logging.CRITICAL)
+    try:
+        yield
+    finally:
+        logging.disable(logging.NOTSET)
@@ -0,0 +1,141 @@
+"""Replay noisy walking traces with and without smoothing and decimation.
+
+    python -m benchmarks.fix_smoothing
+
+Each trace is 1 Hz fixes along a synthetic route, with GPS_NOISE_M gaussian
+noise and MULTIPATH_SHARE of fixes thrown MULTIPATH_M off (urban canyon):
+- commute: walks the route the whole time
+- crossing: walks, waits STOP_SEC at a crossing, walks on
+- detour: walks, drifts DETOUR_M off the route and back
+Every fix is labelled by whether the walker's true position was more than
+OFF_ROUTE_THRESHOLD_M from the route. The table shows how many fixes were route-matched
+and how many were flagged off-route, split into true and false flags, how
+many detouring walkers were caught and the mean seconds from truly off to
+the first flag. Flags are counted before alert coalescing, so each counts.
+Timing is us per received fix through perform_safety_analysis.
+"""
+import math, random, time
+
+import analytics
+from benchmarks.common import M_PER_DEG_LAT, quiet_logging, synthetic_route
+from services.route_index import RouteIndex
+
+WALKERS = 30
+GPS_NOISE_M = 6.0
+MULTIPATH_SHARE = 0.03
+MULTIPATH_M = 45.0
+WALK_MPS = 1.4
+TRACE_SEC = 600
+STOP_SEC = 180
+DETOUR_M = 100.0
+
+CONFIGS = [  # name, alpha, beta, decimate min m
+    ("raw", 1.0, 0.0, 0.0),
+    ("smoothed", analytics.SMOOTH_ALPHA, analytics.SMOOTH_BETA, 0.0),
+    ("smoothed+decimated", analytics.SMOOTH_ALPHA, analytics.SMOOTH_BETA, analytics.DECIMATE_MIN_M),
+]
+
+
+def _point_at(route, cum, s):
+    """(lat, lon) at s meters along route."""
+    i = max(0, min(len(cum) - 2, next((k for k in range(1, len(cum)) if cum[k] >= s), len(cum) - 1) - 1))
+    seg = cum[i + 1] - cum[i]
+    t = min(1.0, max(0.0, (s - cum[i]) / seg)) if seg else 0.0
+    a, b = route[i], route[i + 1]
+    return a["lat"] + t * (b["lat"] - a["lat"]), a["lon"] + t * (b["lon"] - a["lon"])
+
+
+def trace(kind, seed):
+    """(route, [(lat, lon, ts, truly_off), ...])"""
+    rng = random.Random(seed)
+    route = synthetic_route(int(TRACE_SEC * WALK_MPS / 10) + 10, seed=seed)
+    m_per_deg_lon = M_PER_DEG_LAT * math.cos(math.radians(route[0]["lat"]))
+    cum = [0.0]
+    for a, b in zip(route, route[1:]):
+        cum.append(cum[-1] + math.hypot((b["lat"] - a["lat"]) * M_PER_DEG_LAT, (b["lon"] - a["lon"]) * m_per_deg_lon))
+
+    idx = RouteIndex(route)
+    fixes, s = [], 0.0
+    for t in range(TRACE_SEC):
+        offset = 0.0
+        if kind == "crossing" and 200 <= t < 200 + STOP_SEC:
+            pass                                            # standing still
+        elif kind == "detour" and 200 <= t < 380:           # 60 s out, 60 s away, 60 s back
+            offset = DETOUR_M * min(1.0, (t - 200) / 60, (380 - t) / 60)
+        else:
+            s += WALK_MPS
+        lat, lon = _point_at(route, cum, s)
+        lat += offset / M_PER_DEG_LAT
+        if rng.random() < MULTIPATH_SHARE:
+            a = rng.uniform(0, 2 * math.pi)
+            nx, ny = MULTIPATH_M * math.cos(a), MULTIPATH_M * math.sin(a)
+        else:
+            nx, ny = rng.gauss(0, GPS_NOISE_M), rng.gauss(0, GPS_NOISE_M)
+        fixes.append((lat + ny / M_PER_DEG_LAT, lon + nx / m_per_deg_lon, float(t),
+                      idx.distance(lat, lon) > analytics.OFF_ROUTE_THRESHOLD_M))
+    return route, fixes
+
+
+def replay(traces, alpha, beta, min_m):
+    analytics.SMOOTH_ALPHA, analytics.SMOOTH_BETA, analytics.DECIMATE_MIN_M = alpha, beta, min_m
+    analytics.active_sessions.clear()
+    counts = {"received": 0, "matched": 0, "true": 0, "false": 0, "caught": 0, "delays": []}
+    match_route, flagged = analytics.match_route, []
+
+    def counting_match(session, lat, lon):
+        counts["matched"] += 1
+        return match_route(session, lat, lon)
+
+    analytics.match_route = counting_match
+    analytics._publish_off_route = lambda user_id, *_: flagged.append(user_id)
+    elapsed = 0.0
+    try:
+        for u, (route, fixes) in enumerate(traces):
+            uid = f"r{u}"
+            analytics._handle_walk_started({"user_id": uid, "walking_session_id": f"sid-{u}", "route": route})
+            session = analytics.active_sessions.get(uid)
+            off_since = caught = None
+            for lat, lon, ts, truly_off in fixes:
+                flagged.clear()
+                t0 = time.perf_counter()
+                session.locations.append(lat, lon, ts)
+                analytics.perform_safety_analysis(uid, session)
+                elapsed += time.perf_counter() - t0
+                counts["received"] += 1
+                if truly_off and off_since is None:
+                    off_since = ts
+                if flagged:
+                    counts["true" if truly_off else "false"] += 1
+                    if truly_off and caught is None:
+                        caught = ts
+            if caught is not None:
+                counts["caught"] += 1
+                counts["delays"].append(caught - off_since)
+    finally:
+        analytics.match_route = match_route
+    counts["us"] = elapsed / counts["received"] * 1e6
+    return counts
+
+
+def main():
+    saved = analytics._publish_off_route, analytics.SMOOTH_ALPHA, analytics.SMOOTH_BETA, analytics.DECIMATE_MIN_M
+    analytics.publisher = type("NullPublisher", (), {"publish_event": lambda self, *a: True})()
+    print(f"{WALKERS} walkers per trace, {TRACE_SEC} fixes each, noise {GPS_NOISE_M} m + {MULTIPATH_SHARE:.0%} multipath")
+    print(f"{'trace':>9} {'mode':>19} {'matched':>12} {'true off':>9} {'false off':>10} {'caught':>7} {'delay s':>8} {'us/fix':>7}")
+    try:
+        with quiet_logging():
+            for kind in ("commute", "crossing", "detour"):
+                traces = [trace(kind, seed) for seed in range(WALKERS)]
+                truth = sum(f[3] for _, fixes in traces for f in fixes)
+                detours = sum(any(f[3] for f in fixes) for _, fixes in traces)
+                for name, alpha, beta, min_m in CONFIGS:
+                    c = replay(traces, alpha, beta, min_m)
+                    print(f"{kind:>9} {name:>19} {c['matched']:>6}/{c['received']:<5} "
+                          f"{c['true']:>4}/{truth:<4} {c['false']:>10} {c['caught']:>3}/{detours:<3} "
+                          f"{sum(c['delays']) / len(c['delays']) if c['delays'] else 0:>8.1f} {c['us']:>7.1f}")
+    finally:
+        analytics._publish_off_route, analytics.SMOOTH_ALPHA, analytics.SMOOTH_BETA, analytics.DECIMATE_MIN_M = saved
+
+
+if __name__ == "__main__":
+    main()
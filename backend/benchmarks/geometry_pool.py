@@ -0,0 +1,71 @@
+"""Batch route matching: in-process match_batch vs GeometryPool worker processes.
+
+    python -m benchmarks.geometry_pool
+
+SESSIONS walkers with ROUTE_POINTS-vertex routes send FIXES_PER_SESSION
+fixes each per batch; DETOUR_SHARE of them are off-route, which forces
+full-route searches. Routes are loaded into shared memory once, as
+walk.started does; each batch then ships only the fixes. Speedup is bounded
+by the number of cores reported on the first line.
+"""
+import os, random, time
+
+from benchmarks.common import synthetic_route, fixes_along, M_PER_DEG_LAT
+from services.batch_scorer import match_batch
+from services.geometry_pool import GeometryPool
+from services.route_index import RouteIndex
+
+SESSIONS = 10_000
+ROUTE_POINTS = 500
+FIXES_PER_SESSION = 5
+DETOUR_SHARE = 0.05
+BATCHES = 3
+WORKERS = sorted({1, 2, 4, os.cpu_count() or 1})
+THRESHOLD_M = 35.0
+
+
+def workload(seed=0):
+    rng = random.Random(seed)
+    indexes, sids, lats, lons, starts = [], [], [], [], []
+    for u in range(SESSIONS):
+        route = synthetic_route(ROUTE_POINTS, seed=u)
+        indexes.append(RouteIndex(route))
+        sids.append(f"bench-{u}")
+        k = rng.randrange(ROUTE_POINTS - 20)
+        fixes = fixes_along(route[k:k + 10], FIXES_PER_SESSION, seed=u)
+        shift = 80 / M_PER_DEG_LAT if rng.random() < DETOUR_SHARE else 0.0
+        lats.append([lat + shift for lat, _ in fixes])
+        lons.append([lon for _, lon in fixes])
+        starts.append(k)
+    return indexes, sids, starts, lats, lons
+
+
+def best_rate(fn):
+    best = float("inf")
+    for _ in range(BATCHES):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return SESSIONS * FIXES_PER_SESSION / best
+
+
+def main():
+    print(f"{os.cpu_count()} CPU(s); building {SESSIONS} sessions x {ROUTE_POINTS}-vertex routes…")
+    indexes, sids, starts, lats, lons = workload()
+    base = best_rate(lambda: match_batch(indexes, starts, lats, lons, THRESHOLD_M))
+    print(f"{'mode':>16} {'fixes/sec':>11} {'speedup':>8}")
+    print(f"{'in-process':>16} {base:>11.0f} {1.0:>8.2f}")
+    for workers in WORKERS:
+        pool = GeometryPool(workers)
+        pool.warm_up()
+        t0 = time.perf_counter()
+        for sid, idx in zip(sids, indexes):
+            pool.load(sid, idx)
+        load_ms = (time.perf_counter() - t0) * 1e3
+        rate = best_rate(lambda: pool.match(sids, indexes, starts, lats, lons, THRESHOLD_M))
+        print(f"{f'{workers} worker(s)':>16} {rate:>11.0f} {rate / base:>8.2f}   (load {load_ms / SESSIONS * 1e3:.0f} us/route)")
+        pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""Hazard-zone checks per fix at 100k zones: grid index vs a linear scan, and reloading under load.
+
+    python -m benchmarks.hazard_zones
+
+ZONES random polygons (4-16 vertices, 30-250 m across, one in ten with a
+hole) are scattered over a SPAN_DEG square around the benchmarks' usual
+neighbourhood and written to a temporary GeoJSON file. Fixes are uniform
+over the same square, so far more of them land near a zone than along a
+real walk.
+
+"scan" tests every zone's bbox, then ray casts the bbox hits: what a
+per-fix check costs with no index. "index" is HazardIndex.zones_at. The
+candidates of a fix are the zones whose boundary crosses its cell; "per
+candidate" times zones_at's bbox test and ray cast over every (fix,
+candidate) pair, less the same loop doing nothing.
+
+"reload" rebuilds the layer on a second thread, as analytics'
+hazard_reload_loop does, while the main thread keeps checking fixes. It
+reports how many were checked meanwhile and the longest gap between two.
+"analytics" replays location.update events through on_queue_message with
+and without the layer loaded.
+"""
+import json, math, os, random, tempfile, threading, time
+
+import analytics
+from benchmarks.common import fixes_along, M_PER_DEG_LAT, ORIGIN, quiet_logging, synthetic_route
+from services.hazard_zones import HazardLayer, _inside
+from services.publisher import make_event
+
+ZONES = 100_000
+SPAN_DEG = 0.5
+FIXES = 200_000
+SCAN_FIXES = 200
+WALKERS = 100
+FIXES_PER_WALKER = 100
+ROUNDS = 5
+SEED = 7
+
+
+class NullPublisher:
+    def publish_event(self, *a):
+        return True
+
+
+def random_zone(rng, i, lat, lon):
+    m_per_deg_lon = M_PER_DEG_LAT * math.cos(math.radians(lat))
+    radius = rng.uniform(15, 125)
+    n = rng.randint(4, 16)
+    ring = []
+    for k in range(n):
+        a = 2 * math.pi * k / n
+        r = radius * rng.uniform(0.6, 1.0)
+        ring.append([lon + r * math.cos(a) / m_per_deg_lon, lat + r * math.sin(a) / M_PER_DEG_LAT])
+    rings = [ring + [ring[0]]]
+    if i % 10 == 0:
+        hole = [[lon + 0.3 * radius * math.cos(2 * math.pi * k / 5) / m_per_deg_lon,
+                 lat + 0.3 * radius * math.sin(2 * math.pi * k / 5) / M_PER_DEG_LAT] for k in range(5)]
+        rings.append(hole + [hole[0]])
+    return {"type": "Feature", "id": f"z{i}",
+            "properties": {"name": f"zone {i}", "category": rng.choice(("lighting", "incidents")),
+                           "severity": rng.randint(1, 3)},
+            "geometry": {"type": "Polygon", "coordinates": rings}}
+
+
+def layer_doc(rng):
+    lat0, lon0 = ORIGIN
+    return {"type": "FeatureCollection", "features": [
+        random_zone(rng, i, lat0 + rng.uniform(-SPAN_DEG, SPAN_DEG) / 2, lon0 + rng.uniform(-SPAN_DEG, SPAN_DEG) / 2)
+        for i in range(ZONES)]}
+
+
+def random_fixes(rng, n):
+    lat0, lon0 = ORIGIN
+    return [(lat0 + rng.uniform(-SPAN_DEG, SPAN_DEG) / 2, lon0 + rng.uniform(-SPAN_DEG, SPAN_DEG) / 2)
+            for _ in range(n)]
+
+
+def scan(zones, lat, lon):
+    hits = []
+    for z in zones:                 # HazardIndex.zones rows: (id, name, category, severity, edges, bbox)
+        minx, miny, maxx, maxy = z[5]
+        if minx <= lon <= maxx and miny <= lat <= maxy and _inside(z[4], lon, lat):
+            hits.append(z)
+    return hits
+
+
+def timed(fn, fixes):
+    t0 = time.perf_counter()
+    for lat, lon in fixes:
+        fn(lat, lon)
+    return (time.perf_counter() - t0) / len(fixes)
+
+
+def candidate_pairs(index, fixes):
+    grid, c = index.grid, index.cell_deg
+    pairs = []
+    for lat, lon in fixes:
+        cell = grid.get((math.floor(lon / c), math.floor(lat / c)))
+        if cell:
+            pairs.extend((lat, lon, entry) for entry in cell[1])
+    return pairs
+
+
+def per_candidate(pairs):
+    """Seconds per bbox test + ray cast, as in zones_at, over the bare loop."""
+    t0 = time.perf_counter()
+    for lat, lon, (minx, miny, maxx, maxy, i, edges) in pairs:
+        pass
+    t1 = time.perf_counter()
+    for lat, lon, (minx, miny, maxx, maxy, i, edges) in pairs:
+        if minx <= lon <= maxx and miny <= lat <= maxy and _inside(edges, lon, lat):
+            pass
+    t2 = time.perf_counter()
+    return ((t2 - t1) - (t1 - t0)) / len(pairs)
+
+
+def reload_under_load(layer, fixes):
+    """Checks done and the longest gap between two while the layer is rebuilt on another thread."""
+    done = threading.Event()
+    version = layer.version
+
+    def rebuild():
+        layer.reload(force=True)
+        done.set()
+
+    threading.Thread(target=rebuild, daemon=True).start()
+    n, worst, last = 0, 0.0, time.perf_counter()
+    while not done.is_set():
+        lat, lon = fixes[n % len(fixes)]
+        layer.index.zones_at(lat, lon)
+        now = time.perf_counter()
+        worst, last, n = max(worst, now - last), now, n + 1
+    return n, worst, layer.version > version
+
+
+def fix_bodies():
+    route = synthetic_route(300)
+    fixes = fixes_along(route, FIXES_PER_WALKER)
+    starts = [json.dumps(make_event("walk.started", {"user_id": f"u{u}", "walking_session_id": f"s{u}", "route": route}))
+              for u in range(WALKERS)]
+    t0 = time.time() - FIXES_PER_WALKER
+    updates = [json.dumps(make_event("location.update", {"user_id": f"u{u}", "walking_session_id": f"s{u}",
+                                                         "lat": lat, "lon": lon, "ts": t0 + k}))
+               for k, (lat, lon) in enumerate(fixes) for u in range(WALKERS)]
+    return starts, updates
+
+
+def replay(starts, updates):
+    analytics.active_sessions.clear()
+    analytics.session_deadlines.__init__()
+    with quiet_logging():
+        for body in starts:
+            analytics.on_queue_message(None, None, None, body)
+        t0 = time.perf_counter()
+        for body in updates:
+            analytics.on_queue_message(None, None, None, body)
+    return (time.perf_counter() - t0) / len(updates)
+
+
+def main():
+    rng = random.Random(SEED)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "hazards.geojson")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(layer_doc(rng), f)
+        layer = HazardLayer(path, analytics.HAZARD_CELL_DEG)
+        layer.reload()
+        index = layer.index
+        print(f"{len(index)} zones ({os.path.getsize(path) / 2**20:.0f} MiB GeoJSON), "
+              f"{len(index.grid)} cells of {index.cell_deg} deg; load + build {layer.load_seconds:.1f} s")
+
+        fixes = random_fixes(rng, FIXES)
+        pairs = candidate_pairs(index, fixes)
+        hits = sum(len(index.zones_at(lat, lon)) for lat, lon in fixes)
+        t_scan = timed(lambda lat, lon: scan(index.zones, lat, lon), fixes[:SCAN_FIXES])
+        t_index = min(timed(index.zones_at, fixes) for _ in range(3))
+        t_candidate = min(per_candidate(pairs) for _ in range(3))
+        print(f"{'check':>8} {'us/fix':>9} {'fixes/s':>10}")
+        print(f"{'scan':>8} {t_scan * 1e6:>9.0f} {1 / t_scan:>10.0f}")
+        print(f"{'index':>8} {t_index * 1e6:>9.2f} {1 / t_index:>10.0f}")
+        print(f"index: {len(pairs) / FIXES:.2f} candidates and {hits / FIXES:.3f} hits per fix, "
+              f"{sum(len(e[5]) for _, _, e in pairs) / len(pairs):.1f} edges per candidate, "
+              f"{t_candidate * 1e9:.0f} ns per candidate")
+
+        n, worst, swapped = reload_under_load(layer, fixes)
+        print(f"reload: {layer.load_seconds:.1f} s on a second thread, {n} fixes checked meanwhile, "
+              f"longest gap {worst * 1e3:.1f} ms, new index swapped in: {swapped}")
+
+        saved = analytics.publisher, analytics.hazard_layer
+        analytics.publisher = NullPublisher()
+        starts, updates = fix_bodies()
+        bare, checked = [], []
+        raised = analytics.ALERTS_RAISED.values.get("hazard_zone", 0)
+        try:
+            for _ in range(ROUNDS):     # alternate, so drift on the machine hits both sides
+                analytics.hazard_layer = None
+                bare.append(replay(starts, updates))
+                analytics.hazard_layer = layer
+                checked.append(replay(starts, updates))
+        finally:
+            analytics.publisher, analytics.hazard_layer = saved
+        raised = (analytics.ALERTS_RAISED.values.get("hazard_zone", 0) - raised) / ROUNDS
+        bare, checked = min(bare), min(checked)
+        print(f"analytics: {bare * 1e6:.1f} us/fix without the layer, {checked * 1e6:.1f} us/fix with it "
+              f"({(checked - bare) * 1e6:+.1f} us), {raised / len(updates):.1%} of fixes entering a zone")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+"""End-to-end load test: thousands of simulated walkers against location-api + analytics, no RabbitMQ needed.
+
+    python -m benchmarks.load_test [--walkers 2000] [--hz 1] [--duration 120] [--out result.json]
+
+location-api runs on a local threaded werkzeug server. analytics runs in
+the same process: its consumer, the alert consumer and the watchdog are
+threads fed by InProcessBroker instead of RabbitMQ. Each walker is an
+asyncio task (aiohttp) that calls /start_walk and walks the route it gets
+back at WALK_MPS. It sends /update_location at --hz with GPS noise and its
+send time as "timestamp", then calls /stop_walk. Walkers start spread over
+--ramp seconds. Each one gets at most one incident, 20-35% into its walk:
+- detour: drifts DETOUR_M off the route and comes back. The latency is
+  from sending the fix that raised the alert (its fix_ts) until the alert
+  is seen in /risk/latest. "detect" runs from the first fix truly more than
+  the off-route threshold away.
+- pause: sends nothing for PAUSE_SEC. The latency of no_movement runs from
+  when the walker had been idle for the inactivity threshold.
+- glitch: one fix GLITCH_M away. Any alert about that fix within 10 s
+  counts as false.
+While an alert is expected, the walker polls /risk/latest (If-None-Match) every
+--poll seconds, so latencies include up to that much polling delay.
+
+The output is one JSON document on stdout (and in --out), for regression
+tracking. It covers the config, offered vs achieved fix rate, HTTP
+latency per endpoint, broker queue wait and backlog, and alert latency
+percentiles. Client, server and analytics share this process and its
+cores, so absolute numbers are a floor on what separate machines would do.
+"""
+import argparse, asyncio, json, math, queue, random, threading, time
+
+import aiohttp
+from werkzeug.serving import make_server
+
+import analytics
+from benchmarks.common import M_PER_DEG_LAT, ORIGIN, quiet_logging
+from benchmarks.publisher_load import QuietHandler, load_api
+from services.publisher import make_event
+
+WALK_MPS = 1.4
+GPS_NOISE_M = 4.0
+DETOUR_M = 80.0
+PAUSE_SEC = 25.0
+GLITCH_M = 1500.0
+ALERT_TIMEOUT_SEC = 60.0
+GLITCH_WATCH_SEC = 10.0
+TRIP_M = 1200.0
+
+
+class InProcessBroker:
+    """Stands in for RabbitMQ: one FIFO per queue (partitions folded together), one consumer thread each."""
+
+    def __init__(self):
+        self._queues = {}
+        self.published = 0
+        self.waits = []                 # seconds each location event sat in its queue
+
+    def _queue(self, name):
+        return self._queues.setdefault(name.split(".")[0], queue.Queue())
+
+    def publish_event(self, routing_key, event_type, data):
+        self._queue(routing_key).put((time.perf_counter(), json.dumps(make_event(event_type, data))))
+        self.published += 1
+        return True
+
+    def consume(self, name, handler, record_wait=False):
+        q = self._queue(name)
+
+        def loop():
+            while True:
+                enqueued, body = q.get()
+                if record_wait:
+                    self.waits.append(time.perf_counter() - enqueued)
+                handler(None, None, None, body)
+                q.task_done()
+        threading.Thread(target=loop, name=f"broker-{name}", daemon=True).start()
+
+    def backlog(self, name):
+        return self._queue(name).qsize()
+
+
+def percentiles(xs, scale=1e3):
+    if not xs:
+        return None
+    xs = sorted(xs)
+    pick = lambda p: round(xs[min(len(xs) - 1, int(len(xs) * p))] * scale, 2)
+    return {"n": len(xs), "p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99), "max": round(xs[-1] * scale, 2)}
+
+
+class Stats:
+    def __init__(self):
+        self.http = {}                  # endpoint -> [seconds]
+        self.status = {}                # status code -> count
+        self.fixes_sent = 0
+        self.first_fix, self.last_fix = math.inf, 0.0
+        self.alerts = {"off_route": [], "no_movement": []}
+        self.detect = []
+        self.missed = {"off_route": 0, "no_movement": 0}
+        self.glitches = self.glitch_false_alerts = 0
+
+
+async def call(http, stats, method, url, endpoint, **kw):
+    t0 = time.perf_counter()
+    try:
+        async with http.request(method, url, **kw) as resp:
+            body = await resp.json(content_type=None) if resp.status == 200 else None
+            status, etag = resp.status, resp.headers.get("ETag")
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        body, status, etag = None, "error", None
+    stats.http.setdefault(endpoint, []).append(time.perf_counter() - t0)
+    stats.status[status] = stats.status.get(status, 0) + 1
+    return status, body, etag
+
+
+async def wait_for_alert(http, base, stats, sid, types, not_before, poll_s, timeout_s):
+    """First alert of one of types about a fix from not_before on; (seen time, payload) or None."""
+    etag, deadline = None, time.time() + timeout_s
+    while time.time() < deadline:
+        headers = {"If-None-Match": etag} if etag else {}
+        status, body, tag = await call(http, stats, "GET", f"{base}/risk/latest", "/risk/latest",
+                                       params={"sid": sid}, headers=headers)
+        etag = tag or etag
+        if status == 200 and body:
+            fix_ts = body.get("fix_ts")
+            if body.get("alert_type") in types and (fix_ts is None or fix_ts >= not_before - 1e-3):
+                return time.time(), body
+        await asyncio.sleep(poll_s)
+    return None
+
+
+class Route:
+    """The /start_walk route ([[lon, lat], ...]) in local metres, for walking along it."""
+
+    def __init__(self, route):
+        self.lat0, self.lon0 = route[0][1], route[0][0]
+        self.kx = M_PER_DEG_LAT * math.cos(math.radians(self.lat0))
+        self.pts = [((lon - self.lon0) * self.kx, (lat - self.lat0) * M_PER_DEG_LAT) for lon, lat in route]
+        self.cum = [0.0]
+        for (ax, ay), (bx, by) in zip(self.pts, self.pts[1:]):
+            self.cum.append(self.cum[-1] + math.hypot(bx - ax, by - ay))
+
+    def at(self, s, offset_m=0.0):
+        """(lat, lon) s metres along, offset_m to the left of the route."""
+        s = max(0.0, min(s, self.cum[-1]))
+        i = next((k for k in range(1, len(self.cum)) if self.cum[k] >= s), len(self.cum) - 1) - 1
+        (ax, ay), (bx, by) = self.pts[i], self.pts[i + 1]
+        seg = self.cum[i + 1] - self.cum[i] or 1.0
+        t = (s - self.cum[i]) / seg
+        x, y = ax + t * (bx - ax), ay + t * (by - ay)
+        x, y = x - offset_m * (by - ay) / seg, y + offset_m * (bx - ax) / seg
+        return self.lat0 + y / M_PER_DEG_LAT, self.lon0 + x / self.kx
+
+
+async def walker(i, http, base, args, stats, watchers):
+    rng = random.Random(i)
+    await asyncio.sleep(rng.uniform(0, args.ramp))
+    lat, lon = ORIGIN[0] + rng.uniform(-0.02, 0.02), ORIGIN[1] + rng.uniform(-0.02, 0.02)
+    heading = rng.uniform(0, 2 * math.pi)
+    end = [lon + TRIP_M * math.sin(heading) / (M_PER_DEG_LAT * math.cos(math.radians(lat))),
+           lat + TRIP_M * math.cos(heading) / M_PER_DEG_LAT]
+    uid = f"load-{i}"
+    status, body, _ = await call(http, stats, "POST", f"{base}/start_walk", "/start_walk",
+                              json={"user_id": uid, "start_location": [lon, lat], "end_location": end})
+    if status != 200:
+        return
+    sid, route = body["walking_session_id"], Route(body["route"])
+
+    roll = rng.random()
+    incident = ("detour" if roll < args.detours else "pause" if roll < args.detours + args.pauses
+                else "glitch" if roll < args.detours + args.pauses + args.glitches else None)
+    incident_at = rng.uniform(0.2, 0.35) * args.duration    # leaves time for a 90 s detour to be caught
+    off_since = paused = None
+    started, tick, walked = time.time(), 1.0 / args.hz, 0.0
+    last_sent = started
+    while True:
+        now = time.time()
+        t = now - started
+        if t >= args.duration:
+            break
+        offset = 0.0
+        if incident == "detour" and t >= incident_at:      # 30 s out, 30 s away, 30 s back
+            offset = DETOUR_M * max(0.0, min(1.0, (t - incident_at) / 30, (incident_at + 90 - t) / 30))
+            if offset > analytics.OFF_ROUTE_THRESHOLD_M and off_since is None:
+                off_since = now
+                watchers.append(asyncio.create_task(expect(http, base, args, stats, sid, "off_route", now)))
+        if incident == "pause" and incident_at <= t < incident_at + PAUSE_SEC:
+            if paused is None:
+                paused = last_sent + analytics.INACTIVITY_THRESHOLD_SEC
+                watchers.append(asyncio.create_task(expect(http, base, args, stats, sid, "no_movement", paused)))
+            await asyncio.sleep(tick)
+            continue
+        if offset == 0.0:
+            walked += tick * WALK_MPS
+        flat, flon = route.at(walked, offset)
+        flat += rng.gauss(0, GPS_NOISE_M) / M_PER_DEG_LAT
+        flon += rng.gauss(0, GPS_NOISE_M) / route.kx
+        if incident == "glitch" and t >= incident_at:
+            flat += GLITCH_M / M_PER_DEG_LAT
+            incident = None
+            stats.glitches += 1
+            watchers.append(asyncio.create_task(glitch_watch(http, base, args, stats, sid, now)))
+        status, _, _ = await call(http, stats, "POST", f"{base}/update_location", "/update_location",
+                               json={"user_id": uid, "walking_session_id": sid, "current_location": [flon, flat],
+                                     "timestamp": now * 1000})
+        if status == 200:
+            stats.fixes_sent += 1
+            stats.first_fix = min(stats.first_fix, now)
+            stats.last_fix = max(stats.last_fix, now)
+            last_sent = now
+        await asyncio.sleep(max(0.0, started + (math.floor(t / tick) + 1) * tick - time.time()))
+    await call(http, stats, "POST", f"{base}/stop_walk", "/stop_walk", json={"user_id": uid, "walking_session_id": sid})
+
+
+async def expect(http, base, args, stats, sid, kind, since):
+    types = {"off_route", "risk_score"} if kind == "off_route" else {"no_movement"}
+    hit = await wait_for_alert(http, base, stats, sid, types, since if kind == "off_route" else 0.0,
+                               args.poll, ALERT_TIMEOUT_SEC)
+    if hit is None:
+        stats.missed[kind] += 1
+        return
+    seen, payload = hit
+    if kind == "off_route":
+        stats.alerts[kind].append(seen - payload.get("fix_ts", since))
+        stats.detect.append(seen - since)
+    else:
+        stats.alerts[kind].append(seen - since)
+
+
+async def glitch_watch(http, base, args, stats, sid, sent):
+    hit = await wait_for_alert(http, base, stats, sid, {"off_route", "risk_score"}, sent, args.poll, GLITCH_WATCH_SEC)
+    if hit is not None and abs(hit[1].get("fix_ts", 0) - sent) < 1e-3:
+        stats.glitch_false_alerts += 1
+
+
+async def drive(base, args, stats):
+    connector = aiohttp.TCPConnector(limit=args.connections)
+    timeout = aiohttp.ClientTimeout(total=30)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as http:
+        watchers = []
+        await asyncio.gather(*(walker(i, http, base, args, stats, watchers) for i in range(args.walkers)))
+        await asyncio.gather(*watchers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--walkers", type=int, default=2000)
+    parser.add_argument("--hz", type=float, default=1.0, help="fixes per second per walker")
+    parser.add_argument("--duration", type=float, default=120.0, help="seconds each walker walks")
+    parser.add_argument("--ramp", type=float, default=10.0, help="walkers start spread over this many seconds")
+    parser.add_argument("--detours", type=float, default=0.1, help="share of walkers that detour")
+    parser.add_argument("--pauses", type=float, default=0.05, help="share of walkers that go quiet")
+    parser.add_argument("--glitches", type=float, default=0.05, help="share of walkers with one GPS glitch")
+    parser.add_argument("--poll", type=float, default=0.25, help="/risk/latest poll interval while expecting an alert")
+    parser.add_argument("--connections", type=int, default=200, help="client connection pool size")
+    parser.add_argument("--out", default=None, help="also write the JSON result here")
+    args = parser.parse_args()
+
+    api = load_api()
+    broker = InProcessBroker()
+    api.publisher = analytics.publisher = broker
+    broker.consume(analytics.LOCATION_QUEUE, analytics.on_queue_message, record_wait=True)
+    broker.consume(analytics.ALERT_QUEUE, api.on_alert_event)
+    threading.Thread(target=analytics.watchdog_inactivity_check, daemon=True).start()
+    server = make_server("127.0.0.1", 0, api.app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    stats = Stats()
+    with quiet_logging():
+        t0 = time.perf_counter()
+        asyncio.run(drive(f"http://127.0.0.1:{server.server_port}", args, stats))
+        elapsed = time.perf_counter() - t0
+        backlog = broker.backlog(analytics.LOCATION_QUEUE)
+    server.shutdown()
+
+    result = {
+        "benchmark": "load_test",
+        "config": vars(args),
+        "elapsed_s": round(elapsed, 2),
+        "throughput": {
+            "offered_fixes_per_s": round(args.walkers * args.hz, 1),
+            "achieved_fixes_per_s": round(stats.fixes_sent / max(1e-9, stats.last_fix - stats.first_fix), 1),
+            "fixes_sent": stats.fixes_sent,
+            "broker_backlog_at_end": backlog,
+        },
+        "http_status": {str(k): v for k, v in sorted(stats.status.items(), key=str)},
+        "http_ms": {endpoint: percentiles(xs) for endpoint, xs in sorted(stats.http.items())},
+        "broker_wait_ms": percentiles(broker.waits),
+        "alerts": {
+            "off_route_e2e_ms": percentiles(stats.alerts["off_route"]),
+            "off_route_detect_ms": percentiles(stats.detect),
+            "no_movement_ms": percentiles(stats.alerts["no_movement"]),
+            "missed": stats.missed,
+            "glitches": stats.glitches,
+            "glitch_false_alerts": stats.glitch_false_alerts,
+        },
+    }
+    text = json.dumps(result, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
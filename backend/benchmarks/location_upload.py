@@ -0,0 +1,102 @@
+"""Bytes and broker messages for a 30-minute walk: /update_location per fix vs /update_locations.
+
+    python -m benchmarks.location_upload
+
+One walker at 1 Hz for 30 minutes. The per-fix path posts one JSON body and
+publishes one event per fix. The batch path uploads every UPLOAD_EVERY_SEC,
+either as JSON [lon, lat, timestamp_ms] triples or as a fix_codec binary
+body, and publishes one event per upload. Sizes are HTTP bodies and broker
+message bodies (HTTP headers add a few hundred bytes per request on top).
+Then analytics consumes WALKERS such walks both ways to show handler cost.
+"""
+import base64, json, time
+
+import analytics
+from benchmarks.common import fixes_along, quiet_logging, synthetic_route
+from services.fix_codec import encode_fixes
+from services.publisher import make_event
+
+WALK_SEC = 30 * 60
+UPLOAD_EVERY_SEC = 10
+WALKERS = 20
+ROUTE_POINTS = 300
+T0 = 1_760_000_000.0
+SID = "3f2b8c1e-6a0d-4f57-9a8e-2b7c1d9e4f60"
+
+
+class NullPublisher:
+    def publish_event(self, queue, event_type, data):
+        pass
+
+
+def walk(seed=0):
+    route = synthetic_route(ROUTE_POINTS, seed=seed)
+    return route, [(lat, lon, T0 + k) for k, (lat, lon) in enumerate(fixes_along(route, WALK_SEC, seed=seed))]
+
+
+def per_fix_messages(uid, fixes):
+    bodies, events = [], []
+    for lat, lon, ts in fixes:
+        bodies.append(json.dumps({"user_id": uid, "current_location": [lon, lat],
+                                  "walking_session_id": SID, "timestamp": int(ts * 1000)}))
+        events.append(json.dumps(make_event("location.update", {
+            "user_id": uid, "lat": lat, "lon": lon, "walking_session_id": SID, "ts": ts})))
+    return bodies, events
+
+
+def batch_messages(uid, fixes):
+    json_bodies, bin_bodies, events = [], [], []
+    for i in range(0, len(fixes), UPLOAD_EVERY_SEC):
+        chunk = fixes[i:i + UPLOAD_EVERY_SEC]
+        json_bodies.append(json.dumps({"user_id": uid, "walking_session_id": SID,
+                                       "fixes": [[lon, lat, int(ts * 1000)] for lat, lon, ts in chunk]}))
+        packed = encode_fixes(chunk)
+        bin_bodies.append(packed)
+        events.append(json.dumps(make_event("location.update", {
+            "user_id": uid, "walking_session_id": SID, "fixes": base64.b64encode(packed).decode("ascii")})))
+    return json_bodies, bin_bodies, events
+
+
+def consume(started, streams):
+    analytics.active_sessions.clear()
+    analytics.publisher = NullPublisher()
+    with quiet_logging():
+        for body in started:
+            analytics.on_queue_message(None, None, None, body)
+        backlog = [s[k] for k in range(len(streams[0])) for s in streams]
+        t0 = time.perf_counter()
+        for body in backlog:
+            analytics.on_queue_message(None, None, None, body)
+        return time.perf_counter() - t0
+
+
+def main():
+    _, fixes = walk()
+    bodies, events = per_fix_messages("1", fixes)
+    json_bodies, bin_bodies, batch_events = batch_messages("1", fixes)
+
+    def size(xs):
+        return sum(len(x) for x in xs)
+
+    print(f"one {WALK_SEC // 60}-minute walk at 1 Hz ({len(fixes)} fixes), uploads every {UPLOAD_EVERY_SEC} s")
+    print(f"{'path':>26} {'requests':>9} {'HTTP KB':>9} {'broker msgs':>12} {'broker KB':>10}")
+    print(f"{'/update_location per fix':>26} {len(bodies):>9} {size(bodies) / 1e3:>9.1f} {len(events):>12} {size(events) / 1e3:>10.1f}")
+    print(f"{'/update_locations JSON':>26} {len(json_bodies):>9} {size(json_bodies) / 1e3:>9.1f} {len(batch_events):>12} {size(batch_events) / 1e3:>10.1f}")
+    print(f"{'/update_locations binary':>26} {len(bin_bodies):>9} {size(bin_bodies) / 1e3:>9.1f} {len(batch_events):>12} {size(batch_events) / 1e3:>10.1f}")
+    print(f"broker load per 1k walkers: {1000:.0f} msgs/s per fix vs {1000 / UPLOAD_EVERY_SEC:.0f} msgs/s batched")
+
+    started, per_fix, batched = [], [], []
+    for w in range(WALKERS):
+        route, fixes = walk(seed=w)
+        uid = f"u{w}"
+        started.append(json.dumps(make_event("walk.started", {"user_id": uid, "walking_session_id": SID, "route": route})))
+        per_fix.append(per_fix_messages(uid, fixes)[1])
+        batched.append(batch_messages(uid, fixes)[2])
+    t_fix, t_batch = consume(started, per_fix), consume(started, batched)
+    n = WALKERS * WALK_SEC
+    print(f"\nanalytics, {WALKERS} walks: per-fix events {n / t_fix:,.0f} fixes/s, "
+          f"batched events {n / t_batch:,.0f} fixes/s")
+
+
+if __name__ == "__main__":
+    main()
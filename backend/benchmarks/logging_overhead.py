@@ -0,0 +1,123 @@
+"""Fixes/sec with the old synchronous prints vs the queued, sampled logging.
+
+    python -m benchmarks.logging_overhead
+
+Each fix takes the same path as in production, minus the network. It is
+posted to location-api's /update_location (Flask test client, stub
+publisher), and its location.update body goes through analytics'
+on_queue_message. Output goes to a line-buffered file, so every line
+costs a write() as on a console or a container log pipe.
+
+"print" puts back what the services did before: format, then print() on
+the handling thread, for every line. The "logging" rows enqueue records
+for the writer thread. The clock stops only once that thread has written
+everything. "every fix" logs each fix line (LOG_SAMPLE_FIXES=1),
+"defaults" samples 1 in 1000, and "WARNING" turns info lines off.
+"""
+import contextlib, json, logging, os, tempfile, time
+
+import analytics
+from benchmarks.common import fixes_along, quiet_logging, synthetic_route
+from benchmarks.publisher_load import load_api
+from services.logs import SampledLogger, setup_logging, stop_logging
+from services.publisher import make_event
+
+WALKERS = 100
+FIXES_PER_WALKER = 100
+ROUNDS = 3
+
+
+class PrintLogger:
+    """What the services used to do: format and print() on the caller's thread."""
+
+    def debug(self, msg, *args):
+        print(msg % args)
+
+    info = warning = error = debug
+
+
+class NullPublisher:
+    def publish_event(self, *a):
+        return True
+
+
+def workload():
+    route = synthetic_route(300)
+    fixes = fixes_along(route, FIXES_PER_WALKER)
+    starts = [json.dumps(make_event("walk.started", {"user_id": f"u{u}", "walking_session_id": f"s{u}", "route": route}))
+              for u in range(WALKERS)]
+    posts, bodies = [], []
+    t0 = time.time()
+    for k, (lat, lon) in enumerate(fixes):
+        for u in range(WALKERS):
+            posts.append({"user_id": f"u{u}", "walking_session_id": f"s{u}", "current_location": [lon, lat]})
+            bodies.append(json.dumps(make_event("location.update", {
+                "user_id": f"u{u}", "walking_session_id": f"s{u}", "lat": lat, "lon": lon, "ts": t0 + k})))
+    return starts, posts, bodies
+
+
+@contextlib.contextmanager
+def loggers(api, mode, sample):
+    saved = [(m, n, getattr(m, n)) for m in (analytics, api) for n in ("log", "fix_log")]
+    if mode == "print":
+        for m in (analytics, api):
+            m.log = m.fix_log = PrintLogger()
+    else:
+        analytics.fix_log = SampledLogger(logging.getLogger("safewalkie.analytics.fix"), sample)
+        api.fix_log = SampledLogger(logging.getLogger("safewalkie.location_api.fix"), sample)
+    try:
+        yield
+    finally:
+        for m, n, v in saved:
+            setattr(m, n, v)
+
+
+def run(api, client, work, mode, level="INFO", sample=1000):
+    """Seconds for every fix through both services, including draining the log queue."""
+    starts, posts, bodies = work
+    analytics.active_sessions.clear()
+    analytics.session_deadlines.__init__()
+    with tempfile.TemporaryDirectory() as tmp, open(os.path.join(tmp, "out.log"), "w", buffering=1) as out, \
+            contextlib.redirect_stdout(out), loggers(api, mode, sample):
+        handler = setup_logging(level, stream=out) if mode == "logging" else None
+        for body in starts:
+            analytics.on_queue_message(None, None, None, body)
+        t0 = time.perf_counter()
+        for post, body in zip(posts, bodies):
+            client.post("/update_location", json=post)
+            analytics.on_queue_message(None, None, None, body)
+        if handler is not None:
+            stop_logging()              # writes out whatever is still queued
+        elapsed = time.perf_counter() - t0
+        out.flush()
+        with open(out.name, encoding="utf-8") as f:
+            lines = sum(1 for _ in f)
+    return elapsed, lines, handler.dropped if handler is not None else 0
+
+
+def main():
+    saved = analytics.publisher
+    analytics.publisher = NullPublisher()
+    with quiet_logging():
+        api = load_api()
+    api.publisher = NullPublisher()
+    client = api.app.test_client()
+    work = workload()
+    n = len(work[1])
+    configs = [("print (before)", "print", "INFO", 1),
+               ("logging, every fix", "logging", "INFO", 1),
+               ("logging, defaults", "logging", "INFO", analytics.LOG_SAMPLE_FIXES),
+               ("logging, WARNING", "logging", "WARNING", analytics.LOG_SAMPLE_FIXES)]
+    print(f"{WALKERS} walkers x {FIXES_PER_WALKER} fixes through location-api + analytics, best of {ROUNDS}")
+    print(f"{'mode':>20} {'fixes/s':>9} {'us/fix':>8} {'lines':>7} {'dropped':>8}")
+    try:
+        for label, mode, level, sample in configs:
+            best = min((run(api, client, work, mode, level, sample) for _ in range(ROUNDS)), key=lambda r: r[0])
+            elapsed, lines, dropped = best
+            print(f"{label:>20} {n / elapsed:>9.0f} {elapsed / n * 1e6:>8.1f} {lines:>7} {dropped:>8}")
+    finally:
+        analytics.publisher = saved
+
+
+if __name__ == "__main__":
+    main()
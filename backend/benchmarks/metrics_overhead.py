@@ -0,0 +1,171 @@
+"""Cost of the /metrics instrumentation on the hot paths, against the same code with it stripped out.
+
+    python -m benchmarks.metrics_overhead
+
+"primitives" times each piece on its own; analytics' per-fix histograms
+(perform_safety_analysis time, consumer lag) only time one fix in
+analytics.METRICS_SAMPLE_EVERY, the rest pay for Histogram.due().
+
+"fix" replays WALKERS walkers' location.update events through
+analytics.on_queue_message; "request" posts /update_location to
+location-api through Flask's test client. Each alternates CHUNK-sized runs
+with and without the instrumentation (swapped out on the "bare" side) and
+compares the totals. The "bare vs bare" rows run the same comparison with
+both sides stripped: the noise floor of this machine. Everything prints to
+/dev/null as usual. "scrape" renders analytics' /metrics afterwards.
+"""
+import contextlib, json, time
+
+import analytics
+from benchmarks.common import fixes_along, quiet_logging, synthetic_route
+from benchmarks.publisher_load import load_api
+from services.metrics import Counter, Histogram
+from services.publisher import event_age, make_event
+
+WALKERS = 200
+FIXES_PER_WALKER = 150
+REQUESTS = 4000
+CHUNK = 200
+ROUNDS = 4
+
+
+class NullMetric:
+    def due(self):
+        return False
+
+    def inc(self, *a):
+        pass
+
+    def observe(self, *a):
+        pass
+
+
+class NullPublisher:
+    def publish_event(self, *a):
+        return True
+
+
+def ns_per_call(fn, n=200_000):
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t0) / n * 1e9
+
+
+def primitives():
+    hist, counter = Histogram("h", ""), Counter("c", "", label="type")
+    event = make_event("location.update", {})
+    print(f"{'primitive':>32} {'ns':>6}")
+    for name, fn in (("perf_counter() pair", lambda: time.perf_counter() - time.perf_counter()),
+                     ("Histogram.observe", lambda: hist.observe(0.00042)),
+                     ("Counter.inc(label)", lambda: counter.inc("location.update")),
+                     ("event_age", lambda: event_age(event)),
+                     ("Histogram.due (1 in 8)", Histogram("h", "", sample_every=8).due),
+                     ("observe_event", lambda: analytics.observe_event("location.update", event))):
+        print(f"{name:>32} {ns_per_call(fn):>6.0f}")
+
+
+def fix_bodies():
+    """Every walker's walk.started, then their location.update bodies interleaved in time."""
+    starts, updates = [], []
+    route = synthetic_route(300)
+    fixes = fixes_along(route, FIXES_PER_WALKER)
+    t0 = time.time() - FIXES_PER_WALKER
+    for u in range(WALKERS):
+        starts.append(json.dumps(make_event("walk.started", {"user_id": f"u{u}", "walking_session_id": f"s{u}",
+                                                             "route": route})))
+    for k, (lat, lon) in enumerate(fixes):
+        for u in range(WALKERS):
+            updates.append(json.dumps(make_event("location.update", {
+                "user_id": f"u{u}", "walking_session_id": f"s{u}", "lat": lat, "lon": lon, "ts": t0 + k})))
+    return starts, updates
+
+
+@contextlib.contextmanager
+def stripped():
+    """analytics with the metrics calls taken out of the fix path."""
+    names = ("ANALYSIS_SECONDS", "observe_event", "ALERTS_RAISED", "ALERTS_PUBLISHED")
+    saved = {n: getattr(analytics, n) for n in names}
+    analytics.observe_event = lambda etype, event: None
+    analytics.ANALYSIS_SECONDS = analytics.ALERTS_RAISED = analytics.ALERTS_PUBLISHED = NullMetric()
+    try:
+        yield
+    finally:
+        for n, v in saved.items():
+            setattr(analytics, n, v)
+
+
+@contextlib.contextmanager
+def without_hooks(app):
+    before, after = dict(app.before_request_funcs), dict(app.after_request_funcs)
+    app.before_request_funcs = {k: [f for f in v if f.__name__ != "_start_timer"] for k, v in before.items()}
+    app.after_request_funcs = {k: [f for f in v if f.__name__ != "_record"] for k, v in after.items()}
+    try:
+        yield
+    finally:
+        app.before_request_funcs, app.after_request_funcs = before, after
+
+
+def fix_chunks(starts, updates):
+    """Restart every walk, then yield a callable per CHUNK of updates."""
+    analytics.active_sessions.clear()
+    analytics.session_deadlines.__init__()
+    for body in starts:
+        analytics.on_queue_message(None, None, None, body)
+    for i in range(0, len(updates), CHUNK):
+        yield lambda chunk=updates[i:i + CHUNK]: [analytics.on_queue_message(None, None, None, b) for b in chunk]
+
+
+def request_chunks(client):
+    body = {"user_id": "u1", "walking_session_id": "s1", "current_location": [-79.3449, 43.7637]}
+    for _ in range(REQUESTS // CHUNK):
+        yield lambda: [client.post("/update_location", json=body) for _ in range(CHUNK)]
+
+
+def interleaved(label, chunks, strip_a, strip_b):
+    """Alternate chunks between side a and side b, each run inside its strip_x() (None: as is); us per call."""
+    total, calls = [0.0, 0.0], [0, 0]
+    with quiet_logging():
+        for r in range(ROUNDS):
+            for k, run in enumerate(chunks()):
+                side = (k + r) % 2
+                strip = (strip_a, strip_b)[side]
+                with strip() if strip else contextlib.nullcontext():
+                    t0 = time.perf_counter()
+                    run()
+                    total[side] += time.perf_counter() - t0
+                calls[side] += CHUNK
+    a, b = (t / n * 1e6 for t, n in zip(total, calls))
+    print(f"{label:>26} {b:>8.1f} {a:>8.1f} {a - b:>8.2f} {(a - b) / b:>9.1%}")
+
+
+def main():
+    saved = analytics.publisher
+    analytics.publisher = NullPublisher()
+    with quiet_logging():
+        api = load_api()
+    api.publisher = NullPublisher()
+    client = api.app.test_client()
+    starts, updates = fix_bodies()
+    try:
+        primitives()
+        print()
+        print(f"{WALKERS} walkers x {FIXES_PER_WALKER} fixes, {REQUESTS} requests, "
+              f"{ROUNDS} rounds of alternating {CHUNK}-call chunks")
+        print(f"{'a vs b':>26} {'b us':>8} {'a us':>8} {'+us':>8} {'overhead':>9}")
+        interleaved("fix: bare vs bare", lambda: fix_chunks(starts, updates), stripped, stripped)
+        interleaved("fix: metrics vs bare", lambda: fix_chunks(starts, updates), None, stripped)
+        unhooked = lambda: without_hooks(api.app)
+        interleaved("request: bare vs bare", lambda: request_chunks(client), unhooked, unhooked)
+        interleaved("request: metrics vs bare", lambda: request_chunks(client), None, unhooked)
+    finally:
+        analytics.publisher = saved
+
+    t0 = time.perf_counter()
+    text = analytics.metrics.render()
+    print(f"scrape: {len(text.splitlines())} lines, {len(text) / 1024:.1f} KiB, "
+          f"{(time.perf_counter() - t0) * 1e3:.2f} ms to render")
+
+
+if __name__ == "__main__":
+    main()
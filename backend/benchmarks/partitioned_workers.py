@@ -0,0 +1,100 @@
+"""Scale-out of analytics workers over consistent-hash partitions.
+
+    python -m benchmarks.partitioned_workers
+
+Messages are routed to K partition queues exactly as location-api.py does
+(HashRing on user_id); multiprocessing queues stand in for RabbitMQ. Each
+worker process runs analytics.on_queue_message over its partition, with
+publishing stubbed out, and the aggregate fixes/sec over wall time is
+reported for 1..8 workers. Scaling is bounded by the cores available.
+"""
+import json, multiprocessing as mp, os, time
+
+from benchmarks.common import fixes_along, quiet_logging, synthetic_route
+from services.partitioning import HashRing
+
+N_USERS = 800
+FIXES_PER_USER = 50
+ROUTE_POINTS = 300
+CHUNK = 256
+WORKERS = [1, 2, 4, 8]
+
+
+def build_events():
+    events = []   # (user_id, body) in arrival order
+    streams = []
+    for u in range(N_USERS):
+        uid = f"u{u}"
+        route = synthetic_route(ROUTE_POINTS, seed=u)
+        events.append((uid, json.dumps({"type": "walk.started", "data": {
+            "user_id": uid, "walking_session_id": f"sid-{u}", "route": route}})))
+        streams.append([(uid, json.dumps({"type": "location.update", "data": {
+            "user_id": uid, "lat": lat, "lon": lon}}))
+            for lat, lon in fixes_along(route[:100], FIXES_PER_USER, seed=u)])
+    events.extend(s[k] for k in range(FIXES_PER_USER) for s in streams)
+    return events
+
+
+def worker(queue, go, done):
+    import analytics
+
+    class NullPublisher:
+        def publish_event(self, queue, event_type, data):
+            return True
+
+    analytics.publisher = NullPublisher()
+    chunks = []
+    while True:
+        chunk = queue.get()
+        if chunk is None:
+            break
+        chunks.append(chunk)
+    go.wait()
+    with quiet_logging():
+        for chunk in chunks:
+            for body in chunk:
+                analytics.on_queue_message(None, None, None, body)
+    done.put(time.perf_counter())
+
+
+def run(events, k):
+    ring = HashRing(k)
+    parts = [[] for _ in range(k)]
+    for uid, body in events:
+        parts[ring.partition(uid)].append(body)
+
+    ctx = mp.get_context("fork")
+    go, done = ctx.Event(), ctx.Queue()
+    queues = [ctx.Queue() for _ in range(k)]
+    procs = [ctx.Process(target=worker, args=(q, go, done)) for q in queues]
+    for p in procs:
+        p.start()
+    for q, bodies in zip(queues, parts):
+        for i in range(0, len(bodies), CHUNK):
+            q.put(bodies[i:i + CHUNK])
+        q.put(None)
+
+    time.sleep(0.5)            # let workers finish loading their partitions
+    t0 = time.perf_counter()
+    go.set()
+    t_end = max(done.get() for _ in procs)
+    for p in procs:
+        p.join()
+    n_fixes = N_USERS * FIXES_PER_USER
+    sizes = [len(b) for b in parts]
+    return n_fixes / (t_end - t0), max(sizes) / (sum(sizes) / k)
+
+
+def main():
+    events = build_events()
+    print(f"{N_USERS * FIXES_PER_USER} fixes from {N_USERS} walkers, {os.cpu_count()} CPU(s) available")
+    print(f"{'workers':>8} {'fixes/sec':>10} {'speedup':>8} {'max/avg partition load':>23}")
+    base = None
+    for k in WORKERS:
+        rate, skew = run(events, k)
+        base = base or rate
+        print(f"{k:>8} {rate:>10.0f} {rate / base:>8.2f} {skew:>23.2f}")
+
+
+if __name__ == "__main__":
+    main()
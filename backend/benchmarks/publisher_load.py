@@ -0,0 +1,143 @@
+"""/update_location throughput: locked per-message publish vs the QueuedPublisher thread.
+
+    python -m benchmarks.publisher_load
+
+location-api runs on a local threaded werkzeug server; N client threads post
+fixes for DURATION_SEC each. The broker is an in-process stub channel whose
+confirmation costs BROKER_RTT_MS: per message for the locked baseline (a
+shared BlockingChannel with confirms, serialized by a lock), per batch for
+QueuedPublisher. The last run stalls the broker to show the 503 backpressure
+path: requests keep being answered quickly while the buffer is full.
+"""
+import importlib.util, os, threading, time
+
+import requests
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from benchmarks.common import quiet_logging
+from services.publisher import QueuedPublisher
+
+CLIENT_THREADS = [1, 8, 64]
+DURATION_SEC = 3.0
+BROKER_RTT_MS = 2.0
+STALL_BUFFER = 200
+
+
+class StubChannel:
+    def __init__(self, stalled=False):
+        self.stalled = stalled
+        self.published = 0
+
+    def queue_declare(self, queue):
+        pass
+
+    def tx_select(self):
+        pass
+
+    def basic_publish(self, exchange, routing_key, body):
+        self.published += 1
+
+    def tx_commit(self):
+        if self.stalled:
+            threading.Event().wait()
+        time.sleep(BROKER_RTT_MS / 1e3)
+
+
+class StubConnection:
+    def __init__(self, stalled=False):
+        self.ch = StubChannel(stalled)
+
+    def channel(self):
+        return self.ch
+
+    def process_data_events(self, time_limit=0):
+        pass
+
+    def close(self):
+        pass
+
+
+class LockedPublisher:
+    """One shared channel, a lock around it, and a confirm round trip per message."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.ch = StubChannel()
+
+    def publish_event(self, queue, event_type, data):
+        with self._lock:
+            self.ch.basic_publish(exchange="", routing_key=queue, body=data)
+            time.sleep(BROKER_RTT_MS / 1e3)
+        return True
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def load_api():
+    spec = importlib.util.spec_from_file_location("location_api", os.path.join(os.path.dirname(__file__), "..", "location-api.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def drive(url, n_threads):
+    """Run n_threads clients for DURATION_SEC; return (ok, rejected, p99 ms)."""
+    ok, rejected, latencies = [0] * n_threads, [0] * n_threads, [[] for _ in range(n_threads)]
+    deadline = time.perf_counter() + DURATION_SEC
+
+    def client(i):
+        http = requests.Session()
+        body = {"user_id": i, "current_location": [-79.3449, 43.7637], "walking_session_id": f"s{i}"}
+        while True:
+            t0 = time.perf_counter()
+            if t0 > deadline:
+                break
+            r = http.post(url, json=body)
+            latencies[i].append(time.perf_counter() - t0)
+            if r.status_code == 200:
+                ok[i] += 1
+            else:
+                rejected[i] += 1
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(n_threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    lat = sorted(x for per in latencies for x in per)
+    return sum(ok), sum(rejected), lat[int(len(lat) * 0.99)] * 1e3
+
+
+def main():
+    api = load_api()
+    server = make_server("127.0.0.1", 0, api.app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/update_location"
+
+    modes = [
+        ("locked, confirm/msg", lambda: LockedPublisher()),
+        ("queued, batch commit", lambda: QueuedPublisher(connect=StubConnection)),
+    ]
+    print(f"stub broker confirm {BROKER_RTT_MS} ms, {DURATION_SEC:.0f} s per run")
+    print(f"{'publisher':>22} {'clients':>8} {'req/s':>9} {'503s':>7} {'p99 ms':>8}")
+    with quiet_logging():
+        rows = []
+        for name, make in modes:
+            for n in CLIENT_THREADS:
+                api.publisher = make()
+                ok, rejected, p99 = drive(url, n)
+                rows.append((name, n, ok / DURATION_SEC, rejected, p99))
+        api.publisher = QueuedPublisher(maxsize=STALL_BUFFER, connect=lambda: StubConnection(stalled=True))
+        ok, rejected, p99 = drive(url, 8)
+        rows.append(("queued, broker stalled", 8, ok / DURATION_SEC, rejected, p99))
+    for name, n, rps, rejected, p99 in rows:
+        print(f"{name:>22} {n:>8} {rps:>9.0f} {rejected:>7} {p99:>8.2f}")
+    print(f"\n(stalled run: buffer of {STALL_BUFFER} fills, then every request gets a 503 with Retry-After)")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
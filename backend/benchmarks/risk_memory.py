@@ -0,0 +1,100 @@
+"""latest_risk memory over a simulated day: the old unbounded dict vs RiskStore.
+
+    python -m benchmarks.risk_memory
+
+WALKS walks start uniformly over 24 h on a simulated clock. Each lasts
+20-40 minutes, raises 0-4 alerts (stored under sid and user_id, as
+on_alert_event does) and ends with /stop_walk. Memory is traced hourly.
+The dict only grows. The store levels off at the walks active within the
+last RISK_TTL_AFTER_STOP_SEC.
+"""
+import gc, heapq, random, tracemalloc, uuid
+
+from services.risk_store import RiskStore
+
+WALKS = 200_000
+USERS = 50_000
+DAY_SEC = 24 * 3600
+RISK_TTL_AFTER_STOP_SEC = 300
+
+
+class SimClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def day_events(seed=0):
+    """Time-ordered (t, kind, sid, user_id) for the whole day."""
+    rng = random.Random(seed)
+    events = []
+    for _ in range(WALKS):
+        sid, uid = str(uuid.UUID(int=rng.getrandbits(128))), str(rng.randrange(USERS))
+        start = rng.uniform(0, DAY_SEC)
+        end = start + rng.uniform(20 * 60, 40 * 60)
+        for _ in range(rng.randrange(5)):
+            events.append((rng.uniform(start, end), "alert", sid, uid))
+        events.append((end, "stop", sid, uid))
+    heapq.heapify(events)
+    return [heapq.heappop(events) for _ in range(len(events))]
+
+
+def payload(t, sid, uid):
+    return {"alert_type": "off_route", "message": "Off-route by ~52 m (>35.0 m threshold)",
+            "timestamp": f"2026-01-01T{int(t) // 3600 % 24:02d}:00:00", "user_id": uid, "walking_session_id": sid}
+
+
+def simulate(events, store_factory):
+    """Hourly (hour, MB, entries) while replaying the day."""
+    clock = SimClock()
+    store = store_factory(clock)
+    rows, next_hour = [], 3600
+    gc.collect()
+    tracemalloc.start()
+    for t, kind, sid, uid in events:
+        clock.now = t
+        while t >= next_hour:
+            rows.append((next_hour // 3600, tracemalloc.get_traced_memory()[0] / 1e6, len(store)))
+            next_hour += 3600
+        if kind == "alert":
+            p = payload(t, sid, uid)
+            store.put(sid, p)
+            store.put(uid, p)
+        else:
+            store.expire_in(sid, RISK_TTL_AFTER_STOP_SEC)
+            store.expire_in(uid, RISK_TTL_AFTER_STOP_SEC)
+    tracemalloc.stop()
+    return rows
+
+
+class DictStore:
+    """latest_risk as it was: a plain dict, written by key, never pruned."""
+
+    def __init__(self, clock):
+        self._d = {}
+
+    def put(self, key, p):
+        self._d[key] = p
+
+    def expire_in(self, key, seconds):
+        pass
+
+    def __len__(self):
+        return len(self._d)
+
+
+def main():
+    events = day_events()
+    legacy = simulate(events, DictStore)
+    bounded = simulate(events, lambda clock: RiskStore(clock=clock))
+    print(f"{WALKS} walks by {USERS} users over 24 h, {sum(e[1] == 'alert' for e in events)} alerts")
+    print(f"{'hour':>5} {'dict MB':>9} {'dict keys':>10} {'store MB':>9} {'store keys':>11}")
+    for (h, dmb, dn), (_, smb, sn) in zip(legacy, bounded):
+        if h % 3 == 0:
+            print(f"{h:>5} {dmb:>9.1f} {dn:>10} {smb:>9.1f} {sn:>11}")
+
+
+if __name__ == "__main__":
+    main()
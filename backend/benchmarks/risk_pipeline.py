@@ -0,0 +1,116 @@
+"""Per-fix cost of the risk pipeline against its budget, plus a replay of test-events.py TC-2.
+
+    python -m benchmarks.risk_pipeline
+
+Each detector is timed alone, then the whole configured pipeline, then the
+full perform_safety_analysis hot path (route matching included) on a
+ROUTE_POINTS-vertex route. The slowest walker's mean per fix must stay under
+BUDGET_US in every row.
+Walkers move at ~1.4 m/s with 1 Hz fixes and GPS noise; one in ten paces
+back and forth, so the reversal and dwell detectors do real work.
+"""
+import sys
+
+import analytics
+from benchmarks.common import fixes_along, per_call_us, quiet_logging, synthetic_route
+from services.risk_pipeline import RiskPipeline
+
+BUDGET_US = 50.0
+ROUTE_POINTS = 500
+WALKERS = 50
+FIXES_PER_WALKER = 400
+
+TC2 = [  # test-events.py TC-2 as (lon, lat), 0.8 s apart
+    (-79.344895, 43.763708), (-79.344569, 43.764680), (-79.343792, 43.764869),
+    (-79.324895, 43.763708), (-79.343197, 43.764941), (-79.342899, 43.764897),
+    (-79.342413, 43.764652),
+]
+
+
+class NullPublisher:
+    def __init__(self):
+        self.events = []
+
+    def publish_event(self, queue, event_type, data):
+        self.events.append((event_type, data))
+        return True
+
+
+def walks():
+    """[(route, [(lat, lon, ts), ...]), ...]; every tenth walker turns back and forth."""
+    out = []
+    for u in range(WALKERS):
+        route = synthetic_route(ROUTE_POINTS, seed=u)
+        part = route[: FIXES_PER_WALKER // 7]       # ~1.4 m per 1 s fix over 10 m segments
+        if u % 10 == 0:
+            part = (part[:8] + part[8::-1]) * (len(part) // 16 + 1)
+        fixes = fixes_along(part, FIXES_PER_WALKER, jitter_m=4.0, seed=u)
+        out.append((route, [(lat, lon, float(k)) for k, (lat, lon) in enumerate(fixes)]))
+    return out
+
+
+def pipeline_us(detectors, data):
+    pipeline = RiskPipeline(detectors)
+
+    def run(state, lat, lon, ts):
+        fix = pipeline.observe(state, lat, lon, ts)
+        if fix is not None:
+            fix.route_dist = 10.0
+            pipeline.score(state, fix)
+
+    worst = 0.0
+    for route, fixes in data:
+        state = pipeline.new_state()
+        worst = max(worst, per_call_us(lambda *f: run(state, *f), fixes, repeat=1))
+    return worst
+
+
+def hot_path_us(data):
+    worst = 0.0
+    for u, (route, fixes) in enumerate(data):
+        analytics._handle_walk_started({"user_id": f"b{u}", "walking_session_id": f"sid-{u}", "route": route})
+        session = analytics.active_sessions.get(f"b{u}")
+
+        def step(lat, lon, ts):
+            session.locations.append(lat, lon, ts)
+            analytics.perform_safety_analysis(f"b{u}", session)
+        worst = max(worst, per_call_us(step, fixes, repeat=1))
+    return worst
+
+
+def replay_tc2():
+    analytics._handle_walk_started({"user_id": "u2", "walking_session_id": "tc2", "route": [
+        {"lat": lat, "lon": lon} for lon, lat in TC2[:3] + TC2[4:]]})
+    session = analytics.active_sessions.get("u2")
+    accepted = []
+    for k, (lon, lat) in enumerate(TC2):
+        session.locations.append(lat, lon, k * 0.8)
+        before = session.risk.rejected
+        analytics.perform_safety_analysis("u2", session)
+        accepted.append(session.risk.rejected == before)
+    return accepted
+
+
+def main():
+    data = walks()
+    analytics.publisher = NullPublisher()
+    rows = [(f"{d.name} only", pipeline_us([d], data)) for d in analytics.risk_pipeline.detectors]
+    rows.append((f"pipeline ({len(analytics.risk_pipeline.detectors)} stages)",
+                 pipeline_us(analytics.risk_pipeline.detectors, data)))
+    with quiet_logging():
+        rows.append(("perform_safety_analysis", hot_path_us(data)))
+        analytics.publisher = NullPublisher()
+        tc2 = replay_tc2()
+    alerts = [e for e, _ in analytics.publisher.events]
+
+    print(f"{WALKERS} walkers x {FIXES_PER_WALKER} fixes, {ROUTE_POINTS}-vertex routes, budget {BUDGET_US:.0f} us/fix")
+    print(f"{'stage':>26} {'us/fix':>8} {'budget':>7}")
+    for name, us in rows:
+        print(f"{name:>26} {us:>8.2f} {'ok' if us <= BUDGET_US else 'OVER':>7}")
+    print(f"TC-2 fixes accepted: {''.join('y' if a else 'n' for a in tc2)}; alerts: {alerts or 'none'}")
+    if any(us > BUDGET_US for _, us in rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
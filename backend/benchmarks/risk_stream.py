@@ -0,0 +1,143 @@
+"""Alert delivery: /risk/latest polling vs the /risk/stream SSE endpoint.
+
+    python -m benchmarks.risk_stream [clients]
+
+location-api runs in a child process (so its CPU can be read from /proc)
+on a threaded werkzeug server. `clients` (default 5000) subscribers watch
+sessions in groups of WATCHERS_PER_SESSION, like a walker plus guardians.
+Alerts are injected through /risk_update at ALERT_RATE per second for
+DURATION_SEC. Delivery latency runs from injection to the moment a client
+sees the alert: on the stream, or on its next poll every POLL_SEC (staggered
+like independent browsers).
+"""
+import importlib.util, json, os, random, subprocess, sys, threading, time
+
+import requests
+
+CLIENTS = 5000
+WATCHERS_PER_SESSION = 3
+POLL_SEC = 3.0           # frontend/src/App.jsx poll interval
+ALERT_RATE = 20          # alerts/sec across all sessions
+DURATION_SEC = 20.0
+THREAD_STACK = 256 * 1024
+
+
+def serve():
+    """Child process: serve location-api and report the port."""
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    threading.stack_size(THREAD_STACK)
+    spec = importlib.util.spec_from_file_location("location_api", os.path.join(os.path.dirname(__file__), "..", "location-api.py"))
+    api = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(api)
+    server = make_server("127.0.0.1", 0, api.app, threaded=True, request_handler=QuietHandler)
+    server.socket.listen(4096)
+    print(f"PORT {server.server_port}", flush=True)
+    server.serve_forever()
+
+
+def cpu_seconds(pid):
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def sse_client(base, sid, seen, stop, ready):
+    http = requests.Session()
+    try:
+        with http.get(f"{base}/risk/stream", params={"sid": sid}, stream=True, timeout=60) as r:
+            ready.release()
+            for line in r.iter_lines():
+                if stop.is_set():
+                    return
+                if line.startswith(b"data: "):
+                    payload = json.loads(line[6:])
+                    seen.append(time.time() - payload["t"])
+    except requests.RequestException:
+        pass                            # server killed at the end of the run
+
+
+def poll_client(base, sid, seen, stop, ready):
+    http = requests.Session()
+    ready.release()
+    last = None
+    time.sleep(random.uniform(0, POLL_SEC))
+    while not stop.is_set():
+        t0 = time.time()
+        try:
+            payload = http.get(f"{base}/risk/latest", params={"sid": sid}, timeout=60).json()
+        except requests.RequestException:
+            return
+        if payload.get("t") is not None and payload["t"] != last:
+            last = payload["t"]
+            seen.append(time.time() - payload["t"])
+        stop.wait(max(0.0, POLL_SEC - (time.time() - t0)))
+
+
+def run(mode, n_clients):
+    child = subprocess.Popen([sys.executable, "-m", "benchmarks.risk_stream", "--serve"],
+                             stdout=subprocess.PIPE, text=True)
+    try:
+        while True:
+            line = child.stdout.readline()
+            if line.startswith("PORT "):
+                break
+        base = f"http://127.0.0.1:{line.split()[1]}"
+        sids = [f"sid-{i}" for i in range(max(1, n_clients // WATCHERS_PER_SESSION))]
+        seen, stop, ready = [], threading.Event(), threading.Semaphore(0)
+        target = sse_client if mode == "sse" else poll_client
+        threads = [threading.Thread(target=target, args=(base, sids[i % len(sids)], seen, stop, ready), daemon=True)
+                   for i in range(n_clients)]
+        for t in threads:
+            t.start()
+            time.sleep(0.0005)          # don't SYN-flood the listen queue
+        for _ in threads:
+            ready.acquire()
+        time.sleep(1.0)
+
+        http = requests.Session()
+        cpu0, t0 = cpu_seconds(child.pid), time.time()
+        sent = 0
+        while time.time() - t0 < DURATION_SEC:
+            sid = random.choice(sids)
+            http.post(f"{base}/risk_update", json={"walking_session_id": sid, "t": time.time()})
+            sent += 1
+            time.sleep(max(0.0, t0 + sent / ALERT_RATE - time.time()))
+        time.sleep(POLL_SEC + 1)        # let the last polls land
+        cpu = cpu_seconds(child.pid) - cpu0
+        wall = time.time() - t0
+        stop.set()
+        lat = sorted(seen)
+        return {
+            "mode": mode,
+            "clients": n_clients,
+            "alerts": sent,
+            "deliveries": len(lat),
+            "server_cpu_pct": 100 * cpu / wall,
+            "p50_ms": 1e3 * lat[len(lat) // 2] if lat else None,
+            "p99_ms": 1e3 * lat[int(len(lat) * 0.99)] if lat else None,
+        }
+    finally:
+        child.kill()
+        child.wait()
+
+
+def main():
+    threading.stack_size(THREAD_STACK)
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else CLIENTS
+    print(f"{n} clients, {WATCHERS_PER_SESSION} per session, {ALERT_RATE} alerts/s for {DURATION_SEC:.0f} s, polling every {POLL_SEC} s")
+    print(f"{'mode':>6} {'server CPU %':>13} {'deliveries':>11} {'p50 ms':>9} {'p99 ms':>9}")
+    for mode in ("poll", "sse"):
+        r = run(mode, n)
+        print(f"{r['mode']:>6} {r['server_cpu_pct']:>13.1f} {r['deliveries']:>11} {r['p50_ms'] or 0:>9.1f} {r['p99_ms'] or 0:>9.1f}")
+
+
+if __name__ == "__main__":
+    if "--serve" in sys.argv:
+        serve()
+    else:
+        main()
@@ -0,0 +1,95 @@
+"""walk.started with the raw route vs with the precomputed route artifact, for ROUTE_POINTS-vertex routes.
+
+    python -m benchmarks.route_artifact
+
+Two kinds of route: "streets" is what Mapbox returns (straight blocks
+densely sampled, a turn every block, sub-metre wiggle), "meander" is
+benchmarks.common.synthetic_route (turning a little every 10 m, the worst
+case for simplification). For each: the walk.started body size both ways,
+the one-off build_route_artifact cost in /start_walk, and per event the
+json.loads of the body and _handle_walk_started. "max err" is the largest
+difference in off-route distance between the simplified and the full
+route, over fixes scattered up to ~50 m around it.
+"""
+import json, math, random, time
+
+import analytics
+from benchmarks.common import M_PER_DEG_LAT, ORIGIN, quiet_logging, synthetic_route
+from services.publisher import make_event
+from services.route_artifact import build_route_artifact
+from services.route_index import RouteIndex
+
+ROUTE_POINTS = 1000
+REPEAT = 200
+SIMPLIFY_M = 2.0
+
+
+def street_route(n_points, block_m=120.0, step_m=2.0, seed=0):
+    """[{"lat", "lon"}, ...]: a grid-street walk sampled every step_m with a turn each block."""
+    rng = random.Random(seed)
+    lat, lon = ORIGIN
+    m_per_deg_lon = M_PER_DEG_LAT * math.cos(math.radians(lat))
+    heading, route, walked = 0.0, [], 0.0
+    for _ in range(n_points):
+        route.append({"lat": lat + rng.gauss(0, 0.3) / M_PER_DEG_LAT, "lon": lon + rng.gauss(0, 0.3) / m_per_deg_lon})
+        walked += step_m
+        if walked >= block_m:
+            walked, heading = 0.0, heading + rng.choice((-1, 1)) * math.pi / 2
+        lat += step_m * math.cos(heading) / M_PER_DEG_LAT
+        lon += step_m * math.sin(heading) / m_per_deg_lon
+    return route
+
+
+def per_event_us(fn):
+    t0 = time.perf_counter()
+    for _ in range(REPEAT):
+        fn()
+    return (time.perf_counter() - t0) / REPEAT * 1e6
+
+
+def measure(name, route):
+    lonlat = tuple((p["lon"], p["lat"]) for p in route)
+    t0 = time.perf_counter()
+    artifact = build_route_artifact(lonlat, SIMPLIFY_M)
+    build_ms = (time.perf_counter() - t0) * 1e3
+
+    base = {"walking_session_id": "sid", "user_id": "u1", "start_location": list(lonlat[0]),
+            "destination": list(lonlat[-1])}
+    before = json.dumps(make_event("walk.started", {**base, "route": route}))
+    after = json.dumps(make_event("walk.started", {**base, "route_artifact": artifact}))
+
+    rows = []
+    for body in (before, after):
+        parse = per_event_us(lambda: json.loads(body))
+        data = json.loads(body)["data"]
+        with quiet_logging():
+            handle = per_event_us(lambda: analytics._handle_walk_started(data))
+        rows.append((len(body), parse, handle))
+
+    full = RouteIndex(route)
+    simple = analytics.active_sessions.get("u1")._route_cache
+    rng = random.Random(1)
+    err = 0.0
+    for _ in range(2000):
+        p = route[rng.randrange(len(route))]
+        lat, lon = p["lat"] + rng.gauss(0, 25) / M_PER_DEG_LAT, p["lon"] + rng.gauss(0, 25) / M_PER_DEG_LAT
+        err = max(err, abs(full.distance(lat, lon) - simple.distance(lat, lon)))
+
+    for label, (size, parse, handle) in zip(("raw route", "artifact"), rows):
+        print(f"{name:>8} {label:>10} {size / 1024:>9.1f} {parse / 1e3:>9.2f} {handle / 1e3:>10.2f} "
+              f"{artifact['points'] if label == 'artifact' else len(route):>7} "
+              f"{build_ms if label == 'artifact' else 0:>9.1f} {err if label == 'artifact' else 0:>8.2f}")
+
+
+def main():
+    analytics.publisher = type("NullPublisher", (), {"publish_event": lambda self, *a: True})()
+    print(f"{ROUTE_POINTS}-vertex routes, simplified at {SIMPLIFY_M} m, mean of {REPEAT} events")
+    print(f"{'route':>8} {'event':>10} {'size KiB':>9} {'parse ms':>9} {'handle ms':>10} {'points':>7} "
+          f"{'build ms':>9} {'max err':>8}")
+    for name, route in (("streets", street_route(ROUTE_POINTS)), ("meander", synthetic_route(ROUTE_POINTS))):
+        analytics.active_sessions.clear()
+        measure(name, route)
+
+
+if __name__ == "__main__":
+    main()
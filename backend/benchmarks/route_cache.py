@@ -0,0 +1,109 @@
+"""Route lookup latency for /start_walk: per-request requests.get vs pooled session + RouteCache.
+
+    python -m benchmarks.route_cache
+
+A local HTTP server stands in for the Mapbox Directions API. It adds
+UPSTREAM_MS per request and HANDSHAKE_MS per new connection, the latter as a
+stand-in for TLS setup. Reports p50/p99 of the route step /start_walk
+performs (everything else in the handler is microseconds), then fires
+concurrent identical requests to show coalescing.
+"""
+import json, os, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+N_REQUESTS = 200
+UPSTREAM_MS = 40
+HANDSHAKE_MS = 30
+BURST = 32
+
+
+class StubMapbox(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    calls = 0
+
+    def setup(self):
+        time.sleep(HANDSHAKE_MS / 1e3)
+        super().setup()
+
+    def do_GET(self):
+        StubMapbox.calls += 1
+        time.sleep(UPSTREAM_MS / 1e3)
+        coords = self.path.split("/walking/")[1].split("?")[0].split(";")
+        (s_lon, s_lat), (e_lon, e_lat) = (map(float, c.split(",")) for c in coords)
+        line = [[s_lon + i / 200 * (e_lon - s_lon), s_lat + i / 200 * (e_lat - s_lat)] for i in range(201)]
+        body = json.dumps({"routes": [{"geometry": {"coordinates": line}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def trips(n, seed=0):
+    return [([-79.34 + (seed * n + i) * 1e-3, 43.76], [-79.33, 43.77 + i * 1e-3]) for i in range(n)]
+
+
+def timed(fn, pairs):
+    out = []
+    for start, end in pairs:
+        t0 = time.perf_counter()
+        fn(start, end)
+        out.append((time.perf_counter() - t0) * 1e3)
+    out.sort()
+    return out[len(out) // 2], out[int(len(out) * 0.99)]
+
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubMapbox)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ["MAPBOX_API_URL"] = f"http://127.0.0.1:{server.server_port}"
+    os.environ["MAPBOX_TOKEN"] = "stub"
+
+    import requests
+    from services import routing
+    from services.routing import RouteCache, build_mapbox_walking_route
+
+    def legacy(start, end):
+        # what location-api.py did before: a fresh connection per request, no cache
+        url = (f"{routing.MAPBOX_API_URL}/directions/v5/mapbox/walking/"
+               f"{start[0]},{start[1]};{end[0]},{end[1]}?geometries=geojson&overview=full&access_token=stub")
+        r = requests.get(url, timeout=6)
+        r.raise_for_status()
+        return r.json()["routes"][0]["geometry"]["coordinates"]
+
+    cache = RouteCache(build_mapbox_walking_route)
+    print(f"stub upstream {UPSTREAM_MS} ms + {HANDSHAKE_MS} ms per new connection, {N_REQUESTS} requests each")
+    print(f"{'mode':>30} {'p50 ms':>8} {'p99 ms':>8}")
+    for name, fn, pairs in [
+        ("legacy requests.get (cold)", legacy, trips(N_REQUESTS, 0)),
+        ("pooled + cache, cold", cache.get, trips(N_REQUESTS, 1)),
+        ("pooled + cache, warm", cache.get, trips(N_REQUESTS, 1)),
+    ]:
+        p50, p99 = timed(fn, pairs)
+        print(f"{name:>30} {p50:>8.2f} {p99:>8.2f}")
+
+    # coalescing: BURST clients start the same brand-new trip at once
+    (start, end), = trips(1, 99)
+    before = StubMapbox.calls
+    barrier = threading.Barrier(BURST)
+
+    def client():
+        barrier.wait()
+        cache.get(start, end)
+
+    threads = [threading.Thread(target=client) for _ in range(BURST)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    print(f"\n{BURST} concurrent identical requests -> {StubMapbox.calls - before} upstream call(s), "
+          f"{cache.coalesced} coalesced")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""Per-fix off-route distance cost: linear scan vs RouteIndex vs windowed tracking.
+
+    python -m benchmarks.route_index
+"""
+import time
+
+from analytics import WalkSession, match_route, nearest_point_distance
+from services.route_index import RouteIndex
+from benchmarks.common import synthetic_route, fixes_along, per_call_us
+
+SIZES = [20, 100, 500, 1000, 5000]
+N_FIXES = 500
+
+
+def main():
+    print(f"{'vertices':>9} {'build ms':>9} {'linear us/fix':>14} {'index us/fix':>13} {'tracked us/fix':>15} {'max err m':>10}")
+    for n in SIZES:
+        route = synthetic_route(n)
+        fixes = fixes_along(route, max(N_FIXES, n))   # >= 1 fix per ~10 m vertex, like a 1 Hz walker
+
+        t0 = time.perf_counter()
+        idx = RouteIndex(route)
+        build_ms = (time.perf_counter() - t0) * 1e3
+
+        sample = fixes[:: max(1, len(fixes) // N_FIXES)]
+        linear = per_call_us(lambda lat, lon: nearest_point_distance(lat, lon, route), sample, repeat=1)
+        indexed = per_call_us(idx.distance, fixes)
+
+        session = WalkSession("bench", route=route)
+        session._route_cache = idx
+        tracked = per_call_us(lambda lat, lon: match_route(session, lat, lon), fixes)
+
+        err = max(abs(idx.distance(lat, lon) - nearest_point_distance(lat, lon, route)) for lat, lon in sample)
+        print(f"{n:>9} {build_ms:>9.2f} {linear:>14.1f} {indexed:>13.1f} {tracked:>15.1f} {err:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Per-session memory: legacy list-of-dicts history vs the LocationHistory ring buffer.
+
+    python -m benchmarks.session_memory
+
+Each legacy session receives a 30-minute walk at 1 Hz; it is only built at
+1k sessions (100k would need tens of GB) and its 100k row is extrapolated
+linearly, which is exactly the problem. Ring sessions are filled until both
+rings are full, after which their size cannot change.
+"""
+import gc, time, tracemalloc
+from datetime import datetime
+
+from analytics import WalkSession, HISTORY_CAPACITY, HISTORY_ARCHIVE_CAPACITY, HISTORY_ARCHIVE_EVERY
+
+WALK_FIXES = 30 * 60
+SESSION_COUNTS = [1_000, 100_000]
+
+
+class LegacySession:
+    """WalkSession as it was: plain attributes and an unbounded list of dicts with ISO timestamps."""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.route_id = None
+        self.walking_session_id = None
+        self.route = []
+        self.start_time = datetime.utcnow()
+        self.is_active = True
+        self.locations = []
+        self.last_update = None
+        self.last_alert_time = {}
+
+
+def fill_legacy(session):
+    for i in range(WALK_FIXES):
+        session.locations.append({"lat": 43.76 + i * 1e-5, "lon": -79.34 + i * 1e-5,
+                                  "timestamp": datetime.utcnow().isoformat()})
+
+
+T0 = time.time()
+RING_FIXES = min(WALK_FIXES, HISTORY_CAPACITY + HISTORY_ARCHIVE_CAPACITY * max(1, HISTORY_ARCHIVE_EVERY))
+WALK = [(43.76 + i * 1e-5, -79.34 + i * 1e-5, T0 + i) for i in range(RING_FIXES)]
+
+
+def fill_ring(session):
+    # values are unboxed into array('d'), so sharing the float objects doesn't skew the count
+    append = session.locations.append
+    for lat, lon, ts in WALK:
+        append(lat, lon, ts)
+
+
+def measure(make, fill, n):
+    gc.collect()
+    tracemalloc.start()
+    sessions = [make(f"u{i}") for i in range(n)]
+    for s in sessions:
+        fill(s)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del sessions
+    return current / n
+
+
+def main():
+    print(f"{'sessions':>9} {'layout':>8} {'bytes/session':>14} {'total MB':>10}")
+    legacy_per = None
+    for n in SESSION_COUNTS:
+        if legacy_per is None:
+            legacy_per = measure(LegacySession, fill_legacy, n)
+            note = ""
+        else:
+            note = "  (extrapolated)"
+        print(f"{n:>9} {'legacy':>8} {legacy_per:>14.0f} {legacy_per * n / 1e6:>10.1f}{note}")
+        ring_per = measure(WalkSession, fill_ring, n)
+        print(f"{n:>9} {'ring':>8} {ring_per:>14.0f} {ring_per * n / 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
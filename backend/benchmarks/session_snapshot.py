@@ -0,0 +1,126 @@
+"""Restart cost: restore active_sessions from a snapshot vs rebuilding it from replayed events.
+
+    python -m benchmarks.session_snapshot
+
+Fills the store with SESSIONS walks (ROUTE_POINTS-vertex routes, FIXES
+fixes each, one in five stopped and waiting for eviction), then times
+take_snapshot() (how long handlers are paused, and the total including the
+fsync'd write), the file size, and restore_snapshot() into an empty process
+state. "replay" is the alternative without snapshots: re-handling each
+session's walk.started and location.update events, timed on REPLAY_SAMPLE
+sessions and scaled up.
+"""
+import json, os, random, tempfile, time
+from array import array
+
+import analytics
+from benchmarks.common import fixes_along, quiet_logging, synthetic_route
+from services.session_snapshot import PackedRoute
+
+SESSIONS = 100_000
+ROUTE_POINTS = 100
+FIXES = 64
+REPLAY_SAMPLE = 2_000
+
+
+def fill(routes):
+    now = time.time()
+    for u in range(SESSIONS):
+        uid = f"user-{u}"
+        session = analytics.active_sessions.get_or_create(uid, analytics.WalkSession)
+        route, fixes = routes[u % len(routes)]
+        session.walking_session_id = f"sid-{u}"
+        session.route = PackedRoute(route)
+        for k, (lat, lon) in enumerate(fixes):
+            session.locations.append(lat, lon, now - FIXES + k)
+        session.last_update = analytics.datetime.utcnow()
+        session._last_seg_idx, session._last_seg_t = FIXES // 7, 0.5
+        session.alerts = analytics.alert_coalescer.new_state()
+        analytics.alert_coalescer.raise_alert(session.alerts, "off_route", 2, {"user_id": uid, "message": "Off route"})
+        if u % 5 == 0:
+            session.is_active = False
+            analytics.session_deadlines.schedule_in(uid, analytics.SESSION_EVICT_GRACE_SEC, "evict")
+        else:
+            analytics._arm_inactivity(uid)
+
+
+def alert_summary(session):
+    """AlertState contents a restore must keep (times only move by the restore's own delay)."""
+    st = session.alerts
+    return (st.severity, st.merged, round(st.bucket.tokens, 6),
+            {t: (a[0], a[1]) for t, a in st.active.items()}) if st is not None else None
+
+
+def reset():
+    analytics.active_sessions.clear()
+    analytics.session_deadlines = type(analytics.session_deadlines)()
+
+
+def replay_us(routes):
+    """us per session to rebuild it by handling its events again."""
+    events = []
+    for u in range(REPLAY_SAMPLE):
+        route, fixes = routes[u % len(routes)]
+        points = [{"lat": route[k], "lon": route[k + 1]} for k in range(0, len(route), 2)]
+        events.append(("walk.started", {"user_id": f"user-{u}", "walking_session_id": f"sid-{u}", "route": points}))
+        events += [("location.update", {"user_id": f"user-{u}", "lat": lat, "lon": lon, "ts": 1e9 + k})
+                   for k, (lat, lon) in enumerate(fixes)]
+    bodies = [json.dumps({"type": t, "data": d}) for t, d in events]
+    reset()
+    with quiet_logging():
+        t0 = time.perf_counter()
+        for body in bodies:
+            analytics.on_queue_message(None, None, None, body)
+        return (time.perf_counter() - t0) / REPLAY_SAMPLE * 1e6
+
+
+def main():
+    analytics.publisher = type("NullPublisher", (), {"publish_event": lambda self, *a: True})()
+    routes = []
+    for seed in range(200):
+        pts = synthetic_route(ROUTE_POINTS, seed=seed)
+        routes.append((array("d", [v for p in pts for v in (p["lat"], p["lon"])]),
+                       fixes_along(pts[:FIXES // 7 + 2], FIXES, seed=seed)))
+    rng = random.Random(0)
+    rng.shuffle(routes)
+
+    reset()
+    fill(routes)
+    sample = {uid: analytics.active_sessions.get(uid) for uid in (f"user-{u}" for u in range(0, SESSIONS, 997))}
+    expected = {uid: (s.walking_session_id, s.is_active, len(s.route), s.locations.tail(3), alert_summary(s))
+                for uid, s in sample.items()}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "sessions.snap")
+        with quiet_logging():
+            t0 = time.perf_counter()
+            analytics.take_snapshot(path)
+        total_ms = (time.perf_counter() - t0) * 1e3
+        t0 = time.perf_counter()
+        with analytics.snapshot_gate.paused():
+            for user_id, session in analytics.active_sessions.snapshot():
+                analytics.dump_session(session, 0.0, None, analytics.SNAPSHOT_FIXES, 0.0)
+        capture_ms = (time.perf_counter() - t0) * 1e3
+        size_mb = os.path.getsize(path) / 1e6
+
+        reset()
+        t0 = time.perf_counter()
+        restored = analytics.restore_snapshot(path)
+        restore_ms = (time.perf_counter() - t0) * 1e3
+
+    got = {uid: analytics.active_sessions.get(uid) for uid in expected}
+    ok = restored == SESSIONS and all(
+        (s.walking_session_id, s.is_active, len(s.route), s.locations.tail(3), alert_summary(s)) == expected[uid]
+        for uid, s in got.items())
+    pending = len(analytics.session_deadlines)
+    replay = replay_us(routes)
+
+    print(f"{SESSIONS} sessions, {ROUTE_POINTS}-vertex routes, last {analytics.SNAPSHOT_FIXES} of {FIXES} fixes kept")
+    print(f"snapshot: handlers paused {capture_ms:.0f} ms, total with write {total_ms:.0f} ms, {size_mb:.1f} MB")
+    print(f"restore:  {restore_ms:.0f} ms ({restore_ms / SESSIONS * 1e3:.1f} us/session), "
+          f"{pending} deadlines re-armed, sample {'matches' if ok else 'DIFFERS'}")
+    print(f"replay:   {replay * SESSIONS / 1e6:.1f} s estimated ({replay:.0f} us/session over {REPLAY_SAMPLE})")
+
+
+if __name__ == "__main__":
+    main()
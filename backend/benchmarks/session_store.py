@@ -0,0 +1,78 @@
+"""Stress test for SessionStore: threads hammering get_or_create + per-user updates.
+
+    python -m benchmarks.session_store
+
+Each worker picks random users, takes the user's shard lock, get-or-creates
+the session and does a read-modify-write on it (like publishing an alert does),
+while a watchdog-style thread keeps taking snapshots. Afterwards it checks
+that no update was lost and no session was created twice, and reports
+throughput and how often a lock acquisition had to wait.
+"""
+import random, sys, threading, time
+
+from analytics import WalkSession
+from services.session_store import SessionStore
+
+USERS = 10_000
+OPS_PER_THREAD = 50_000
+THREADS = [1, 2, 4, 8]
+SHARDS = [1, 16, 64]
+
+
+def run(n_threads, n_shards):
+    store = SessionStore(shards=n_shards)
+    created = []
+    contended = [0] * n_threads
+    stop = threading.Event()
+
+    def factory(user_id):
+        created.append(user_id)
+        return WalkSession(user_id)
+
+    def worker(w):
+        rng = random.Random(w)
+        for _ in range(OPS_PER_THREAD):
+            user_id = f"u{rng.randrange(USERS)}"
+            lock = store.lock(user_id)
+            if not lock.acquire(blocking=False):
+                contended[w] += 1
+                lock.acquire()
+            try:
+                session = store.get_or_create(user_id, factory)
+                session.remaining_m = (session.remaining_m or 0) + 1     # any plain slot will do as a counter
+            finally:
+                lock.release()
+
+    def watchdog():
+        while not stop.wait(0.01):
+            store.snapshot()
+
+    threads = [threading.Thread(target=worker, args=(w,)) for w in range(n_threads)]
+    wd = threading.Thread(target=watchdog)
+    wd.start()
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    wd.join()
+
+    total = n_threads * OPS_PER_THREAD
+    counted = sum(s.remaining_m or 0 for _, s in store.snapshot())
+    ok = counted == total and len(created) == len(set(created)) == len(store)
+    return total / elapsed, sum(contended) / total * 100, ok
+
+
+def main():
+    sys.setswitchinterval(1e-5)     # switch threads often to shake out races
+    print(f"{'threads':>8} {'shards':>7} {'ops/sec':>10} {'contended %':>12} {'consistent':>11}")
+    for n_threads in THREADS:
+        for n_shards in SHARDS:
+            rate, contention, ok = run(n_threads, n_shards)
+            print(f"{n_threads:>8} {n_shards:>7} {rate:>10.0f} {contention:>12.2f} {str(ok):>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Walk history store: ingest rate against a 10k fixes/s stream, and the latency of reading back a 1-hour walk.
+
+    python -m benchmarks.trajectory_store
+
+Ingest: WALKERS walkers at 1 Hz (RATE fixes per simulated second) for
+INGEST_SEC simulated seconds. Every simulated second all its fixes are
+append()ed, then flush() writes walks buffered for FLUSH_SEC, as the
+analytics writer thread does. "capacity" is fixes per second of real CPU
+time; it must beat RATE for the store to keep up. Size is bytes on disk per
+fix, SQLite overhead included (raw lat, lon, ts doubles are 24).
+
+Query: QUERY_USERS more walkers each record a full hour, then each whole
+walk is fetched QUERY_REPEAT times with query() and timed.
+"""
+import os, random, statistics, tempfile, time
+
+from benchmarks.common import synthetic_route, fixes_along
+from services.trajectory_store import TrajectoryStore
+
+RATE = 10_000
+WALKERS = RATE
+INGEST_SEC = 300
+FLUSH_SEC = 60
+QUERY_USERS = 20
+QUERY_REPEAT = 10
+WALK_SEC = 3600
+T0 = 1_760_004_000.0        # 10:00 UTC, so the hour-long walks stay inside one day
+
+
+class SimClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def tracks(n, length, seed):
+    """n walkers' (lat, lon) samples, one per second."""
+    out = []
+    for u in range(n):
+        route = synthetic_route(length // 7 + 2, seed=seed + u)
+        out.append(fixes_along(route, length, jitter_m=4.0, seed=seed + u))
+    return out
+
+
+def dir_bytes(root):
+    return sum(os.path.getsize(os.path.join(root, f)) for f in os.listdir(root))
+
+
+def main():
+    shapes = tracks(200, INGEST_SEC, seed=0)
+    hours = tracks(QUERY_USERS, WALK_SEC, seed=1000)
+    rng = random.Random(0)
+    offsets = [rng.uniform(-0.01, 0.01) for _ in range(WALKERS)]
+
+    with tempfile.TemporaryDirectory() as root:
+        clock = SimClock()
+        store = TrajectoryStore(root, clock=clock)
+        append_s = flush_s = 0.0
+        for t in range(INGEST_SEC):
+            clock.now = float(t)
+            ts = T0 + t
+            t0 = time.perf_counter()
+            for u in range(WALKERS):
+                lat, lon = shapes[u % len(shapes)][t]
+                store.append(f"user-{u}", f"sid-{u}", lat + offsets[u], lon, ts)
+            t1 = time.perf_counter()
+            store.flush(FLUSH_SEC)
+            flush_s += time.perf_counter() - t1
+            append_s += t1 - t0
+        for u in range(WALKERS):
+            store.end_session(f"user-{u}", f"sid-{u}")
+        t1 = time.perf_counter()
+        store.flush()
+        flush_s += time.perf_counter() - t1
+        total = WALKERS * INGEST_SEC
+        size = dir_bytes(root)
+
+        for u, fixes in enumerate(hours):
+            for k, (lat, lon) in enumerate(fixes):
+                store.append(f"hour-{u}", f"walk-{u}", lat, lon, T0 + k)
+            store.end_session(f"hour-{u}", f"walk-{u}")
+        store.flush()
+        store.close()
+
+        reader = TrajectoryStore(root)
+        latencies, ok = [], True
+        for _ in range(QUERY_REPEAT):
+            for u, fixes in enumerate(hours):
+                t0 = time.perf_counter()
+                got = reader.query(f"hour-{u}", T0, T0 + WALK_SEC)
+                latencies.append((time.perf_counter() - t0) * 1e3)
+                ok = ok and len(got) == WALK_SEC and abs(got[-1][0] - fixes[-1][0]) < 1e-6
+        walks = reader.sessions("hour-0", T0, T0 + WALK_SEC)
+        reader.close()
+
+    cpu = append_s + flush_s
+    print(f"ingest: {total} fixes from {WALKERS} walkers ({RATE}/s for {INGEST_SEC} s), flushed every {FLUSH_SEC} s")
+    print(f"  append {append_s / total * 1e6:.2f} us/fix, flush {flush_s / total * 1e6:.2f} us/fix, "
+          f"capacity {total / cpu:,.0f} fixes/s ({RATE * cpu / total:.0%} of a core at {RATE}/s)")
+    print(f"  on disk {size / 1e6:.1f} MB, {size / total:.1f} bytes/fix")
+    latencies.sort()
+    print(f"query: 1-hour walk ({WALK_SEC} fixes) x {len(latencies)}: p50 {statistics.median(latencies):.2f} ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99) - 1]:.2f} ms, max {latencies[-1]:.2f} ms, "
+          f"{'round-trips' if ok else 'MISMATCH'}; sessions() -> {len(walks)} walk, {walks[0][3]} fixes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Inactivity watchdog: periodic full scan vs DeadlineScheduler.
+
+    python -m benchmarks.watchdog
+
+Reports the CPU cost of one legacy scan tick and of the per-fix deadline
+update at several session counts, and how late idle deadlines are detected.
+"""
+import threading, time
+from datetime import datetime, timedelta
+
+from analytics import WalkSession, INACTIVITY_THRESHOLD_SEC
+from services.deadlines import DeadlineScheduler
+
+SESSION_COUNTS = [1_000, 10_000, 50_000]
+LATENCY_KEYS = 2_000
+WATCHDOG_INTERVAL_SEC = 5          # the old scan period
+
+
+def legacy_tick(sessions, now):
+    """One pass of the old watchdog loop (alerting left out)."""
+    idle_users = []
+    for user_id, session in list(sessions.items()):
+        if not session.is_active or not session.last_update:
+            continue
+        idle = (now - session.last_update).total_seconds()
+        if idle > INACTIVITY_THRESHOLD_SEC:
+            idle_users.append(user_id)
+    return idle_users
+
+
+def scan_cost(n):
+    now = datetime.utcnow()
+    sessions = {}
+    for i in range(n):
+        s = WalkSession(f"u{i}")
+        s.last_update = now - timedelta(seconds=i % 20)
+        s.is_active = i % 3 != 0          # stopped sessions are never removed today
+        sessions[s.user_id] = s
+    t0 = time.perf_counter()
+    legacy_tick(sessions, now)
+    return (time.perf_counter() - t0) * 1e3
+
+
+def schedule_cost(n, updates=200_000):
+    sched = DeadlineScheduler()
+    for i in range(n):
+        sched.schedule_in(f"u{i}", INACTIVITY_THRESHOLD_SEC)
+    keys = [f"u{i % n}" for i in range(updates)]
+    t0 = time.perf_counter()
+    for k in keys:
+        sched.schedule_in(k, INACTIVITY_THRESHOLD_SEC)
+    return (time.perf_counter() - t0) / updates * 1e6
+
+
+def detection_latency():
+    sched = DeadlineScheduler()
+    lateness = []
+
+    def watchdog():
+        while len(lateness) < LATENCY_KEYS:
+            due = sched.wait_due()
+            now = time.monotonic()
+            lateness.extend(now - deadline for _, _, deadline in due)
+
+    th = threading.Thread(target=watchdog, daemon=True)
+    th.start()
+    start = time.monotonic()
+    for i in range(LATENCY_KEYS):
+        sched.schedule(f"u{i}", start + 0.2 + (i % 1000) * 0.002)
+    th.join(timeout=10)
+    lateness.sort()
+    return lateness[len(lateness) // 2] * 1e3, lateness[int(len(lateness) * 0.99)] * 1e3
+
+
+def main():
+    print(f"{'sessions':>9} {'scan ms/tick':>13} {'scan ms/sec':>12} {'deadline us/fix':>16}")
+    for n in SESSION_COUNTS:
+        scan = scan_cost(n)
+        print(f"{n:>9} {scan:>13.2f} {scan / WATCHDOG_INTERVAL_SEC:>12.2f} {schedule_cost(n):>16.2f}")
+
+    p50, p99 = detection_latency()
+    legacy_mean = WATCHDOG_INTERVAL_SEC / 2 * 1e3
+    print(f"\nidle detection lateness: scheduler p50 {p50:.2f} ms, p99 {p99:.2f} ms "
+          f"(full scan: uniform 0..{WATCHDOG_INTERVAL_SEC * 1e3:.0f} ms, mean {legacy_mean:.0f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,38 +1,101 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 import pika
 import json
-from datetime import datetime
 import uuid
-import os, math, requests, threading, time
+import base64, functools, logging, os, math, threading, time
 from dotenv import load_dotenv, find_dotenv
 
 load_dotenv(find_dotenv())
 
+from services.alert_stream import AlertHub
+from services.fix_codec import TooManyFixes, decode_fixes, encode_fixes
+from services.logs import SampledLogger, setup_logging
+from services.metrics import LAG_BUCKETS, Registry, instrument_flask
+from services.partitioning import LOCATION_PARTITIONS, HashRing, partition_queue
+from services.publisher import QueuedPublisher, event_age
+from services.risk_store import RiskStore
+from services.route_artifact import build_route_artifact
+from services.routing import RouteCache, build_mapbox_walking_route, build_straight_route
+from services.trajectory_store import TrajectoryStore
+
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
+# Bodies over this are refused with 413 before anything reads them. An hour
+# of fixes is ~20 KB packed and ~200 KB as JSON.
+app.config["MAX_CONTENT_LENGTH"] = int(os.environ.get("MAX_UPLOAD_BYTES", str(1 << 20)))
+
+@app.before_request
+def _refuse_oversized():
+    # Flask only enforces MAX_CONTENT_LENGTH when the body is read, and the
+    # handlers' get_json() fallbacks would turn that into a 400
+    if (request.content_length or 0) > app.config["MAX_CONTENT_LENGTH"]:
+        return jsonify({"error": "Request body too large"}), 413
+
+# Logging goes through a queue to one writer thread (set up in __main__), so
+# handlers never wait on stdout. Per-fix publish lines are sampled.
+LOG_SAMPLE_FIXES = int(os.environ.get("LOG_SAMPLE_FIXES", "1000"))   # log 1 fix in N (1 = all)
+
+log = logging.getLogger("safewalkie.location_api")
+fix_log = SampledLogger(logging.getLogger("safewalkie.location_api.fix"), LOG_SAMPLE_FIXES)
+
+# ------------------------------
+# Metrics: GET /metrics (Prometheus text format), per-route latency included
+# ------------------------------
+metrics = Registry()
+instrument_flask(app, metrics, "location_api")
+PUBLISH_SECONDS = metrics.histogram("location_api_publish_seconds", "publish() to broker commit, oldest message of each batch",
+                                    LAG_BUCKETS)
+ROUTE_POINTS = metrics.histogram("location_api_route_points", "Route vertices per /start_walk, before simplification",
+                                 (10, 30, 100, 300, 1000, 3000, 10000))
+ALERTS_RECEIVED = metrics.counter("location_api_alerts_total", "Alerts consumed from alert_events by type", label="type")
+ALERT_LAG_SECONDS = metrics.histogram("location_api_alert_lag_seconds", "Alert timestamp to consumption here", LAG_BUCKETS)
+metrics.counter_fn("location_api_published_total", "Events committed to RabbitMQ", lambda: publisher.published)
+metrics.counter_fn("location_api_publish_retries_total", "Failed publish batches retried", lambda: publisher.retries)
+metrics.counter_fn("location_api_publish_rejected_total", "Events refused with the buffer full (503s)", lambda: publisher.rejected)
+metrics.gauge("location_api_publish_pending", "Events waiting for the publisher thread", lambda: publisher.pending())
+metrics.counter_fn("location_api_route_cache_total", "Route lookups by outcome", lambda: {
+    "hit": route_cache.hits, "miss": route_cache.misses, "coalesced": route_cache.coalesced}, label="outcome")
+metrics.gauge("location_api_risk_entries", "Entries in latest_risk", lambda: len(latest_risk))
+metrics.gauge("location_api_stream_subscribers", "Open /risk/stream connections", lambda: alert_hub.subscriber_count())
+
 # ------------------------------
 # RabbitMQ Setup
 # ------------------------------
-connection = pika.BlockingConnection(pika.ConnectionParameters("localhost"))
-channel = connection.channel()
-channel.queue_declare(queue="location_updates")
-channel.queue_declare(queue="alert_events")
+# Flask handler threads only enqueue; one publisher thread owns the connection
+# and commits batches. If the buffer fills (broker slow or down) the endpoints
+# answer 503 instead of piling up memory.
+PUBLISH_BUFFER = int(os.environ.get("PUBLISH_BUFFER_SIZE", "10000"))
+PUBLISH_RETRY_AFTER_SEC = 1
+
+publisher = QueuedPublisher(
+    pika.ConnectionParameters("localhost"),
+    declare=[partition_queue("location_updates", p) for p in range(LOCATION_PARTITIONS)] + ["alert_events"],
+    maxsize=PUBLISH_BUFFER,
+    on_commit=lambda n, waited: PUBLISH_SECONDS.observe(waited),
+)
+
+# A user's walk.started / location.update / walk.stopped all land on the same
+# partition, so one analytics worker owns that user's session state.
+location_ring = HashRing(LOCATION_PARTITIONS)
 
 def publish_event(event_type, data):
-    """Helper function to publish messages to RabbitMQ"""
-    event = {
-        "type": event_type,
-        "timestamp": datetime.utcnow().isoformat(),
-        "data": data
-    }
-    channel.basic_publish(
-        exchange='',
-        routing_key='location_updates',
-        body=json.dumps(event)
-    )
-    print(f"[x] Published event: {event}")
+    """Helper function to publish messages to RabbitMQ; False if the publish buffer is full"""
+    queue = partition_queue("location_updates", location_ring.partition(data["user_id"]))
+    if not publisher.publish_event(queue, event_type, data):
+        log.warning("[!] Publish buffer full, rejecting %s for user %s", event_type, data["user_id"])
+        return False
+    if event_type == "location.update":
+        fix_log.info("[x] Published event: %s %s", event_type, data)
+    else:
+        log.info("[x] Published event: %s %s", event_type, data)
+    return True
+
+def busy_response():
+    resp = jsonify({"error": "Server busy, retry shortly"})
+    resp.headers["Retry-After"] = str(PUBLISH_RETRY_AFTER_SEC)
+    return resp, 503
 
 #-------------------------------
 # Helpers
@@ -53,33 +116,34 @@ def validate_point(obj, key):
         return False, f"Invalid '{key}': lon in [-180,180], lat in [-90,90]"
     return True, [lon, lat]
 
+MIN_FIX_TIME = 946684800            # 2000-01-01: anything earlier is a unit or clock bug
+MAX_FIX_CLOCK_SKEW_SEC = 86400      # fixes may be stamped at most this far in the future
+
+def valid_fix_time(ts):
+    """ts (epoch seconds) is finite and plausible for a fix just taken or recently buffered."""
+    return math.isfinite(ts) and MIN_FIX_TIME <= ts <= time.time() + MAX_FIX_CLOCK_SKEW_SEC
+
 # ----- routing (walking) -----
-def build_mapbox_walking_route(start, end):
-    token = os.environ.get("MAPBOX_TOKEN", "")
-    if not token:
-        raise RuntimeError("MAPBOX_TOKEN not set")
-    s_lon, s_lat = start
-    e_lon, e_lat = end
-    url = (
-        "https://api.mapbox.com/directions/v5/mapbox/walking/"
-        f"{s_lon},{s_lat};{e_lon},{e_lat}"
-        f"?geometries=geojson&overview=full&access_token={token}"
-    )
-    r = requests.get(url, timeout=6)
-    r.raise_for_status()
-    data = r.json()
-    routes = data.get("routes") or []
-    if not routes:
-        raise RuntimeError("No walking route from Mapbox")
-    return routes[0]["geometry"]["coordinates"]
-
-def build_straight_route(start, end, steps=30):
-    s_lon, s_lat = start
-    e_lon, e_lat = end
-    return [
-        [s_lon + (i/steps)*(e_lon - s_lon), s_lat + (i/steps)*(e_lat - s_lat)]
-        for i in range(steps + 1)
-    ]
+# Repeat trips (same start/end within ~10 m) skip Mapbox entirely; set
+# ROUTE_CACHE_DB to a file path to keep the cache across restarts.
+route_cache = RouteCache(
+    build_mapbox_walking_route,
+    maxsize=int(os.environ.get("ROUTE_CACHE_SIZE", "2048")),
+    ttl=int(os.environ.get("ROUTE_CACHE_TTL_SEC", str(24 * 3600))),
+    db_path=os.environ.get("ROUTE_CACHE_DB") or None,
+)
+
+# walk.started carries a precomputed route artifact (simplified polyline,
+# projection, cumulative distances, segment grid) instead of the raw route,
+# so analytics does no geometry work per walk. Simplification keeps every
+# dropped vertex within ROUTE_SIMPLIFY_M of the route; keep it well under
+# analytics' 35 m off-route threshold.
+ROUTE_SIMPLIFY_M = float(os.environ.get("ROUTE_SIMPLIFY_M", "2.0"))
+
+@functools.lru_cache(maxsize=256)
+def route_artifact(route):
+    """build_route_artifact for a route as a tuple of (lon, lat); repeat trips reuse it."""
+    return build_route_artifact(route, ROUTE_SIMPLIFY_M)
 
 # ------------------------------
 # Flask Routes
@@ -118,25 +182,24 @@ def start_walk():
 
     # server computes the walking route
     try:
-        route = build_mapbox_walking_route(start, end)
+        route = route_cache.get(start, end)
     except Exception as e:
-        print(f"[!] Mapbox routing failed: {e}, using straight line")
+        log.warning("[!] Mapbox routing failed: %s, using straight line", e)
         route = build_straight_route(start, end, steps=30)
 
     # Ensure array-of-arrays in JSON (not tuples)
     route = [[float(p[0]), float(p[1])] for p in route]
-
-    # Convert route from [lon, lat] to {"lat": lat, "lon": lon} format for analytics
-    route_for_analytics = [{"lon": p[0], "lat": p[1]} for p in route]
+    ROUTE_POINTS.observe(len(route))
 
     # Publish event for analytics consumer
-    publish_event("walk.started", {
+    if not publish_event("walk.started", {
         "walking_session_id": walking_session_id,
         "user_id": str(user_id),
         "start_location": start,
         "destination": end,
-        "route": route_for_analytics,
-    })
+        "route_artifact": route_artifact(tuple(map(tuple, route))),
+    }):
+        return busy_response()
 
     # Respond to FE
     return jsonify({
@@ -165,10 +228,14 @@ def stop_walk():
     if not walking_session_id:
         return jsonify({"error": "Missing 'walking_session_id'"}), 400
 
-    publish_event("walk.stopped", {
+    if not publish_event("walk.stopped", {
         "walking_session_id": walking_session_id,
         "user_id": str(user_id)
-    })
+    }):
+        return busy_response()
+
+    latest_risk.expire_in(walking_session_id, RISK_TTL_AFTER_STOP_SEC)
+    latest_risk.expire_in(str(user_id), RISK_TTL_AFTER_STOP_SEC)
 
     return jsonify({"message": "Walk stopped"}), 200
 
@@ -180,7 +247,8 @@ def update_location():
     {
         "user_id": 1,
         "current_location": [lon, lat],
-        "walking_session_id": "<uuid>" (optional)
+        "walking_session_id": "<uuid>" (optional),
+        "timestamp": <epoch ms when the fix was taken> (optional)
     }
     """
     try:
@@ -208,43 +276,217 @@ def update_location():
     if not (-180 <= lon <= 180 and -90 <= lat <= 90):
         return jsonify({"error": "current_location out of bounds"}), 400
 
-    # Publish event to RabbitMQ in the format expected by analytics service
-    publish_event("location.update", {
+    event = {
         "user_id": str(user_id),
         "lat": lat,
         "lon": lon,
         "walking_session_id": data.get("walking_session_id")
-    })
+    }
+    if data.get("timestamp") is not None:
+        try:
+            event["ts"] = float(data["timestamp"]) / 1000
+        except (TypeError, ValueError):
+            return jsonify({"error": "timestamp must be epoch milliseconds"}), 400
+        if not valid_fix_time(event["ts"]):
+            return jsonify({"error": "timestamp out of range"}), 400
+    else:
+        event["ts"] = time.time()   # receipt time, so a queue backlog doesn't skew speeds in analytics
+
+    # Publish event to RabbitMQ in the format expected by analytics service
+    if not publish_event("location.update", event):
+        return busy_response()
 
     return jsonify({"status": "queued", "message": "Location update sent to queue"}), 200
 
-latest_risk = {}  # sid -> update dict
+MAX_FIXES_PER_UPLOAD = 3600     # an hour at 1 Hz
+
+def parse_fix_list(raw):
+    """[[lon, lat, timestamp_ms], ...] -> [(lat, lon, epoch_seconds), ...]"""
+    if not isinstance(raw, list):
+        raise ValueError("fixes must be an array of [lon, lat, timestamp_ms]")
+    if len(raw) > MAX_FIXES_PER_UPLOAD:
+        raise TooManyFixes(f"At most {MAX_FIXES_PER_UPLOAD} fixes per upload")
+    fixes = []
+    for item in raw:
+        if not (isinstance(item, (list, tuple)) and len(item) == 3):
+            raise ValueError("each fix must be [lon, lat, timestamp_ms]")
+        try:
+            lon, lat, ts = float(item[0]), float(item[1]), float(item[2]) / 1000
+        except (TypeError, ValueError):
+            raise ValueError("lon, lat and timestamp must be numbers") from None
+        fixes.append((lat, lon, ts))
+    return fixes
+
+@app.route('/update_locations', methods=['POST'])
+def update_locations():
+    """
+    Several fixes recorded on the client, published to analytics as one event.
+    JSON body:
+    {
+        "user_id": 1,
+        "walking_session_id": "<uuid>" (optional),
+        "fixes": [[lon, lat, timestamp_ms], ...]
+    }
+    Or Content-Type: application/octet-stream with ?user_id=...&walking_session_id=...
+    and a body packed by services/fix_codec.encode_fixes.
+    """
+    try:
+        if request.mimetype == "application/octet-stream":
+            user_id = request.args.get("user_id")
+            walking_session_id = request.args.get("walking_session_id")
+            fixes = decode_fixes(request.get_data(), MAX_FIXES_PER_UPLOAD)
+        else:
+            try:
+                data = request.get_json(force=True, silent=False)
+            except Exception:
+                return jsonify({"error": "Invalid JSON"}), 400
+            user_id = data.get("user_id")
+            walking_session_id = data.get("walking_session_id")
+            fixes = parse_fix_list(data.get("fixes"))
+    except TooManyFixes as e:
+        return jsonify({"error": str(e)}), 413
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if user_id is None:
+        return jsonify({"error": "Missing 'user_id'"}), 400
+    if not fixes:
+        return jsonify({"error": "No fixes"}), 400
+    for lat, lon, ts in fixes:
+        if not (valid_fix_time(ts) and -180 <= lon <= 180 and -90 <= lat <= 90):
+            return jsonify({"error": "fix out of bounds"}), 400
+
+    if not publish_event("location.update", {
+        "user_id": str(user_id),
+        "walking_session_id": walking_session_id,
+        "fixes": base64.b64encode(encode_fixes(fixes)).decode("ascii"),
+    }):
+        return busy_response()
+
+    return jsonify({"status": "queued", "fixes": len(fixes)}), 200
+
+# sid / user_id -> latest alert payload. Bounded and expiring: entries go
+# RISK_TTL_AFTER_STOP_SEC after /stop_walk, or after RISK_IDLE_TTL_SEC without alerts.
+RISK_TTL_AFTER_STOP_SEC = int(os.environ.get("RISK_TTL_AFTER_STOP_SEC", "300"))
+latest_risk = RiskStore(
+    maxsize=int(os.environ.get("RISK_STORE_MAX", "100000")),
+    idle_ttl=int(os.environ.get("RISK_IDLE_TTL_SEC", str(2 * 3600))),
+)
+
+# Live alert fan-out for /risk/stream: a walker and their guardians watching
+# the same sid share one topic. Heartbeats keep proxies from closing idle streams.
+alert_hub = AlertHub(backlog=int(os.environ.get("RISK_STREAM_BACKLOG", "32")))
+SSE_HEARTBEAT_SEC = int(os.environ.get("RISK_STREAM_HEARTBEAT_SEC", "15"))
+SSE_RETRY_MS = 3000
 
 @app.post("/risk_update")
 def risk_update():
     data = request.get_json(force=True)
     sid = data.get("walking_session_id")
     if sid:
-        latest_risk[sid] = data
+        latest_risk.put(sid, data)
+        alert_hub.publish(sid, data)
     return ("", 204)
 
 @app.get("/risk/latest")
 def risk_latest():
+    """
+    Latest alert for ?sid= (or ?user_id=). The ETag is the entry's version;
+    send it back as If-None-Match, or pass ?since=<version>, to get an empty
+    304 when nothing changed.
+    """
     # Check both by session_id and user_id
+    entry = None
     sid = request.args.get("sid")
-    if sid and sid in latest_risk:
-        return jsonify(latest_risk[sid]), 200
-    
+    if sid:
+        entry = latest_risk.get(sid)
+
     # Fallback to user_id if session not found
     uid = request.args.get("user_id")
-    if uid and uid in latest_risk:
-        return jsonify(latest_risk[uid]), 200
-    
-    return jsonify({}), 200
+    if entry is None and uid:
+        entry = latest_risk.get(uid)
+
+    if entry is None:
+        return jsonify({}), 200
+
+    version, payload = entry
+    since = request.args.get("since", type=int)
+    if request.if_none_match.contains(str(version)) or (since is not None and version <= since):
+        resp = Response(status=304)
+    else:
+        resp = jsonify(payload)
+    resp.set_etag(str(version))
+    resp.headers["Cache-Control"] = "no-cache"    # browsers revalidate with If-None-Match
+    return resp
+
+@app.get("/risk/stream")
+def risk_stream():
+    """
+    Server-sent events for one session (?sid=) or user (?user_id=): each alert
+    as an `event: risk` with the same payload /risk/latest returns. Reconnecting
+    EventSources send Last-Event-ID and get the alerts they missed.
+    """
+    key = request.args.get("sid") or request.args.get("user_id")
+    if not key:
+        return jsonify({"error": "Missing 'sid' or 'user_id'"}), 400
+    try:
+        last_id = int(request.headers.get("Last-Event-ID") or request.args.get("last_event_id") or 0)
+    except ValueError:
+        last_id = 0
+
+    def events():
+        nonlocal last_id
+        alert_hub.subscribe(key)
+        try:
+            yield f"retry: {SSE_RETRY_MS}\n\n"
+            while True:
+                batch = alert_hub.wait(key, last_id, SSE_HEARTBEAT_SEC)
+                if not batch:
+                    yield ": heartbeat\n\n"
+                    continue
+                for event_id, payload in batch:
+                    yield f"id: {event_id}\nevent: risk\ndata: {json.dumps(payload)}\n\n"
+                    last_id = event_id
+        finally:
+            alert_hub.unsubscribe(key)
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",     # don't let nginx buffer the stream
+    })
 
 # ------------------------------
 # Consumer for alert_events from analytics service
 # ------------------------------
+# Walk history written by analytics (ANALYTICS_TRAJECTORY_DIR); point this at the same directory
+TRAJECTORY_DIR = os.environ.get("TRAJECTORY_DIR", "")
+trajectories = TrajectoryStore(TRAJECTORY_DIR) if TRAJECTORY_DIR else None
+
+@app.get("/history")
+def history():
+    """
+    Recorded fixes for ?user_id= between ?from= and ?to= (epoch seconds,
+    default: the last hour), optionally only walk ?sid=. Returns the walks
+    in the window and their fixes as [lat, lon, ts].
+    """
+    if trajectories is None:
+        return jsonify({"error": "walk history is not enabled"}), 404
+    uid = request.args.get("user_id")
+    if not uid:
+        return jsonify({"error": "user_id is required"}), 400
+    t_to = request.args.get("to", type=float) or time.time()
+    t_from = request.args.get("from", type=float)
+    if t_from is None:
+        t_from = t_to - 3600
+    sid = request.args.get("sid")
+    walks = trajectories.sessions(uid, t_from, t_to)
+    return jsonify({
+        "user_id": uid,
+        "walks": [{"walking_session_id": w[0], "start": w[1], "end": w[2], "fixes": w[3]}
+                  for w in walks if sid is None or w[0] == sid],
+        "fixes": [list(f) for f in trajectories.query(uid, t_from, t_to, session_id=sid)],
+    })
+
 def on_alert_event(ch, method, properties, body):
     try:
         event = json.loads(body)
@@ -252,9 +494,12 @@ def on_alert_event(ch, method, properties, body):
         event_type = event.get("type")
         user_id = data.get("user_id")
         sid = data.get("walking_session_id")   # <— NEW
+        ALERTS_RECEIVED.inc(event_type)
+        lag = event_age(event)
+        if lag is not None:
+            ALERT_LAG_SECONDS.observe(lag)
 
-        print(f"[🚨] Alert received: {event_type} for user {user_id} sid={sid}")
-        print(f"     Message: {data.get('message')}")
+        log.info("[🚨] Alert received: %s for user %s sid=%s: %s", event_type, user_id, sid, data.get("message"))
 
         payload = {
             "alert_type": event_type,
@@ -263,17 +508,27 @@ def on_alert_event(ch, method, properties, body):
             "user_id": user_id,
             "walking_session_id": sid,
         }
+        if data.get("fix_ts") is not None:   # when the fix that raised it was taken (epoch s)
+            payload["fix_ts"] = data["fix_ts"]
+        if "risk_score" in data:
+            payload["risk_score"] = data["risk_score"]
+            payload["factors"] = data.get("factors")
+        if "severity" in data:              # coalesced: every alert active for the session
+            payload["severity"] = data["severity"]
+            payload["alerts"] = data.get("alerts")
 
         # store by session if available
         if sid:
-            latest_risk[sid] = payload
+            latest_risk.put(sid, payload)
+            alert_hub.publish(sid, payload)
 
         # also store by user_id as a fallback / debugging view
         if user_id:
-            latest_risk[user_id] = payload
+            latest_risk.put(user_id, payload)
+            alert_hub.publish(user_id, payload)
 
     except Exception as e:
-        print(f"[!] Error processing alert: {e}")
+        log.error("[!] Error processing alert: %s", e)
 
 def alert_consumer_loop():
     """Consume alerts from analytics service"""
@@ -283,17 +538,17 @@ def alert_consumer_loop():
             ch = conn.channel()
             ch.queue_declare(queue="alert_events")
             ch.basic_consume(queue="alert_events", on_message_callback=on_alert_event, auto_ack=True)
-            print("[*] Alert consumer: listening to 'alert_events'…")
+            log.info("[*] Alert consumer: listening to 'alert_events'…")
             ch.start_consuming()
         except Exception as e:
-            print(f"[!] Alert consumer error: {e}. Reconnecting in 3s…")
+            log.warning("[!] Alert consumer error: %s. Reconnecting in 3s…", e)
             time.sleep(3)
 
-# Start alert consumer in background
-threading.Thread(target=alert_consumer_loop, daemon=True).start()
-
 # ------------------------------
 # Run Flask App
 # ------------------------------
 if __name__ == "__main__":
+    setup_logging(os.environ.get("LOG_LEVEL", "INFO"), json_lines=os.environ.get("LOG_FORMAT") == "json")
+    # Start alert consumer in background
+    threading.Thread(target=alert_consumer_loop, daemon=True).start()
     app.run(debug=True, port=5001, use_reloader=False)
\ No newline at end of file
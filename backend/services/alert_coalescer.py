@@ -0,0 +1,109 @@
+import threading, time
+
+
+class TokenBucket:
+    """rate tokens per second, at most burst banked; take() spends one if there is one."""
+
+    __slots__ = ("rate", "burst", "tokens", "stamp")
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.stamp = now
+
+    def take(self, now):
+        if now > self.stamp:
+            self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+        if self.tokens < 1.0:
+            return False
+        self.tokens -= 1.0
+        return True
+
+
+class AlertState:
+    """One session's alerts: what is active, what was last sent, and its token bucket."""
+
+    __slots__ = ("active", "severity", "sent_at", "merged", "bucket")
+
+    def __init__(self, bucket):
+        self.active = {}                # alert type -> (severity, data, raised_at)
+        self.severity = 0               # of the last event sent
+        self.sent_at = None
+        self.merged = 0                 # raises folded in since the last event
+        self.bucket = bucket
+
+
+class AlertCoalescer:
+    """Folds a session's alerts into one event per change in severity, rate limited per session and overall.
+
+    Detectors raise() every time they see a problem. An alert type stays
+    active for hold_s after its last raise, and the session's severity is the
+    highest among its active alerts. An event goes out when that severity
+    differs from the last event's, or cooldown_s after the last event while
+    alerts are still active; it carries the most severe alert's data plus a
+    summary of all active ones. Events also need a token from the session's
+    bucket and from the global one; a withheld event goes out on a later
+    raise. A forced raise (an alert that must not be lost, like entering a
+    hazard zone) is published at once with its own data, whatever the
+    cooldown and buckets say; it still spends a token where there is one.
+    Times come from clock (monotonic by default).
+
+    States are not locked; callers serialize per session (analytics holds
+    the user's shard lock). The global bucket has its own lock; the counters
+    are best effort across threads.
+    """
+
+    def __init__(self, hold_s=20.0, cooldown_s=30.0, session_rate=0.1, session_burst=3,
+                 global_rate=200.0, global_burst=1000, clock=time.monotonic):
+        self.hold_s = hold_s
+        self.cooldown_s = cooldown_s
+        self.session_rate = session_rate
+        self.session_burst = session_burst
+        self.clock = clock
+        self._global = TokenBucket(global_rate, global_burst, clock())
+        self._lock = threading.Lock()
+        self.raised = self.sent = self.coalesced = self.throttled = 0
+
+    def new_state(self):
+        return AlertState(TokenBucket(self.session_rate, self.session_burst, self.clock()))
+
+    def raise_alert(self, state, alert_type, severity, data, force=False):
+        """Record an alert; returns (event type, payload) to publish now, or None."""
+        now = self.clock()
+        self.raised += 1
+        state.merged += 1
+        active = state.active
+        active[alert_type] = (severity, data, now)
+        for t in [t for t, a in active.items() if now - a[2] > self.hold_s]:
+            del active[t]
+        top_type, (top, top_data, _) = max(active.items(), key=lambda kv: (kv[1][0], kv[1][2]))
+
+        if force:
+            top_type, top_data = alert_type, data
+            state.bucket.take(now)
+            with self._lock:
+                self._global.take(now)
+        elif top == state.severity and state.sent_at is not None and now - state.sent_at < self.cooldown_s:
+            self.coalesced += 1
+            return None
+        elif not state.bucket.take(now):
+            self.throttled += 1
+            return None
+        else:
+            with self._lock:
+                allowed = self._global.take(now)
+            if not allowed:
+                state.bucket.tokens += 1.0          # not sent, so not spent
+                self.throttled += 1
+                return None
+
+        state.severity, state.sent_at = top, now
+        payload = dict(top_data)
+        payload["severity"] = top
+        payload["alerts"] = {t: a[1].get("message") for t, a in sorted(active.items(), key=lambda kv: -kv[1][0])}
+        payload["coalesced"] = state.merged
+        state.merged = 0
+        self.sent += 1
+        return top_type, payload
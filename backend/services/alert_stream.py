@@ -0,0 +1,86 @@
+import threading
+from collections import OrderedDict, deque
+
+
+class _Topic:
+    __slots__ = ("seq", "backlog", "cond", "subscribers")
+
+    def __init__(self, backlog, lock):
+        self.seq = 0
+        self.backlog = deque(maxlen=backlog)    # (event_id, payload)
+        self.cond = threading.Condition(lock)
+        self.subscribers = 0
+
+
+class AlertHub:
+    """Per-key (session id / user id) fan-out of alerts to any number of waiting subscribers.
+
+    Every subscriber of a key shares one topic: publish() appends to the
+    topic's short backlog and wakes all waiters, each of which reads the
+    events newer than the last id it saw. Event ids increase per topic, so a
+    client reconnecting with Last-Event-ID gets what it missed as long as it
+    is still in the backlog. Topics without subscribers are dropped LRU-first
+    beyond max_topics.
+    """
+
+    def __init__(self, backlog=32, max_topics=50_000):
+        self.backlog = backlog
+        self.max_topics = max_topics
+        self._lock = threading.Lock()
+        self._topics = OrderedDict()
+
+    def _topic_locked(self, key):
+        topic = self._topics.get(key)
+        if topic is None:
+            topic = self._topics[key] = _Topic(self.backlog, self._lock)
+            self._trim_locked()
+        else:
+            self._topics.move_to_end(key)
+        return topic
+
+    def _trim_locked(self):
+        # trim to 90% so the scan is paid once per max_topics/10 new topics, not every time
+        if len(self._topics) <= self.max_topics:
+            return
+        target = self.max_topics * 9 // 10
+        newest = next(reversed(self._topics))
+        for key in [k for k, t in self._topics.items() if t.subscribers == 0 and k != newest]:
+            del self._topics[key]
+            if len(self._topics) <= target:
+                break
+
+    def publish(self, key, payload):
+        """Append payload to key's topic, wake its subscribers; return the event id."""
+        with self._lock:
+            topic = self._topic_locked(key)
+            topic.seq += 1
+            topic.backlog.append((topic.seq, payload))
+            topic.cond.notify_all()
+            return topic.seq
+
+    def subscribe(self, key):
+        with self._lock:
+            self._topic_locked(key).subscribers += 1
+
+    def unsubscribe(self, key):
+        with self._lock:
+            topic = self._topics.get(key)
+            if topic is not None:
+                topic.subscribers -= 1
+
+    def wait(self, key, last_id, timeout):
+        """Events on key with id > last_id, blocking up to timeout for the first; [] on timeout.
+
+        A last_id ahead of the topic (ids from before a restart) is treated as 0.
+        """
+        with self._lock:
+            topic = self._topic_locked(key)
+            if last_id > topic.seq:
+                last_id = 0
+            if topic.seq <= last_id:
+                topic.cond.wait(timeout)
+            return [e for e in topic.backlog if e[0] > last_id]
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(t.subscribers for t in self._topics.values())
@@ -0,0 +1,72 @@
+import numpy as np
+
+
+def match_batch(indexes, starts, lats, lons, threshold_m, back=2, ahead=8):
+    """Batch counterpart of analytics.match_route for many sessions at once.
+
+    indexes[g] is session g's RouteIndex, starts[g] its last matched segment
+    (or None) and lats[g] / lons[g] its new fixes, oldest first. Fixes are
+    matched in rounds: round r takes the r-th new fix of every session and
+    tests it against the window of segments around that session's previous
+    match in one (sessions x window) broadcast. Window results beyond
+    threshold_m fall back to the full grid search, as match_route does.
+    Returns a (dist, seg, t) tuple of arrays per session.
+    """
+    n_groups = len(indexes)
+    if not n_groups:
+        return []
+    counts = np.array([len(a) for a in lats], dtype=np.int64)
+    base = np.zeros(n_groups, dtype=np.int64)
+    base[1:] = np.cumsum(counts)[:-1]
+    lat_flat = np.concatenate([np.asarray(a, dtype=np.float64) for a in lats])
+    lon_flat = np.concatenate([np.asarray(a, dtype=np.float64) for a in lons])
+
+    # every route's projected vertices side by side; offs[g] is where route g starts
+    xs = np.concatenate([np.frombuffer(ix.xs, dtype=np.float64) for ix in indexes])
+    ys = np.concatenate([np.frombuffer(ix.ys, dtype=np.float64) for ix in indexes])
+    offs = np.zeros(n_groups, dtype=np.int64)
+    offs[1:] = np.cumsum([len(ix) for ix in indexes])[:-1]
+    last_seg = np.array([ix.n_segments - 1 for ix in indexes], dtype=np.int64)
+    lat0 = np.array([ix.lat0 for ix in indexes])
+    lon0 = np.array([ix.lon0 for ix in indexes])
+    kx = np.array([ix._kx for ix in indexes])
+    ky = np.array([ix._ky for ix in indexes])
+
+    dist = np.empty(len(lat_flat))
+    seg = np.empty(len(lat_flat), dtype=np.int64)
+    t_out = np.empty(len(lat_flat))
+    cur = np.array([-1 if s is None else s for s in starts], dtype=np.int64)
+    window = np.arange(-back, ahead + 1)
+
+    for r in range(int(counts.max(initial=0))):
+        g = np.nonzero(counts > r)[0]
+        k = base[g] + r
+        px = (lon_flat[k] - lon0[g]) * kx[g]
+        py = (lat_flat[k] - lat0[g]) * ky[g]
+
+        segs = np.clip(cur[g, None] + window[None, :], 0, last_seg[g, None])
+        a = offs[g, None] + segs
+        ax, ay = xs[a], ys[a]
+        vx, vy = xs[a + 1] - ax, ys[a + 1] - ay
+        wx, wy = px[:, None] - ax, py[:, None] - ay
+        c2 = vx * vx + vy * vy
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t = np.where(c2 > 0, (wx * vx + wy * vy) / c2, 0.0)
+        np.clip(t, 0.0, 1.0, out=t)
+        d = np.hypot(wx - t * vx, wy - t * vy)
+
+        rows = np.arange(len(g))
+        best = np.argmin(d, axis=1)
+        dist[k], seg[k], t_out[k] = d[rows, best], segs[rows, best], t[rows, best]
+
+        # no previous match, or the window says off-route: full indexed search
+        for j in np.nonzero((cur[g] < 0) | (dist[k] > threshold_m))[0]:
+            hit = indexes[g[j]].nearest(lat_flat[k[j]], lon_flat[k[j]])
+            dist[k[j]], seg[k[j]], t_out[k[j]] = hit
+
+        cur[g] = seg[k]
+
+    return [
+        (dist[b:b + c], seg[b:b + c], t_out[b:b + c])
+        for b, c in zip(base, counts)
+    ]
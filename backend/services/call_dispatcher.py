@@ -0,0 +1,192 @@
+import logging, queue, random, threading, time, uuid
+from datetime import datetime
+
+from services.deadlines import DeadlineScheduler
+
+log = logging.getLogger(__name__)
+
+CHANNELS = ("call", "sms")
+
+
+class PermanentError(Exception):
+    """Raised by place() for failures a retry won't fix (bad number, rejected credentials)."""
+
+
+class CallTask:
+    """One call or SMS to one guardian."""
+
+    __slots__ = ("job", "channel", "to", "status", "attempts", "sid", "error", "placed_at")
+
+    def __init__(self, job, channel, to):
+        self.job = job
+        self.channel = channel
+        self.to = to
+        self.status = "queued"          # queued -> placing -> placed | retrying -> ... | failed
+        self.attempts = 0
+        self.sid = None                 # Twilio's call / message sid once placed
+        self.error = None
+        self.placed_at = None
+
+    def as_dict(self):
+        return {"channel": self.channel, "to": self.to, "status": self.status, "attempts": self.attempts,
+                "sid": self.sid, "error": self.error}
+
+
+class CallJob:
+    """Every task for one emergency request; the unit of deduplication."""
+
+    __slots__ = ("id", "session_id", "key", "created", "created_at", "tasks")
+
+    def __init__(self, session_id, key, created):
+        self.id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.key = key
+        self.created = created          # dispatcher clock
+        self.created_at = datetime.utcnow().isoformat()
+        self.tasks = []
+
+    @property
+    def status(self):
+        states = {t.status for t in self.tasks}
+        if states <= {"placed"}:
+            return "placed"
+        if states <= {"placed", "failed"}:
+            return "failed" if states == {"failed"} else "partial"
+        return "queued" if states == {"queued"} else "in_progress"
+
+    def first_placed_s(self):
+        """Seconds from the request to its first placed call or SMS, or None."""
+        placed = [t.placed_at for t in self.tasks if t.placed_at is not None]
+        return min(placed) - self.created if placed else None
+
+    def as_dict(self):
+        first = self.first_placed_s()
+        return {
+            "job_id": self.id,
+            "walking_session_id": self.session_id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "first_placed_ms": round(first * 1e3) if first is not None else None,
+            "tasks": [t.as_dict() for t in self.tasks],
+        }
+
+
+class CallDispatcher:
+    """Places guardians' calls and SMS on a worker pool, off the request thread.
+
+    submit() records a job and returns at once; the job's tasks (one per
+    guardian and channel) go on a queue that `workers` threads drain in
+    parallel, each calling place(channel, to) -> sid. A failed task is
+    retried up to max_attempts times, after retry_base_s, then twice that,
+    and so on (capped at retry_max_s, with jitter); PermanentError fails it
+    at once. A second submit() with the same (session id, idempotency key)
+    returns the first job instead of calling anyone again, unless that job
+    failed outright. Finished jobs
+    are forgotten job_ttl_s after they were submitted.
+    """
+
+    def __init__(self, place, workers=16, max_attempts=4, retry_base_s=2.0, retry_max_s=60.0,
+                 job_ttl_s=3600.0, clock=time.monotonic):
+        self.place = place
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_base_s = retry_base_s
+        self.retry_max_s = retry_max_s
+        self.job_ttl_s = job_ttl_s
+        self.clock = clock
+        self._queue = queue.Queue()
+        self._retries = DeadlineScheduler(clock)
+        self._jobs = {}                 # job id -> CallJob, oldest first
+        self._by_key = {}               # (session id, idempotency key) -> job id
+        self._lock = threading.Lock()
+        self._threads = []
+        self.placed = self.failed = self.retried = self.deduplicated = 0
+
+    def submit(self, session_id, key, targets):
+        """Queue a job for targets [(channel, phone), ...]; returns (job status, created).
+
+        Jobs with a key dedupe on (session_id, key): a repeat gets the first
+        job's status and created=False, unless every task of that job failed,
+        in which case it is tried again. Without a key every submit is new.
+        """
+        if not self._threads:
+            self._start()
+        dedup = (session_id, key) if key else None
+        with self._lock:
+            now = self.clock()
+            self._expire_locked(now)
+            first = self._jobs.get(self._by_key.get(dedup)) if dedup is not None else None
+            if first is not None and first.status != "failed":
+                self.deduplicated += 1
+                return first.as_dict(), False
+            job = CallJob(session_id, key, now)
+            job.tasks = [CallTask(job, channel, to) for channel, to in targets]
+            self._jobs[job.id] = job
+            if dedup is not None:
+                self._by_key[dedup] = job.id
+            status = job.as_dict()
+        for task in job.tasks:
+            self._queue.put(task)
+        return status, True
+
+    def get(self, job_id):
+        """The job's status (as_dict()), or None if unknown or expired."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.as_dict() if job is not None else None
+
+    def pending(self):
+        """Tasks waiting for a worker or for their next attempt."""
+        return self._queue.qsize() + len(self._retries)
+
+    def _expire_locked(self, now):
+        while self._jobs:
+            job = next(iter(self._jobs.values()))
+            if now - job.created < self.job_ttl_s or job.status in ("queued", "in_progress"):
+                break
+            del self._jobs[job.id]
+            if self._by_key.get((job.session_id, job.key)) == job.id:     # not if a retry took the key over
+                del self._by_key[(job.session_id, job.key)]
+
+    def _start(self):
+        with self._lock:
+            if self._threads:
+                return
+            self._threads = [threading.Thread(target=self._work, name=f"call-worker-{i}", daemon=True)
+                             for i in range(self.workers)]
+            self._threads.append(threading.Thread(target=self._retry_loop, name="call-retries", daemon=True))
+            for t in self._threads:
+                t.start()
+
+    def _work(self):
+        while True:
+            task = self._queue.get()
+            with self._lock:
+                task.status = "placing"
+                task.attempts += 1
+            try:
+                sid = self.place(task.channel, task.to)
+            except Exception as e:
+                permanent = isinstance(e, PermanentError) or task.attempts >= self.max_attempts
+                with self._lock:
+                    task.error = str(e) or type(e).__name__
+                    task.status = "failed" if permanent else "retrying"
+                    if permanent:
+                        self.failed += 1
+                    else:
+                        self.retried += 1
+                if permanent:
+                    log.error("[!] %s to %s failed after %d attempt(s): %s", task.channel, task.to, task.attempts, task.error)
+                    continue
+                delay = min(self.retry_max_s, self.retry_base_s * 2 ** (task.attempts - 1))
+                self._retries.schedule_in(task, delay * random.uniform(0.75, 1.0))
+                continue
+            with self._lock:
+                task.status, task.sid, task.error = "placed", sid, None
+                task.placed_at = self.clock()
+                self.placed += 1
+
+    def _retry_loop(self):
+        while True:
+            for task, _, _ in self._retries.wait_due():
+                self._queue.put(task)
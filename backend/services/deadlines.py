@@ -0,0 +1,90 @@
+import heapq, itertools, threading, time
+
+
+class DeadlineScheduler:
+    """Min-heap of per-key deadlines on the monotonic clock.
+
+    Each key has at most one live deadline; rescheduling pushes a new heap
+    entry and the old one is skipped when it surfaces (lazy deletion). The
+    heap is rebuilt when stale entries outnumber live ones. wait_due() sleeps
+    until the earliest deadline instead of polling.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._heap = []                 # (deadline, seq, key, kind)
+        self._live = {}                 # key -> (deadline, seq, kind)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._live)
+
+    def schedule(self, key, deadline, kind=None):
+        """Set key's deadline (replacing any previous one)."""
+        with self._cond:
+            seq = next(self._seq)
+            self._live[key] = (deadline, seq, kind)
+            wake = not self._heap or deadline < self._heap[0][0]
+            heapq.heappush(self._heap, (deadline, seq, key, kind))
+            if len(self._heap) > 2 * len(self._live) + 64:
+                self._heap = [(d, s, k, kd) for k, (d, s, kd) in self._live.items()]
+                heapq.heapify(self._heap)
+            if wake:
+                self._cond.notify()
+
+    def schedule_in(self, key, delay, kind=None):
+        self.schedule(key, self.clock() + delay, kind)
+
+    def schedule_many_in(self, entries):
+        """schedule_in() for many (key, delay, kind) at once, with a single heap rebuild."""
+        with self._cond:
+            now = self.clock()
+            for key, delay, kind in entries:
+                self._live[key] = (now + delay, next(self._seq), kind)
+            self._heap = [(d, s, k, kd) for k, (d, s, kd) in self._live.items()]
+            heapq.heapify(self._heap)
+            self._cond.notify()
+
+    def cancel(self, key):
+        with self._cond:
+            self._live.pop(key, None)
+
+    def deadline(self, key):
+        with self._cond:
+            entry = self._live.get(key)
+            return entry[0] if entry else None
+
+    def peek(self, key):
+        """(deadline, kind) for key, or None."""
+        with self._cond:
+            entry = self._live.get(key)
+            return (entry[0], entry[2]) if entry else None
+
+    def pop_due(self, now=None):
+        """Remove and return [(key, kind, deadline), ...] whose deadline has passed."""
+        with self._cond:
+            return self._pop_due_locked(self.clock() if now is None else now)
+
+    def _pop_due_locked(self, now):
+        due = []
+        heap, live = self._heap, self._live
+        while heap and heap[0][0] <= now:
+            deadline, seq, key, kind = heapq.heappop(heap)
+            entry = live.get(key)
+            if entry is None or entry[1] != seq:
+                continue                # rescheduled or cancelled since
+            del live[key]
+            due.append((key, kind, deadline))
+        return due
+
+    def wait_due(self):
+        """Block until at least one deadline passes, then return what pop_due() would."""
+        with self._cond:
+            while True:
+                now = self.clock()
+                due = self._pop_due_locked(now)
+                if due:
+                    return due
+                self._cond.wait(self._heap[0][0] - now if self._heap else None)
@@ -0,0 +1,68 @@
+# Compact wire format for batches of GPS fixes: version byte, fix count, then
+# per fix three zigzag varints holding the delta from the previous fix of lat
+# and lon (1e-6 degrees, ~0.1 m) and timestamp (ms). ~4-5 bytes/fix at 1 Hz.
+
+FORMAT_VERSION = 1
+COORD_SCALE = 1_000_000     # microdegrees
+TIME_SCALE = 1000           # milliseconds
+
+
+def _put_varint(out, n):
+    n = n << 1 if n >= 0 else (-n << 1) - 1     # zigzag
+    while n > 0x7F:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _get_varint(buf, pos):
+    n = shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        n |= (b & 0x7F) << shift
+        if b < 0x80:
+            break
+        shift += 7
+    return (n >> 1) ^ -(n & 1), pos
+
+
+def encode_fixes(fixes):
+    """Pack [(lat, lon, ts_seconds), ...] into bytes."""
+    out = bytearray([FORMAT_VERSION])
+    _put_varint(out, len(fixes))
+    p_lat = p_lon = p_ts = 0
+    for lat, lon, ts in fixes:
+        i_lat, i_lon, i_ts = round(lat * COORD_SCALE), round(lon * COORD_SCALE), round(ts * TIME_SCALE)
+        _put_varint(out, i_lat - p_lat)
+        _put_varint(out, i_lon - p_lon)
+        _put_varint(out, i_ts - p_ts)
+        p_lat, p_lon, p_ts = i_lat, i_lon, i_ts
+    return bytes(out)
+
+
+class TooManyFixes(ValueError):
+    pass
+
+
+def decode_fixes(buf, max_fixes=None):
+    """Inverse of encode_fixes; raises ValueError on a malformed buffer, and
+    TooManyFixes, before decoding any fix, if the header counts more than max_fixes."""
+    try:
+        if buf[0] != FORMAT_VERSION:
+            raise ValueError(f"unsupported fix format version {buf[0]}")
+        count, pos = _get_varint(buf, 1)
+        if max_fixes is not None and count > max_fixes:
+            raise TooManyFixes(f"At most {max_fixes} fixes per upload")
+        fixes = []
+        i_lat = i_lon = i_ts = 0
+        for _ in range(count):
+            d, pos = _get_varint(buf, pos); i_lat += d
+            d, pos = _get_varint(buf, pos); i_lon += d
+            d, pos = _get_varint(buf, pos); i_ts += d
+            fixes.append((i_lat / COORD_SCALE, i_lon / COORD_SCALE, i_ts / TIME_SCALE))
+    except IndexError:
+        raise ValueError("truncated fix buffer") from None
+    if pos != len(buf):
+        raise ValueError("trailing bytes after fixes")
+    return fixes
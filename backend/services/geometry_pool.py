@@ -0,0 +1,202 @@
+import hashlib, math, os, threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from services.batch_scorer import match_batch
+
+_HEADER = 5                 # n_points, lat0, lon0, kx, ky
+WORKER_CACHE_ROUTES = 4096  # attached routes each worker keeps mapped
+
+
+def _drop_fd(shm):
+    # the mapping stays valid without the descriptor; with one block per walk,
+    # keeping every fd open would run into the process fd limit
+    if getattr(shm, "_fd", -1) >= 0:
+        os.close(shm._fd)
+        shm._fd = -1
+
+
+def shm_name(sid):
+    """Shared-memory block name for a walking session (short enough for macOS)."""
+    return "sw_" + hashlib.blake2b(str(sid).encode(), digest_size=8).hexdigest()
+
+
+class SharedRoute:
+    """Read-only view of a route block with what match_batch needs from a RouteIndex.
+
+    There is no grid: nearest() scans every segment with numpy, which is
+    cheap per call and avoids rebuilding the index in every worker.
+    """
+
+    def __init__(self, buf):
+        arr = np.ndarray((len(buf) // 8,), dtype=np.float64, buffer=buf)
+        n = int(arr[0])
+        self.lat0, self.lon0, self._kx, self._ky = (float(v) for v in arr[1:_HEADER])
+        self.xs = arr[_HEADER:_HEADER + n]
+        self.ys = arr[_HEADER + n:_HEADER + 2 * n]
+        self.n_segments = max(0, n - 1)
+
+    def __len__(self):
+        return len(self.xs)
+
+    def nearest(self, lat, lon):
+        if not self.n_segments:
+            return None
+        px, py = (lon - self.lon0) * self._kx, (lat - self.lat0) * self._ky
+        ax, ay = self.xs[:-1], self.ys[:-1]
+        vx, vy = self.xs[1:] - ax, self.ys[1:] - ay
+        wx, wy = px - ax, py - ay
+        c2 = vx * vx + vy * vy
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t = np.where(c2 > 0, (wx * vx + wy * vy) / c2, 0.0)
+        np.clip(t, 0.0, 1.0, out=t)
+        d = np.hypot(wx - t * vx, wy - t * vy)
+        i = int(np.argmin(d))
+        return float(d[i]), i, float(t[i])
+
+
+# ----- worker side -----
+_attached = OrderedDict()   # block name -> SharedRoute
+
+def _route(name, generation):
+    hit = _attached.get(name)
+    if hit is not None and hit.generation == generation:
+        _attached.move_to_end(name)
+        return hit
+    # a new generation means the block was unlinked and recreated for a new
+    # route: replacing the entry releases the stale mapping
+    shm = shared_memory.SharedMemory(name=name)
+    _drop_fd(shm)
+    route = SharedRoute(shm.buf)
+    route.shm = shm             # unmapped once the route (and its views) are gone
+    route.generation = generation
+    _attached[name] = route
+    _attached.move_to_end(name)
+    while len(_attached) > WORKER_CACHE_ROUTES:
+        _attached.popitem(last=False)
+    return route
+
+def _match_chunk(names, generations, starts, lats, lons, threshold_m, back, ahead):
+    """Runs in a worker: match_batch over routes attached from shared memory; None if one is gone."""
+    try:
+        routes = [_route(n, g) for n, g in zip(names, generations)]
+    except FileNotFoundError:
+        return None
+    return match_batch(routes, starts, lats, lons, threshold_m, back=back, ahead=ahead)
+
+def _ping(_):
+    return True
+
+
+class GeometryPool:
+    """Off-route matching in worker processes, with routes in shared memory keyed by walking_session_id.
+
+    load() copies a session's projected route arrays into a named block once
+    per walk; workers attach to it by name on first use, and again when the
+    block's generation shows the route was reloaded. match() splits a
+    batch of sessions into chunks, sends only the fixes over, and gets back
+    (dist, seg, t) arrays. Sessions without a block, or whose block vanished,
+    are matched in-process.
+    """
+
+    def __init__(self, workers, chunks_per_worker=2):
+        self.workers = workers
+        self.chunks_per_worker = chunks_per_worker
+        # workers must share our resource tracker, or each would unlink the
+        # blocks it attached to when it exits
+        resource_tracker.ensure_running()
+        self.executor = ProcessPoolExecutor(workers)
+        self._blocks = {}       # sid -> SharedMemory
+        self._generations = {}  # sid -> load count when its block was created
+        self._loads = 0
+        self._lock = threading.Lock()
+
+    def warm_up(self):
+        """Start the worker processes now (call before starting threads, as they are forked)."""
+        list(self.executor.map(_ping, range(self.workers)))
+
+    def load(self, sid, idx):
+        """Publish RouteIndex idx for sid to the workers."""
+        self.unload(sid)
+        n = len(idx)
+        if n < 2:
+            return
+        try:
+            shm = shared_memory.SharedMemory(name=shm_name(sid), create=True, size=8 * (_HEADER + 2 * n))
+        except FileExistsError:         # left behind by a crashed process
+            stale = shared_memory.SharedMemory(name=shm_name(sid))
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name=shm_name(sid), create=True, size=8 * (_HEADER + 2 * n))
+        _drop_fd(shm)
+        arr = np.ndarray((_HEADER + 2 * n,), dtype=np.float64, buffer=shm.buf)
+        arr[:_HEADER] = (n, idx.lat0, idx.lon0, idx._kx, idx._ky)
+        arr[_HEADER:_HEADER + n] = idx.xs
+        arr[_HEADER + n:] = idx.ys
+        del arr
+        with self._lock:
+            self._loads += 1
+            self._blocks[sid] = shm
+            self._generations[sid] = self._loads
+
+    def unload(self, sid):
+        with self._lock:
+            shm = self._blocks.pop(sid, None)
+            self._generations.pop(sid, None)
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+
+    def __contains__(self, sid):
+        return sid in self._blocks
+
+    def __len__(self):
+        return len(self._blocks)
+
+    def match(self, sids, indexes, starts, lats, lons, threshold_m, back=2, ahead=8):
+        """Same result as match_batch(indexes, ...), with loaded sessions matched in the workers."""
+        out = [None] * len(sids)
+        remote, local = [], []
+        for i, sid in enumerate(sids):
+            (remote if sid in self._blocks else local).append(i)
+        n_chunks = min(len(remote), self.workers * self.chunks_per_worker)
+        size = math.ceil(len(remote) / n_chunks) if n_chunks else 0
+        futures = []
+        for c in range(n_chunks):
+            part = remote[c * size:(c + 1) * size]
+            if part:
+                futures.append((part, self.executor.submit(
+                    _match_chunk, [shm_name(sids[i]) for i in part],
+                    [self._generations.get(sids[i], 0) for i in part], [starts[i] for i in part],
+                    [lats[i] for i in part], [lons[i] for i in part], threshold_m, back, ahead)))
+
+        # sessions the workers don't have are matched here while they run
+        self._match_local(out, local, indexes, starts, lats, lons, threshold_m, back, ahead)
+        missing = []
+        for part, future in futures:
+            result = future.result()
+            if result is None:
+                missing.extend(part)
+            else:
+                for i, r in zip(part, result):
+                    out[i] = r
+        self._match_local(out, missing, indexes, starts, lats, lons, threshold_m, back, ahead)
+        return out
+
+    @staticmethod
+    def _match_local(out, which, indexes, starts, lats, lons, threshold_m, back, ahead):
+        if not which:
+            return
+        results = match_batch([indexes[i] for i in which], [starts[i] for i in which],
+                              [lats[i] for i in which], [lons[i] for i in which],
+                              threshold_m, back=back, ahead=ahead)
+        for i, r in zip(which, results):
+            out[i] = r
+
+    def shutdown(self):
+        self.executor.shutdown()
+        for sid in list(self._blocks):
+            self.unload(sid)
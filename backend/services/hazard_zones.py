@@ -0,0 +1,251 @@
+import gc, json, math, os, re, threading, time
+from collections import namedtuple
+
+DEFAULT_SEVERITY = 2
+RETIRE_GRACE_SEC = 1.0          # readers still on the previous index finish well within this
+
+_FEATURES = re.compile(r'"features"\s*:\s*\[')
+_decoder = json.JSONDecoder()
+
+
+def _inside(edges, x, y):
+    """Even-odd ray cast to +x; holes and separate parts need no special case."""
+    inside = False
+    for x1, y1, x2, y2 in edges:
+        if (y1 > y) != (y2 > y) and x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+            inside = not inside
+    return inside
+
+
+class HazardZone(namedtuple("HazardZone", "id name category severity edges bbox")):
+    """One unsafe area from the layer: a (multi)polygon as a flat tuple of edges."""
+
+    __slots__ = ()
+
+    @classmethod
+    def build(cls, zid, name, category, severity, edges):
+        # edges: ((x1, y1, x2, y2), ...) in lon/lat, every ring of every part
+        xs = [e[0] for e in edges]
+        ys = [e[1] for e in edges]
+        return cls(zid, name, category, severity, edges, (min(xs), min(ys), max(xs), max(ys)))
+
+    def contains(self, x, y):
+        return _inside(self.edges, x, y)
+
+    def as_dict(self):
+        return {"zone_id": self.id, "name": self.name, "category": self.category, "severity": self.severity}
+
+
+def _ring_edges(ring):
+    pts = [(float(p[0]), float(p[1])) for p in ring]
+    if len(pts) > 1 and pts[0] == pts[-1]:
+        pts.pop()
+    if len(pts) < 3:
+        return []
+    return [(x1, y1, x2, y2) for (x1, y1), (x2, y2) in zip(pts, pts[1:] + pts[:1]) if y1 != y2]
+
+
+def zone_from_feature(feature, fallback_id):
+    """HazardZone from a GeoJSON Feature with a Polygon or MultiPolygon geometry, else None."""
+    geom = feature.get("geometry") or {}
+    if geom.get("type") == "Polygon":
+        polygons = [geom.get("coordinates") or []]
+    elif geom.get("type") == "MultiPolygon":
+        polygons = geom.get("coordinates") or []
+    else:
+        return None
+    edges = tuple(e for rings in polygons for ring in rings for e in _ring_edges(ring))
+    if not edges:
+        return None
+    props = feature.get("properties") or {}
+    zid = feature.get("id", props.get("id", fallback_id))
+    name, category = props.get("name"), props.get("category")
+    return HazardZone.build(str(zid), None if name is None else str(name), None if category is None else str(category),
+                            int(props.get("severity", DEFAULT_SEVERITY)), edges)
+
+
+def _skip(text, pos):
+    while pos < len(text) and text[pos] in " \t\r\n":
+        pos += 1
+    return pos
+
+
+class HazardIndex:
+    """Hazard zones bucketed into a lon/lat grid, for point-in-zone tests per fix.
+
+    Built once per layer. Each grid cell a zone's bbox touches is classified
+    at build time: cells the zone's boundary passes through keep the zone as
+    a candidate (bbox check, then a ray cast over just the edges a ray from
+    that cell can cross); cells wholly inside it list the zone as a hit
+    outright; cells wholly outside drop it. A query is one dict lookup plus
+    the candidates of a single cell, whatever the layer's size.
+    """
+
+    def __init__(self, zones, cell_deg=0.002):
+        # Zones are kept as plain tuples (HazardZone fields) and referred to by
+        # position. Exact tuples of plain values drop out of the cycle
+        # collector's tracking, so full collections never walk the layer;
+        # a HazardZone is only made for a hit.
+        self.zones = [tuple(z) for z in zones]
+        self.cell_deg = float(cell_deg)
+        cells = {}
+        for i, zone in enumerate(zones):
+            self._add(i, zone, cells)
+        # (cx, cy) -> (zones covering the cell, ((minx, miny, maxx, maxy, zone, edges), ...) crossing it)
+
+        self.grid = {c: (tuple(inside), tuple(edge)) for c, (inside, edge) in cells.items()}
+
+    @classmethod
+    def from_geojson(cls, doc, cell_deg=0.002):
+        features = doc.get("features", []) if doc.get("type") == "FeatureCollection" else [doc]
+        zones = [z for i, f in enumerate(features) if (z := zone_from_feature(f, i)) is not None]
+        return cls(zones, cell_deg)
+
+    @classmethod
+    def load(cls, path, cell_deg=0.002):
+        """Index a GeoJSON file. A FeatureCollection is decoded one feature at a time,
+        so other threads get the GIL back between features instead of waiting out
+        one json.load of the whole file."""
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+        m = _FEATURES.search(text)
+        if m is None:
+            return cls.from_geojson(json.loads(text), cell_deg)
+        zones, pos, i = [], m.end(), 0
+        while True:
+            pos = _skip(text, pos)
+            if text.startswith("]", pos):
+                break
+            feature, pos = _decoder.raw_decode(text, pos)
+            zone = zone_from_feature(feature, i)
+            if zone is not None:
+                zones.append(zone)
+            i += 1
+            pos = _skip(text, pos)
+            if text.startswith(",", pos):
+                pos += 1
+        return cls(zones, cell_deg)
+
+    def __len__(self):
+        return len(self.zones)
+
+    def _cell(self, x, y):
+        return math.floor(x / self.cell_deg), math.floor(y / self.cell_deg)
+
+    def _add(self, i, zone, cells):
+        c = self.cell_deg
+        minx, miny, maxx, maxy = zone.bbox
+        c0x, c0y = self._cell(minx, miny)
+        c1x, c1y = self._cell(maxx, maxy)
+        boundary = set()
+        for x1, y1, x2, y2 in zone.edges:
+            a, b = self._cell(min(x1, x2), min(y1, y2)), self._cell(max(x1, x2), max(y1, y2))
+            if (b[0] - a[0] + 1) * (b[1] - a[1] + 1) > 4:
+                boundary.update(self._walk_edge(x1, y1, x2, y2))
+            else:
+                boundary.update((cx, cy) for cx in range(a[0], b[0] + 1) for cy in range(a[1], b[1] + 1))
+        for cx in range(c0x, c1x + 1):
+            for cy in range(c0y, c1y + 1):
+                if (cx, cy) in boundary:
+                    # a ray to +x from inside this cell can only cross edges spanning one
+                    # of its y values that don't end left of it
+                    y0, y1, x0 = cy * c, (cy + 1) * c, cx * c
+                    edges = tuple(e for e in zone.edges
+                                  if max(e[0], e[2]) >= x0 and max(e[1], e[3]) >= y0 and min(e[1], e[3]) <= y1)
+                    cells.setdefault((cx, cy), ([], []))[1].append((minx, miny, maxx, maxy, i, edges))
+                elif zone.contains((cx + 0.5) * c, (cy + 0.5) * c):
+                    cells.setdefault((cx, cy), ([], []))[0].append(i)
+
+    def _walk_edge(self, x1, y1, x2, y2):
+        """Cells a long edge passes through, one column of cells at a time."""
+        if x1 > x2:
+            x1, y1, x2, y2 = x2, y2, x1, y1
+        c = self.cell_deg
+        c0x, c1x = math.floor(x1 / c), math.floor(x2 / c)
+        slope = (y2 - y1) / (x2 - x1) if x2 != x1 else 0.0
+        for cx in range(c0x, c1x + 1):
+            xa, xb = max(x1, cx * c), min(x2, (cx + 1) * c)
+            ya, yb = y1 + (xa - x1) * slope, y1 + (xb - x1) * slope
+            if x2 == x1:
+                ya, yb = y1, y2
+            eps = c * 1e-9              # don't lose a cell to rounding where the edge meets a row boundary
+            for cy in range(math.floor((min(ya, yb) - eps) / c), math.floor((max(ya, yb) + eps) / c) + 1):
+                yield cx, cy
+
+    def zones_at(self, lat, lon):
+        """Zones containing (lat, lon), as a list (empty almost everywhere)."""
+        cell = self.grid.get((math.floor(lon / self.cell_deg), math.floor(lat / self.cell_deg)))
+        if cell is None:
+            return []
+        inside, edge = cell
+        zones, make = self.zones, HazardZone._make
+        hits = [make(zones[i]) for i in inside]
+        for minx, miny, maxx, maxy, i, edges in edge:
+            if minx <= lon <= maxx and miny <= lat <= maxy and _inside(edges, lon, lat):
+                hits.append(make(zones[i]))
+        return hits
+
+
+class HazardLayer:
+    """The current HazardIndex for a GeoJSON file, rebuilt when the file changes.
+
+    Readers take layer.index and use it without locking; reload() builds a
+    new index on the caller's thread and swaps the reference once it is
+    complete, so fixes are never checked against a half-built layer and the
+    consumer is never stopped for the rebuild. A file that fails to load
+    leaves the previous index in place.
+
+    Freeing a 100k-zone index in one go would stall every thread, so the
+    old index is taken apart a cell at a time, RETIRE_GRACE_SEC after the
+    swap, outside the lock. reload(freeze=True) is for the first load at
+    startup, before other threads run: the collector is paused while
+    building and everything then alive is frozen out of its view
+    (gc.freeze()). Hot reloads don't freeze, as that would also pin any
+    cyclic garbage of the moment; the index being untracked tuples keeps
+    their collections short anyway.
+    """
+
+    def __init__(self, path, cell_deg=0.002):
+        self.path = path
+        self.cell_deg = cell_deg
+        self.index = HazardIndex([], cell_deg)
+        self.version = 0
+        self.loaded_at = None
+        self.load_seconds = None
+        self._stamp = None
+        self._lock = threading.Lock()   # one rebuild at a time
+
+    def reload(self, force=False, freeze=False):
+        """Rebuild if the file changed since the last load; True if a new index was swapped in."""
+        with self._lock:
+            st = os.stat(self.path)
+            stamp = (st.st_mtime_ns, st.st_size)
+            if stamp == self._stamp and not force:
+                return False
+            t0 = time.perf_counter()
+            if freeze:
+                gc.disable()
+                try:
+                    index = HazardIndex.load(self.path, self.cell_deg)
+                    gc.freeze()
+                finally:
+                    gc.enable()
+            else:
+                index = HazardIndex.load(self.path, self.cell_deg)
+            old, self.index = self.index, index
+            self._stamp = stamp
+            self.version += 1
+            self.loaded_at = time.time()
+            self.load_seconds = time.perf_counter() - t0
+        if old.grid:
+            _retire(old)
+        return True
+
+
+def _retire(index):
+    time.sleep(RETIRE_GRACE_SEC)
+    grid, zones = index.grid, index.zones
+    while grid:
+        grid.popitem()
+    while zones:
+        zones.pop()
@@ -0,0 +1,83 @@
+from array import array
+
+
+class LocationHistory:
+    """Fixed-capacity ring buffer of (lat, lon, epoch-seconds) fixes in flat array('d') storage.
+
+    Once full, the oldest fix is overwritten. If archive_every > 0, every
+    archive_every-th evicted fix is kept in a second, smaller ring so older
+    history survives at a lower sampling rate. The archive ring is created on
+    the first eviction, so short walks never pay for it.
+    """
+
+    __slots__ = ("capacity", "_buf", "_head", "_size", "archive", "archive_capacity", "archive_every", "_evicted")
+
+    def __init__(self, capacity=128, archive_capacity=0, archive_every=0):
+        self.capacity = capacity
+        self._buf = array("d")          # lat, lon, ts interleaved; grows up to 3 * capacity
+        self._head = 0                  # slot of the oldest fix once the buffer is full
+        self._size = 0
+        self.archive_every = archive_every if archive_capacity else 0
+        self.archive_capacity = archive_capacity
+        self.archive = None
+        self._evicted = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, lat, lon, ts):
+        buf = self._buf
+        if self._size < self.capacity:
+            buf.append(lat)
+            buf.append(lon)
+            buf.append(ts)
+            self._size += 1
+            return
+
+        i = self._head * 3
+        if self.archive_every:
+            if self.archive is None:
+                self.archive = LocationHistory(self.archive_capacity)
+            if self._evicted % self.archive_every == 0:
+                self.archive.append(buf[i], buf[i + 1], buf[i + 2])
+            self._evicted += 1
+        buf[i], buf[i + 1], buf[i + 2] = lat, lon, ts
+        self._head = (self._head + 1) % self.capacity
+
+    def __getitem__(self, k):
+        """(lat, lon, ts) of the k-th retained fix, oldest first; negative k counts from the newest."""
+        if k < 0:
+            k += self._size
+        if not 0 <= k < self._size:
+            raise IndexError("location history index out of range")
+        i = ((self._head + k) % self.capacity) * 3
+        buf = self._buf
+        return buf[i], buf[i + 1], buf[i + 2]
+
+    def tail(self, n):
+        """The newest n retained fixes as a list of (lat, lon, ts), oldest first."""
+        n = min(n, self._size)
+        return [self[k] for k in range(self._size - n, self._size)]
+
+    def packed(self, n):
+        """The newest n retained fixes as a flat array('d') of lat, lon, ts, oldest first."""
+        n = min(n, self._size)
+        if self._size < self.capacity:
+            return self._buf[3 * (self._size - n):]
+        i = self._head * 3
+        ordered = self._buf[i:] + self._buf[:i]
+        return ordered[len(ordered) - 3 * n:]
+
+    def load_packed(self, flat):
+        """Replace the retained fixes with a flat array('d') as returned by packed()."""
+        n = min(len(flat) // 3, self.capacity)
+        self._buf = flat[len(flat) - 3 * n:] if len(flat) != 3 * n else flat
+        self._head = 0
+        self._size = n
+
+    def nbytes(self):
+        """Approximate bytes held by the fix storage (including the archive)."""
+        total = self._buf.buffer_info()[1] * self._buf.itemsize
+        if self.archive is not None:
+            total += self.archive.nbytes()
+        return total
@@ -0,0 +1,105 @@
+import itertools, json, logging, logging.handlers, queue, sys, threading
+
+LOG_QUEUE_SIZE = 10000          # records waiting for the writer thread; beyond this they are dropped
+TEXT_FORMAT = "%(asctime)s %(levelname).1s %(name)s %(message)s"
+
+# LogRecord attributes that are not extra= fields
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class SampledLogger:
+    """A logger that only passes on one call in every; the rest cost a call and a cycle step.
+
+    For per-fix lines: with every=1000, a thousand walkers at 1 Hz log
+    about one fix a second between them instead of a thousand.
+    """
+
+    def __init__(self, logger, every=1):
+        self.logger = logger
+        self.every = max(1, every)
+        self.due = itertools.cycle((True,) + (False,) * (self.every - 1)).__next__
+
+    def debug(self, msg, *args):
+        if self.due():
+            self.logger.debug(msg, *args)
+
+    def info(self, msg, *args):
+        if self.due():
+            self.logger.info(msg, *args)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks or formats on the caller's thread.
+
+    The stock prepare() renders the message before enqueueing; here the
+    record goes as is (args are formatted by the writer thread), only a
+    traceback is rendered up front. When the queue is full the record is
+    dropped and counted.
+    """
+
+    def __init__(self, q):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record):
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg, plus any extra= fields."""
+
+    def format(self, record):
+        out = {"ts": round(record.created, 3), "level": record.levelname, "logger": record.name,
+               "msg": record.getMessage()}
+        for k, v in vars(record).items():
+            if k not in _RECORD_ATTRS:
+                out[k] = v
+        if record.exc_text:
+            out["exc"] = record.exc_text
+        return json.dumps(out, default=str, ensure_ascii=False)
+
+
+_listener = None
+_setup_lock = threading.Lock()
+
+
+def setup_logging(level="INFO", json_lines=False, queue_size=LOG_QUEUE_SIZE, stream=None):
+    """Route every logger through one bounded queue to a writer thread on stream (stdout); idempotent.
+
+    Returns the DroppingQueueHandler (its .dropped counts what didn't fit).
+    """
+    global _listener
+    with _setup_lock:
+        root = logging.getLogger()
+        for h in root.handlers:
+            if isinstance(h, DroppingQueueHandler):
+                return h
+        out = logging.StreamHandler(stream or sys.stdout)
+        out.setFormatter(JsonFormatter() if json_lines else logging.Formatter(TEXT_FORMAT))
+        handler = DroppingQueueHandler(queue.Queue(queue_size))
+        root.addHandler(handler)
+        root.setLevel(level)
+        _listener = logging.handlers.QueueListener(handler.queue, out, respect_handler_level=False)
+        _listener.start()
+        return handler
+
+
+def stop_logging():
+    """Flush what is queued and stop the writer thread (for tests and benchmarks)."""
+    global _listener
+    with _setup_lock:
+        root = logging.getLogger()
+        for h in [h for h in root.handlers if isinstance(h, DroppingQueueHandler)]:
+            root.removeHandler(h)
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
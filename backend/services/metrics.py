@@ -0,0 +1,162 @@
+import bisect, itertools, logging, math, time
+
+log = logging.getLogger(__name__)
+
+# seconds; request handlers and per-fix analysis both sit well inside 10 s
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 10.0)
+# seconds an event spent between its producer and its consumer
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+def _labels(label, key):
+    return f'{{{label}="{key}"}}' if label else ""
+
+
+class Counter:
+    """Monotonic count, optionally split by the values of one label."""
+
+    kind = "counter"
+
+    def __init__(self, name, help, label=None):
+        self.name, self.help, self.label = name, help, label
+        self.values = {}
+
+    def inc(self, key=None, n=1):
+        values = self.values
+        values[key] = values.get(key, 0) + n
+
+    def samples(self):
+        for key, v in sorted(self.values.items(), key=lambda kv: str(kv[0])):
+            yield self.name + _labels(self.label, key), v
+
+
+class Histogram:
+    """Bucketed observations (cumulative on export), optionally split by one label.
+
+    observe() is a bisect and two additions into a preallocated list, with
+    no lock: under the GIL a concurrent update can very rarely be lost,
+    which is fine for monitoring. On paths too hot to time every call, give
+    sample_every=N and only observe when due() says so (one call in N); the
+    distribution stays representative, the count is 1/N of the calls.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS, label=None, sample_every=1):
+        self.name, self.label = name, label
+        self.help = help if sample_every == 1 else f"{help} (sampled 1 in {sample_every})"
+        self.bounds = tuple(buckets)
+        self.series = {}                # key -> [count per bucket..., +Inf count, sum]
+        self.sample_every = sample_every
+        self.due = itertools.cycle((True,) + (False,) * (sample_every - 1)).__next__    # C call, no lock needed
+
+    def observe(self, value, key=None):
+        row = self.series.get(key)
+        if row is None:
+            row = self.series.setdefault(key, [0] * (len(self.bounds) + 1) + [0.0])
+        row[bisect.bisect_left(self.bounds, value)] += 1
+        row[-1] += value
+
+    def time(self, key=None):
+        """Context manager observing the wall time of its block."""
+        return _Timer(self, key)
+
+    def samples(self):
+        for key, row in sorted(self.series.items(), key=lambda kv: str(kv[0])):
+            lbl = f'{self.label}="{key}",' if self.label else ""
+            acc = 0
+            for bound, n in zip(self.bounds + (math.inf,), row):
+                acc += n
+                yield f'{self.name}_bucket{{{lbl}le="{"+Inf" if bound == math.inf else repr(bound)}"}}', acc
+            yield self.name + "_sum" + _labels(self.label, key), row[-1]
+            yield self.name + "_count" + _labels(self.label, key), acc
+
+
+class _Timer:
+    __slots__ = ("hist", "key", "t0")
+
+    def __init__(self, hist, key):
+        self.hist, self.key = hist, key
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.hist.observe(time.perf_counter() - self.t0, self.key)
+
+
+class Sampled:
+    """A gauge or counter read from fn() at scrape time; fn returns a number or {label value: number}."""
+
+    def __init__(self, name, help, fn, kind="gauge", label=None):
+        self.name, self.help, self.fn, self.kind, self.label = name, help, fn, kind, label
+
+    def samples(self):
+        value = self.fn()
+        if isinstance(value, dict):
+            for key, v in sorted(value.items(), key=lambda kv: str(kv[0])):
+                yield self.name + _labels(self.label, key), v
+        else:
+            yield self.name, value
+
+
+class Registry:
+    """A service's metrics, rendered in the Prometheus text format for GET /metrics."""
+
+    def __init__(self):
+        self.metrics = []
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, label=None):
+        return self._add(Counter(name, help, label))
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS, label=None, sample_every=1):
+        return self._add(Histogram(name, help, buckets, label, sample_every))
+
+    def gauge(self, name, help, fn, label=None):
+        return self._add(Sampled(name, help, fn, "gauge", label))
+
+    def counter_fn(self, name, help, fn, label=None):
+        """A counter something else already keeps (e.g. QueuedPublisher.retries)."""
+        return self._add(Sampled(name, help, fn, "counter", label))
+
+    def render(self):
+        out = []
+        for m in self.metrics:
+            out.append(f"# HELP {m.name} {m.help}")
+            out.append(f"# TYPE {m.name} {m.kind}")
+            try:
+                out.extend(f"{name} {value}" for name, value in m.samples())
+            except Exception as e:
+                log.warning("[!] Metric %s failed: %s", m.name, e)
+        return "\n".join(out) + "\n"
+
+
+def instrument_flask(app, registry, prefix):
+    """Per-route request latency and status counts for app, plus GET /metrics serving registry."""
+    from flask import Response, g, request
+
+    latency = registry.histogram(f"{prefix}_request_seconds", "Request handling time by route", label="route")
+    statuses = registry.counter(f"{prefix}_responses_total", "Responses by status code", label="status")
+
+    @app.before_request
+    def _start_timer():
+        g._metrics_t0 = time.perf_counter()
+
+    @app.after_request
+    def _record(response):
+        t0 = g.pop("_metrics_t0", None)
+        if t0 is not None:
+            rule = request.url_rule
+            latency.observe(time.perf_counter() - t0, rule.rule if rule is not None else "unmatched")
+        statuses.inc(response.status_code)
+        return response
+
+    @app.get("/metrics")
+    def metrics():
+        return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+    return latency, statuses
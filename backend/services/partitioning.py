@@ -0,0 +1,32 @@
+import bisect, hashlib, os
+
+# Number of location_updates partitions; location-api and every analytics worker must agree.
+LOCATION_PARTITIONS = int(os.environ.get("LOCATION_PARTITIONS", "1"))
+
+
+def _hash64(s):
+    return int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent-hash ring mapping keys (user ids) onto partitions 0..n-1.
+
+    Each partition owns `vnodes` points on the ring, so going from n to n+1
+    partitions only moves ~1/(n+1) of the keys. Hashing is stable across
+    processes (unlike hash()).
+    """
+
+    def __init__(self, partitions, vnodes=256):
+        self.partitions = partitions
+        points = sorted((_hash64(f"{p}#{v}"), p) for p in range(partitions) for v in range(vnodes))
+        self._keys = [h for h, _ in points]
+        self._owners = [p for _, p in points]
+
+    def partition(self, key):
+        i = bisect.bisect(self._keys, _hash64(str(key))) % len(self._keys)
+        return self._owners[i]
+
+
+def partition_queue(base, partition, partitions=LOCATION_PARTITIONS):
+    """Queue name for a partition; a single partition keeps the plain base name."""
+    return base if partitions == 1 else f"{base}.{partition}"
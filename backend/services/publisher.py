@@ -0,0 +1,151 @@
+import collections, json, logging, queue, threading, time
+from datetime import datetime, timezone
+
+import pika
+
+log = logging.getLogger(__name__)
+
+
+def make_event(event_type, data):
+    """The {type, timestamp, data} envelope every service puts on the wire."""
+    return {
+        "type": event_type,
+        "timestamp": datetime.utcnow().isoformat(),
+        "data": data
+    }
+
+
+_stamp_minute = ("", 0.0)               # (a timestamp's "YYYY-MM-DDTHH:MM" prefix, its epoch)
+
+
+def event_age(event, now=None):
+    """Seconds since make_event() stamped event (epoch now, default time.time()); None if it carries no timestamp.
+
+    Consecutive events share the stamp's minute, so only the seconds are
+    parsed per call; the minute's epoch is cached.
+    """
+    global _stamp_minute
+    now = time.time() if now is None else now
+    try:
+        stamp = event["timestamp"]
+        if len(stamp) not in (19, 26) or stamp[16:17] != ":":  # not make_event's form: parse it whole
+            stamped = datetime.fromisoformat(stamp)
+            if stamped.tzinfo is None:
+                stamped = stamped.replace(tzinfo=timezone.utc)
+            return now - stamped.timestamp()
+        prefix, base = _stamp_minute
+        if not stamp.startswith(prefix) or not prefix:
+            base = datetime.fromisoformat(stamp[:16]).replace(tzinfo=timezone.utc).timestamp()   # naive UTC
+            _stamp_minute = (stamp[:16], base)
+        seconds = float(stamp[17:])
+    except (KeyError, TypeError, ValueError):
+        return None
+    return now - base - seconds
+
+
+class QueuedPublisher:
+    """RabbitMQ publisher owned by one background thread and fed through a bounded buffer.
+
+    Callers on any thread only enqueue. The publisher thread drains up to
+    batch_max messages, publishes them inside one AMQP transaction and
+    commits, so the broker confirms the whole batch in a single round trip.
+    On any failure the batch is kept, the connection is rebuilt and the batch
+    is retried (at-least-once). When the buffer is full publish() returns
+    False so the caller can push back on its own clients. on_commit, if
+    given, is called after every commit with the batch size and how long its
+    oldest message waited between publish() and the broker's confirmation.
+    """
+
+    def __init__(self, params=None, declare=(), maxsize=10000, batch_max=500,
+                 reconnect_delay=1.0, connect=None, on_commit=None):
+        self.params = params or pika.ConnectionParameters("localhost")
+        self.declare = tuple(declare)
+        self.batch_max = batch_max
+        self.reconnect_delay = reconnect_delay
+        self._connect_fn = connect or (lambda: pika.BlockingConnection(self.params))
+        self.on_commit = on_commit
+        self._buffer = queue.Queue(maxsize)
+        self._retry = collections.deque()
+        self._conn = None
+        self._ch = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.published = self.rejected = self.retries = 0
+
+    def publish(self, routing_key, body):
+        """Queue body for routing_key; False if the buffer is full."""
+        if self._thread is None:
+            self._start()
+        try:
+            self._buffer.put_nowait((routing_key, body, time.monotonic()))
+        except queue.Full:
+            self.rejected += 1
+            return False
+        return True
+
+    def publish_event(self, routing_key, event_type, data):
+        return self.publish(routing_key, json.dumps(make_event(event_type, data)))
+
+    def pending(self):
+        return self._buffer.qsize() + len(self._retry)
+
+    def _start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="rabbit-publisher", daemon=True)
+                self._thread.start()
+
+    def _open(self):
+        self._conn = self._connect_fn()
+        ch = self._conn.channel()
+        for q in self.declare:
+            ch.queue_declare(queue=q)
+        ch.tx_select()
+        self._ch = ch
+
+    def _close(self):
+        try:
+            if self._conn is not None:
+                self._conn.close()
+        except Exception:
+            pass
+        self._conn = self._ch = None
+
+    def _next_batch(self):
+        batch = list(self._retry)
+        self._retry.clear()
+        while not batch:
+            try:
+                batch.append(self._buffer.get(timeout=5))
+            except queue.Empty:
+                # idle: let pika answer broker heartbeats
+                if self._conn is not None:
+                    try:
+                        self._conn.process_data_events(0)
+                    except Exception:
+                        self._close()
+        while len(batch) < self.batch_max:
+            try:
+                batch.append(self._buffer.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                if self._ch is None:
+                    self._open()
+                for routing_key, body, _ in batch:
+                    self._ch.basic_publish(exchange="", routing_key=routing_key, body=body)
+                self._ch.tx_commit()
+                self.published += len(batch)
+                if self.on_commit is not None:
+                    self.on_commit(len(batch), time.monotonic() - batch[0][2])
+            except Exception as e:
+                log.warning("[!] Publish of %d message(s) failed: %s. Reconnecting in %ss…", len(batch), e, self.reconnect_delay)
+                self.retries += 1
+                self._retry.extend(batch)
+                self._close()
+                time.sleep(self.reconnect_delay)
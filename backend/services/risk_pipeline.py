@@ -0,0 +1,262 @@
+import math
+
+M_PER_DEG_LAT = 111195.0        # spherical earth, same radius as haversine()
+
+
+def parse_weights(spec):
+    """"off_route=1,speed=0.5" -> {"off_route": 1.0, "speed": 0.5}."""
+    weights = {}
+    for part in (spec or "").split(","):
+        if part.strip():
+            name, _, value = part.partition("=")
+            weights[name.strip()] = float(value)
+    return weights
+
+
+def _clamp01(x):
+    return 0.0 if x <= 0.0 else 1.0 if x >= 1.0 else x
+
+
+def local_step(lat1, lon1, lat2, lon2):
+    """(meters, heading in radians clockwise from north) from fix 1 to fix 2, equirectangular."""
+    dy = (lat2 - lat1) * M_PER_DEG_LAT
+    dx = (lon2 - lon1) * M_PER_DEG_LAT * math.cos(math.radians(lat1))
+    return math.hypot(dx, dy), math.atan2(dx, dy)
+
+
+class Fix:
+    """One fix as the detectors see it, with kinematics relative to the previous accepted fix."""
+
+    __slots__ = ("lat", "lon", "ts", "dt", "step_m", "speed_mps", "heading", "route_dist", "rejected")
+
+    def __init__(self, lat, lon, ts):
+        self.lat, self.lon, self.ts = lat, lon, ts
+        self.dt = None                  # None for a session's first fix
+        self.step_m = 0.0
+        self.speed_mps = 0.0
+        self.heading = None
+        self.route_dist = None          # set by the caller between observe() and score()
+        self.rejected = False
+
+
+class TrackState:
+    """Per-session streaming state: the last accepted fix plus each detector's own state."""
+
+    __slots__ = ("lat", "lon", "ts", "stages", "scores", "score", "rejected")
+
+    def __init__(self, stages):
+        self.lat = self.lon = self.ts = None
+        self.stages = [d.new_state() for d in stages]
+        self.scores = [0.0] * len(stages)
+        self.score = 0.0
+        self.rejected = 0               # fixes dropped by gate detectors so far
+
+
+class Detector:
+    """A pipeline stage. update() sees every accepted fix in order and returns a risk in [0, 1].
+
+    Gate detectors run in observe(), before the fix is accepted, and may set
+    fix.rejected; the others run in score(). Each keeps its per-session state
+    in whatever new_state() returns, and must do O(1) work per fix.
+    """
+
+    name = ""
+    weight = 1.0
+    gate = False
+
+    def new_state(self):
+        return None
+
+    def update(self, st, fix):
+        return 0.0
+
+
+class JumpFilter(Detector):
+    """Rejects GPS glitches: a step longer than min_step_m at an impossible speed.
+
+    After max_rejects rejections in a row the new position is accepted, so a
+    walker whose fix really moved (e.g. leaving a tunnel) is not stuck.
+    """
+
+    name = "jump"
+    gate = True
+
+    def __init__(self, max_speed_mps=50.0, min_step_m=250.0, max_rejects=3):
+        self.max_speed_mps = max_speed_mps
+        self.min_step_m = min_step_m
+        self.max_rejects = max_rejects
+
+    def new_state(self):
+        return [0]                      # consecutive rejections
+
+    def update(self, st, fix):
+        if fix.dt is not None and fix.step_m > self.min_step_m and fix.speed_mps > self.max_speed_mps:
+            if st[0] < self.max_rejects:
+                st[0] += 1
+                fix.rejected = True
+                return 1.0
+        st[0] = 0
+        return 0.0
+
+
+class OffRouteDetector(Detector):
+    """Distance past the threshold, ramped in over sustain_s of staying off-route."""
+
+    name = "off_route"
+
+    def __init__(self, threshold_m=35.0, sustain_s=20.0):
+        self.threshold_m = threshold_m
+        self.sustain_s = sustain_s
+
+    def new_state(self):
+        return [None]                   # ts the walker left the route
+
+    def update(self, st, fix):
+        d = fix.route_dist
+        if d is None or d <= self.threshold_m:
+            st[0] = None
+            return 0.0
+        if st[0] is None:
+            st[0] = fix.ts
+        sustained = _clamp01((fix.ts - st[0]) / self.sustain_s) if self.sustain_s > 0 else 1.0
+        return sustained * _clamp01(d / (2 * self.threshold_m))
+
+
+class SpeedDetector(Detector):
+    """Smoothed speed between walking pace and vehicle speed, e.g. running away or being driven off.
+
+    Speed is measured over at least window_s between anchor fixes, not per
+    step, so a few meters of GPS noise on 1 Hz fixes doesn't read as running.
+    """
+
+    name = "speed"
+    weight = 0.5
+
+    def __init__(self, walk_mps=2.5, vehicle_mps=8.0, window_s=10.0, alpha=0.5):
+        self.walk_mps = walk_mps
+        self.vehicle_mps = vehicle_mps
+        self.window_s = window_s
+        self.alpha = alpha
+
+    def new_state(self):
+        return [None, None, None, None]     # anchor lat, lon, ts; moving average of speed
+
+    def update(self, st, fix):
+        if st[2] is None:
+            st[0], st[1], st[2] = fix.lat, fix.lon, fix.ts
+            return 0.0
+        elapsed = fix.ts - st[2]
+        if elapsed >= self.window_s:
+            v = local_step(st[0], st[1], fix.lat, fix.lon)[0] / elapsed
+            st[3] = v if st[3] is None else st[3] + self.alpha * (v - st[3])
+            st[0], st[1], st[2] = fix.lat, fix.lon, fix.ts
+        if st[3] is None:
+            return 0.0
+        return _clamp01((st[3] - self.walk_mps) / (self.vehicle_mps - self.walk_mps))
+
+
+class DwellDetector(Detector):
+    """Loitering: fixes keep arriving but stay within radius_m of one spot for min_s..max_s."""
+
+    name = "dwell"
+    weight = 0.6
+
+    def __init__(self, radius_m=20.0, min_s=120.0, max_s=600.0):
+        self.radius_m = radius_m
+        self.min_s = min_s
+        self.max_s = max_s
+
+    def new_state(self):
+        return [None, None, None]       # anchor lat, lon, since
+
+    def update(self, st, fix):
+        if st[2] is not None and local_step(st[0], st[1], fix.lat, fix.lon)[0] <= self.radius_m:
+            return _clamp01((fix.ts - st[2] - self.min_s) / (self.max_s - self.min_s))
+        st[0], st[1], st[2] = fix.lat, fix.lon, fix.ts
+        return 0.0
+
+
+class ReversalDetector(Detector):
+    """Repeated heading reversals (pacing back and forth, being chased), decaying over window_s.
+
+    Headings are taken between anchors at least min_step_m apart, so GPS
+    jitter while standing still does not count as turning.
+    """
+
+    name = "reversal"
+    weight = 0.5
+
+    def __init__(self, min_step_m=25.0, angle_deg=150.0, window_s=120.0, count=3):
+        self.min_step_m = min_step_m
+        self.angle = math.radians(angle_deg)
+        self.window_s = window_s
+        self.count = count
+
+    def new_state(self):
+        return [None, None, None, 0.0, 0.0]     # anchor lat, lon, heading, level, level ts
+
+    def update(self, st, fix):
+        if st[0] is None:
+            st[0], st[1], st[4] = fix.lat, fix.lon, fix.ts
+            return 0.0
+        level = st[3] * math.exp(-(fix.ts - st[4]) / self.window_s) if st[3] else 0.0
+        step, heading = local_step(st[0], st[1], fix.lat, fix.lon)
+        if step >= self.min_step_m:
+            if st[2] is not None and abs((heading - st[2] + math.pi) % (2 * math.pi) - math.pi) >= self.angle:
+                level += 1.0
+            st[0], st[1], st[2] = fix.lat, fix.lon, heading
+        st[3], st[4] = level, fix.ts
+        return _clamp01(level / self.count)
+
+
+DETECTORS = {cls.name: cls for cls in (JumpFilter, OffRouteDetector, SpeedDetector, DwellDetector, ReversalDetector)}
+
+
+class RiskPipeline:
+    """Ordered detector stages over a per-session TrackState, combined into one risk score.
+
+    Per fix: observe() computes the step from the last accepted fix and runs
+    the gates; the caller then matches the route (only for accepted fixes)
+    and calls score(). Stage risks combine as 1 - prod(1 - weight * risk),
+    so the score stays in [0, 1] and any one strong signal dominates.
+    """
+
+    def __init__(self, detectors, weights=None):
+        weights = weights or {}
+        self.detectors = list(detectors)
+        self.weights = [_clamp01(weights.get(d.name, d.weight)) for d in self.detectors]
+        self._gates = [(i, d) for i, d in enumerate(self.detectors) if d.gate]
+        self._scorers = [(i, d, self.weights[i]) for i, d in enumerate(self.detectors) if not d.gate]
+
+    def new_state(self):
+        return TrackState(self.detectors)
+
+    def observe(self, state, lat, lon, ts):
+        """The Fix for (lat, lon, ts), or None if a gate rejected it or it repeats the last accepted fix."""
+        fix = Fix(lat, lon, ts)
+        if state.ts is not None:
+            if lat == state.lat and lon == state.lon and ts == state.ts:
+                return None
+            fix.dt = max(1e-6, ts - state.ts)
+            fix.step_m, fix.heading = local_step(state.lat, state.lon, lat, lon)
+            fix.speed_mps = fix.step_m / fix.dt
+        for i, d in self._gates:
+            state.scores[i] = d.update(state.stages[i], fix)
+            if fix.rejected:
+                state.rejected += 1
+                return None
+        state.lat, state.lon, state.ts = lat, lon, ts
+        return fix
+
+    def score(self, state, fix):
+        """Run the scoring detectors on an accepted fix; returns the combined risk in [0, 1]."""
+        keep = 1.0
+        for i, d, w in self._scorers:
+            r = state.scores[i] = d.update(state.stages[i], fix)
+            keep *= 1.0 - w * r
+        state.score = 1.0 - keep
+        return state.score
+
+    def factors(self, state):
+        """{detector name: risk} for the scoring detectors that contributed to the last score."""
+        return {d.name: round(state.scores[i], 2) for i, d, w in self._scorers if w and state.scores[i] > 0}
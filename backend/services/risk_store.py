@@ -0,0 +1,66 @@
+import heapq, itertools, threading, time
+from collections import OrderedDict
+
+
+class RiskStore:
+    """Latest risk payload per key (session id or user id), bounded and expiring.
+
+    Every put() stamps the entry with a store-wide increasing version, so a
+    key's version only ever goes up, even if the key expires and comes back;
+    readers can cheaply ask "anything newer than v?". Entries expire idle_ttl
+    after their last write, or earlier via expire_in() (used on walk.stopped),
+    and the least recently written entry is dropped beyond maxsize.
+    """
+
+    def __init__(self, maxsize=100_000, idle_ttl=2 * 3600, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.idle_ttl = idle_ttl
+        self.clock = clock
+        self._entries = OrderedDict()      # key -> [version, payload, written_at, expires_at]
+        self._early = []                   # heap of (expires_at, key) from expire_in()
+        self._versions = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def put(self, key, payload):
+        """Store payload as key's latest; return its version."""
+        with self._lock:
+            now = self.clock()
+            self._sweep_locked(now)
+            version = next(self._versions)
+            self._entries[key] = [version, payload, now, None]
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            return version
+
+    def get(self, key):
+        """(version, payload) for key, or None if missing or expired."""
+        with self._lock:
+            self._sweep_locked(self.clock())
+            entry = self._entries.get(key)
+            return None if entry is None else (entry[0], entry[1])
+
+    def expire_in(self, key, seconds):
+        """Drop key after `seconds` unless written again before then."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry[3] = self.clock() + seconds
+                heapq.heappush(self._early, (entry[3], key))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _sweep_locked(self, now):
+        # writes keep _entries in written_at order, so idle entries sit at the front
+        cutoff = now - self.idle_ttl
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry[2] > cutoff:
+                break
+            del self._entries[key]
+        while self._early and self._early[0][0] <= now:
+            expires_at, key = heapq.heappop(self._early)
+            entry = self._entries.get(key)
+            if entry is not None and entry[3] == expires_at:
+                del self._entries[key]
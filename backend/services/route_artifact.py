@@ -0,0 +1,143 @@
+import base64, math, sys
+from array import array
+
+from services.route_index import RouteIndex
+from services.session_snapshot import PackedRoute
+
+ARTIFACT_VERSION = 1
+POLYLINE_PRECISION = 6      # 1e-6 degrees, like fix_codec
+
+
+def simplify(xs, ys, tolerance_m):
+    """Indices of the vertices Douglas-Peucker keeps: no dropped vertex is more than tolerance_m off the result."""
+    n = len(xs)
+    if n < 3 or tolerance_m <= 0:
+        return list(range(n))
+    keep = bytearray(n)
+    keep[0] = keep[-1] = 1
+    stack = [(0, n - 1)]
+    while stack:
+        a, b = stack.pop()
+        ax, ay = xs[a], ys[a]
+        vx, vy = xs[b] - ax, ys[b] - ay
+        c2 = vx * vx + vy * vy
+        worst, worst_d = -1, tolerance_m
+        for i in range(a + 1, b):
+            wx, wy = xs[i] - ax, ys[i] - ay
+            t = max(0.0, min(1.0, (wx * vx + wy * vy) / c2)) if c2 > 0 else 0.0
+            d = math.hypot(wx - t * vx, wy - t * vy)
+            if d > worst_d:
+                worst, worst_d = i, d
+        if worst >= 0:
+            keep[worst] = 1
+            stack.append((a, worst))
+            stack.append((worst, b))
+    return [i for i in range(n) if keep[i]]
+
+
+def encode_polyline(lats, lons, precision=POLYLINE_PRECISION):
+    """Google encoded polyline of the points (lats[i], lons[i])."""
+    scale = 10 ** precision
+    out, p_lat, p_lon = [], 0, 0
+    for lat, lon in zip(lats, lons):
+        i_lat, i_lon = round(lat * scale), round(lon * scale)
+        for d in (i_lat - p_lat, i_lon - p_lon):
+            d = ~(d << 1) if d < 0 else d << 1
+            while d >= 0x20:
+                out.append(chr((0x20 | (d & 0x1F)) + 63))
+                d >>= 5
+            out.append(chr(d + 63))
+        p_lat, p_lon = i_lat, i_lon
+    return "".join(out)
+
+
+def decode_polyline(encoded, precision=POLYLINE_PRECISION):
+    """Inverse of encode_polyline, as a flat array('d') of lat, lon pairs (PackedRoute layout)."""
+    scale = 10 ** precision
+    flat = array("d")
+    acc, pos, n = [0, 0], 0, len(encoded)
+    while pos < n:
+        for k in (0, 1):
+            result = shift = 0
+            while True:
+                b = ord(encoded[pos]) - 63
+                pos += 1
+                result |= (b & 0x1F) << shift
+                shift += 5
+                if b < 0x20:
+                    break
+            acc[k] += ~(result >> 1) if result & 1 else result >> 1
+            flat.append(acc[k] / scale)
+    return flat
+
+
+def _b64(typecode, values):
+    arr = array(typecode, values)
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return base64.b64encode(arr.tobytes()).decode("ascii")
+
+
+def _unb64(typecode, text):
+    arr = array(typecode)
+    arr.frombytes(base64.b64decode(text))
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return arr
+
+
+def build_route_artifact(route, tolerance_m=2.0, cell_m=25.0):
+    """Everything analytics needs to match fixes against route ([[lon, lat], ...]), computed once, as a JSON-able dict.
+
+    The route is simplified with Douglas-Peucker at tolerance_m (keep it well
+    under the off-route threshold), then shipped as an encoded polyline (for
+    clients) plus, as base64 arrays, what RouteIndex would otherwise compute:
+    projected vertices, cumulative distances and the segment grid (each
+    segment's bounding box rasterized into cell_m cells).
+    """
+    full = RouteIndex([{"lat": p[1], "lon": p[0]} for p in route], cell_m)
+    kept = simplify(full.xs, full.ys, tolerance_m)
+    idx = RouteIndex([{"lat": route[i][1], "lon": route[i][0]} for i in kept], cell_m)
+    cells = sorted(idx.grid)
+    bounds = [idx._cx_min, idx._cy_min, idx._cx_max, idx._cy_max]
+    offs, segs = [0], []
+    for c in cells:
+        segs.extend(idx.grid[c])
+        offs.append(len(segs))
+    return {
+        "v": ARTIFACT_VERSION,
+        "points": len(kept),
+        "source_points": len(route),
+        "tolerance_m": tolerance_m,
+        "polyline": encode_polyline([route[i][1] for i in kept], [route[i][0] for i in kept]),
+        "lat0": idx.lat0,
+        "lon0": idx.lon0,
+        "cell_m": cell_m,
+        "total_m": idx.total_m,
+        "xy": _b64("f", list(idx.xs) + list(idx.ys)),      # metres from (lat0, lon0), float32
+        "cum": _b64("f", idx.cum),
+        "bounds": bounds,
+        "cells": _b64("H", [v - bounds[k] for c in cells for k, v in enumerate(c)]),   # relative to bounds
+        "offs": _b64("i", offs),
+        "segs": _b64("i", segs),
+    }
+
+
+def load_route_artifact(artifact):
+    """(PackedRoute, RouteIndex) from build_route_artifact() output; raises ValueError if it isn't one."""
+    if artifact.get("v") != ARTIFACT_VERSION:
+        raise ValueError(f"unsupported route artifact version {artifact.get('v')!r}")
+    n = artifact["points"]
+    xy, cum = _unb64("f", artifact["xy"]), _unb64("f", artifact["cum"])
+    cells, offs, segs = _unb64("H", artifact["cells"]), _unb64("i", artifact["offs"]), _unb64("i", artifact["segs"])
+    cx_min, cy_min = artifact["bounds"][:2]
+    if len(xy) != 2 * n or len(cum) != n or len(offs) != len(cells) // 2 + 1:
+        raise ValueError("route artifact arrays don't match its point count")
+    grid = dict(zip(zip([c + cx_min for c in cells[0::2]], [c + cy_min for c in cells[1::2]]),
+                    map(segs.__getitem__, map(slice, offs, offs[1:]))))
+    idx = RouteIndex.from_parts(artifact["lat0"], artifact["lon0"], array("d", xy[:n]), array("d", xy[n:]),
+                                array("d", cum), grid, artifact["cell_m"], artifact["bounds"])
+    # lat/lon back from the projected vertices: cheaper than decoding the polyline, and within a millimetre of it
+    lat0, lon0, kx, ky = idx.lat0, idx.lon0, idx._kx, idx._ky
+    route = PackedRoute(array("d", [v for x, y in zip(idx.xs, idx.ys) for v in (lat0 + y / ky, lon0 + x / kx)]))
+    return route, idx
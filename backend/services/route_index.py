@@ -0,0 +1,158 @@
+import math
+from array import array
+
+EARTH_RADIUS_M = 6371000
+
+
+class RouteIndex:
+    """Route polyline projected once into a local metric frame, with a grid of segments.
+
+    Built once per walk; every fix then only tests the segments in the grid
+    cells around it instead of re-projecting and scanning the whole route.
+    """
+
+    def __init__(self, route, cell_m=25.0):
+        # route: [{"lat", "lon"}, ...] as shipped in walk.started
+        self.cell_m = float(cell_m)
+        self.lat0 = sum(p["lat"] for p in route) / len(route) if route else 0.0
+        self.lon0 = route[0]["lon"] if route else 0.0
+        self._kx = math.radians(1) * EARTH_RADIUS_M * math.cos(math.radians(self.lat0))
+        self._ky = math.radians(1) * EARTH_RADIUS_M
+
+        self.xs = array("d")
+        self.ys = array("d")
+        for p in route:
+            x, y = self.project(p["lat"], p["lon"])
+            self.xs.append(x)
+            self.ys.append(y)
+
+        # cumulative distance (m) along the route at each vertex
+        self.cum = array("d", [0.0] * len(self.xs))
+        for i in range(1, len(self.xs)):
+            self.cum[i] = self.cum[i - 1] + math.hypot(self.xs[i] - self.xs[i - 1], self.ys[i] - self.ys[i - 1])
+        self.total_m = self.cum[-1] if route else 0.0
+
+        self.n_segments = max(0, len(self.xs) - 1)
+        self.grid = {}  # (cx, cy) -> [segment index, ...]
+        self._cx_min = self._cy_min = 0
+        self._cx_max = self._cy_max = -1
+        if self.n_segments:
+            self._build_grid()
+
+    @classmethod
+    def from_parts(cls, lat0, lon0, xs, ys, cum, grid, cell_m=25.0, bounds=None):
+        """An index from an already projected route: float64 arrays xs, ys, cum, grid (cx, cy) -> segments
+        and optionally the grid's (cx_min, cy_min, cx_max, cy_max)."""
+        self = cls.__new__(cls)
+        self.cell_m = float(cell_m)
+        self.lat0, self.lon0 = lat0, lon0
+        self._kx = math.radians(1) * EARTH_RADIUS_M * math.cos(math.radians(lat0))
+        self._ky = math.radians(1) * EARTH_RADIUS_M
+        self.xs, self.ys, self.cum = xs, ys, cum
+        self.total_m = cum[-1] if len(cum) else 0.0
+        self.n_segments = max(0, len(xs) - 1)
+        self.grid = grid
+        self._cx_min = self._cy_min = 0
+        self._cx_max = self._cy_max = -1
+        if bounds:
+            self._cx_min, self._cy_min, self._cx_max, self._cy_max = bounds
+        elif grid:
+            self._cx_min, self._cx_max = min(c[0] for c in grid), max(c[0] for c in grid)
+            self._cy_min, self._cy_max = min(c[1] for c in grid), max(c[1] for c in grid)
+        return self
+
+    def __len__(self):
+        return len(self.xs)
+
+    def project(self, lat, lon):
+        """(lat, lon) -> (x, y) metres in the route's local frame."""
+        return (lon - self.lon0) * self._kx, (lat - self.lat0) * self._ky
+
+    def _cell(self, x, y):
+        return math.floor(x / self.cell_m), math.floor(y / self.cell_m)
+
+    def _build_grid(self):
+        xs, ys, grid = self.xs, self.ys, self.grid
+        cx_min = cy_min = math.inf
+        cx_max = cy_max = -math.inf
+        for i in range(self.n_segments):
+            ax, bx = xs[i], xs[i + 1]
+            ay, by = ys[i], ys[i + 1]
+            c0x, c0y = self._cell(min(ax, bx), min(ay, by))
+            c1x, c1y = self._cell(max(ax, bx), max(ay, by))
+            for cx in range(c0x, c1x + 1):
+                for cy in range(c0y, c1y + 1):
+                    grid.setdefault((cx, cy), []).append(i)
+            cx_min, cy_min = min(cx_min, c0x), min(cy_min, c0y)
+            cx_max, cy_max = max(cx_max, c1x), max(cy_max, c1y)
+        self._cx_min, self._cy_min = cx_min, cy_min
+        self._cx_max, self._cy_max = cx_max, cy_max
+
+    def segment_distance(self, px, py, i):
+        """Distance (m) and clamped projection parameter t of point P onto segment i."""
+        ax, ay = self.xs[i], self.ys[i]
+        vx, vy = self.xs[i + 1] - ax, self.ys[i + 1] - ay
+        wx, wy = px - ax, py - ay
+        c2 = vx * vx + vy * vy
+        t = max(0.0, min(1.0, (wx * vx + wy * vy) / c2)) if c2 > 0 else 0.0
+        return math.hypot(wx - t * vx, wy - t * vy), t
+
+    def nearest(self, lat, lon):
+        """Return (distance_m, segment_index, t) of the closest route segment, or None."""
+        if not self.n_segments:
+            return None
+        px, py = self.project(lat, lon)
+        qx, qy = self._cell(px, py)
+        grid = self.grid
+        best = (math.inf, -1, 0.0)
+        seen = set()
+
+        # Expand square rings of cells around the query cell. Anything not yet
+        # visited after ring r is at least r * cell_m away, so we can stop as
+        # soon as the best hit is that close.
+        max_r = max(
+            abs(qx - self._cx_min), abs(qx - self._cx_max),
+            abs(qy - self._cy_min), abs(qy - self._cy_max),
+        )
+        for r in range(max_r + 1):
+            for cx in range(max(qx - r, self._cx_min), min(qx + r, self._cx_max) + 1):
+                edge = cx == qx - r or cx == qx + r
+                if edge:
+                    cys = range(max(qy - r, self._cy_min), min(qy + r, self._cy_max) + 1)
+                else:
+                    cys = [cy for cy in (qy - r, qy + r) if self._cy_min <= cy <= self._cy_max]
+                for cy in cys:
+                    segs = grid.get((cx, cy))
+                    if not segs:
+                        continue
+                    for i in segs:
+                        if i in seen:
+                            continue
+                        seen.add(i)
+                        d, t = self.segment_distance(px, py, i)
+                        if d < best[0]:
+                            best = (d, i, t)
+            if best[0] <= r * self.cell_m:
+                break
+        return best
+
+    def nearest_in_window(self, lat, lon, seg_idx, back=2, ahead=8):
+        """Like nearest(), but only over segments seg_idx-back .. seg_idx+ahead."""
+        if not self.n_segments:
+            return None
+        px, py = self.project(lat, lon)
+        best = (math.inf, -1, 0.0)
+        for i in range(max(0, seg_idx - back), min(self.n_segments, seg_idx + ahead + 1)):
+            d, t = self.segment_distance(px, py, i)
+            if d < best[0]:
+                best = (d, i, t)
+        return best
+
+    def along(self, seg_idx, t):
+        """Distance (m) along the route to the point at fraction t of segment seg_idx."""
+        return self.cum[seg_idx] + t * (self.cum[seg_idx + 1] - self.cum[seg_idx])
+
+    def distance(self, lat, lon):
+        """Min distance (m) from (lat, lon) to the route polyline, or None if no route."""
+        hit = self.nearest(lat, lon)
+        return hit[0] if hit else None
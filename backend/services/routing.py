@@ -0,0 +1,150 @@
+import json, os, sqlite3, threading, time
+from collections import OrderedDict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+MAPBOX_API_URL = os.environ.get("MAPBOX_API_URL", "https://api.mapbox.com")
+
+# One pooled session for all Flask threads: keeps TLS connections to Mapbox alive
+mapbox_http = requests.Session()
+mapbox_http.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=32))
+mapbox_http.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=32))
+
+
+# ----- routing (walking) -----
+def build_mapbox_walking_route(start, end):
+    token = os.environ.get("MAPBOX_TOKEN", "")
+    if not token:
+        raise RuntimeError("MAPBOX_TOKEN not set")
+    s_lon, s_lat = start
+    e_lon, e_lat = end
+    url = (
+        f"{MAPBOX_API_URL}/directions/v5/mapbox/walking/"
+        f"{s_lon},{s_lat};{e_lon},{e_lat}"
+        f"?geometries=geojson&overview=full&access_token={token}"
+    )
+    r = mapbox_http.get(url, timeout=6)
+    r.raise_for_status()
+    data = r.json()
+    routes = data.get("routes") or []
+    if not routes:
+        raise RuntimeError("No walking route from Mapbox")
+    return routes[0]["geometry"]["coordinates"]
+
+def build_straight_route(start, end, steps=30):
+    s_lon, s_lat = start
+    e_lon, e_lat = end
+    return [
+        [s_lon + (i/steps)*(e_lon - s_lon), s_lat + (i/steps)*(e_lat - s_lat)]
+        for i in range(steps + 1)
+    ]
+
+
+class _Call:
+    """An upstream fetch in flight; identical requests wait on it instead of fetching again."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class RouteCache:
+    """LRU + TTL cache of walking routes keyed by start/end snapped to a ~10 m grid.
+
+    Concurrent misses for the same key are coalesced into a single call to
+    fetch(start, end). Failed fetches are not cached. If db_path is given,
+    routes are also persisted to SQLite so they survive restarts.
+    """
+
+    def __init__(self, fetch, maxsize=2048, ttl=24 * 3600, snap_decimals=4, db_path=None):
+        self.fetch = fetch
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.snap_decimals = snap_decimals
+        self._lru = OrderedDict()        # key -> (expires_at, route)
+        self._inflight = {}              # key -> _Call
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.coalesced = 0
+
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS routes (key TEXT PRIMARY KEY, route TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def key(self, start, end):
+        d = self.snap_decimals
+        return tuple(round(float(v), d) for v in (start[0], start[1], end[0], end[1]))
+
+    def get(self, start, end):
+        """Route for start -> end, from cache or a (coalesced) upstream fetch."""
+        key = self.key(start, end)
+        now = time.time()
+        with self._lock:
+            route = self._lookup_locked(key, now)
+            if route is not None:
+                self.hits += 1
+                return route
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _Call()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self.fetch(start, end)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                if call.error is None:
+                    self._store_locked(key, call.result, now + self.ttl)
+                del self._inflight[key]
+            call.done.set()
+        return call.result
+
+    def _lookup_locked(self, key, now):
+        entry = self._lru.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                self._lru.move_to_end(key)
+                return entry[1]
+            del self._lru[key]
+        if self._db is None:
+            return None
+        row = self._db.execute(
+            "SELECT route, expires_at FROM routes WHERE key = ?", (json.dumps(key),)
+        ).fetchone()
+        if row is None or row[1] <= now:
+            return None
+        route = json.loads(row[0])
+        self._remember_locked(key, route, row[1])
+        return route
+
+    def _store_locked(self, key, route, expires_at):
+        self._remember_locked(key, route, expires_at)
+        if self._db is not None:
+            self._db.execute(
+                "INSERT OR REPLACE INTO routes (key, route, expires_at) VALUES (?, ?, ?)",
+                (json.dumps(key), json.dumps(route), expires_at),
+            )
+            self._db.commit()
+
+    def _remember_locked(self, key, route, expires_at):
+        self._lru[key] = (expires_at, route)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.maxsize:
+            self._lru.popitem(last=False)
@@ -0,0 +1,259 @@
+import json, mmap, os, struct, threading
+from array import array
+from contextlib import contextmanager
+from datetime import datetime
+
+MAGIC = b"SWSNAP\x02\n"
+_FILE_HEAD = struct.Struct("<dQ")           # written at (epoch s), session count
+_LEN = struct.Struct("<I")
+# flags, deadline kind, user_id/sid/route_id byte lengths, route points, fixes, active alerts,
+# start_time, last_update, touched age, deadline in, last_seg_t, distance_along_m, remaining_m,
+# last_speed_mps, last_seg_idx
+_HEAD = struct.Struct("<BBHHHIIIddddddddi")
+# AlertState: severity sent, raises merged, age of the last event, bucket tokens, bucket age
+_ALERT_STATE = struct.Struct("<BIddd")
+# one active alert: type byte length, severity, age, data (JSON) byte length
+_ALERT = struct.Struct("<BBdI")
+
+_DEADLINE_KINDS = (None, "idle", "evict")
+_NONE = float("nan")
+_ACTIVE, _HAS_ROUTE_ID, _HAS_ALERTS = 1, 2, 4
+_encode = json.JSONEncoder(separators=(",", ":")).encode    # json.dumps(separators=) builds one per call
+
+
+class PackedRoute:
+    """A route as flat float64 lat, lon pairs that reads like [{"lat", "lon"}, ...].
+
+    Sessions keep their route packed so snapshots copy it as bytes. flat is
+    an array('d'), or for restored sessions a read-only view into the
+    snapshot file's mapping, so restoring doesn't copy routes at all.
+    """
+
+    __slots__ = ("flat",)
+
+    def __init__(self, flat):
+        self.flat = flat
+
+    @classmethod
+    def from_points(cls, route):
+        flat = array("d")
+        for p in route:
+            flat.append(float(p["lat"]))
+            flat.append(float(p["lon"]))
+        return cls(flat)
+
+    def __len__(self):
+        return len(self.flat) // 2
+
+    def __getitem__(self, k):
+        if k < 0:
+            k += len(self)
+        if not 0 <= k < len(self):
+            raise IndexError("route index out of range")
+        return {"lat": self.flat[2 * k], "lon": self.flat[2 * k + 1]}
+
+    def __iter__(self):
+        flat = self.flat
+        for k in range(0, len(flat), 2):
+            yield {"lat": flat[k], "lon": flat[k + 1]}
+
+
+_EPOCH = datetime(1970, 1, 1)       # naive UTC, like datetime.utcnow()
+
+def _epoch(dt):
+    return _NONE if dt is None else (dt - _EPOCH).total_seconds()
+
+def _utc(ts):
+    return None if ts != ts else datetime.utcfromtimestamp(ts)
+
+def _opt(x):
+    return _NONE if x is None else x
+
+
+def dump_session(session, touched_age, deadline, fixes_kept, alert_now):
+    """One WalkSession as bytes; deadline is (seconds from now, kind) or None.
+
+    The session's AlertState is kept as ages relative to alert_now, the
+    coalescer's clock at capture.
+    """
+    uid = str(session.user_id).encode()
+    sid = (session.walking_session_id or "").encode()
+    rid = b"" if session.route_id is None else str(session.route_id).encode()
+    route = session.route if isinstance(session.route, PackedRoute) else PackedRoute.from_points(session.route)
+    fixes = session.locations.packed(fixes_kept)
+    state = session.alerts
+    alerts = list(state.active.items()) if state is not None else []
+    deadline_in, kind = deadline if deadline else (_NONE, None)
+    flags = ((_ACTIVE if session.is_active else 0) | (_HAS_ROUTE_ID if session.route_id is not None else 0)
+             | (_HAS_ALERTS if state is not None else 0))
+
+    parts = [_HEAD.pack(
+        flags, _DEADLINE_KINDS.index(kind), len(uid), len(sid), len(rid), len(route), len(fixes) // 3, len(alerts),
+        _epoch(session.start_time), _epoch(session.last_update), touched_age, deadline_in, session._last_seg_t,
+        _opt(session.distance_along_m), _opt(session.remaining_m), _opt(session.last_speed_mps),
+        -1 if session._last_seg_idx is None else session._last_seg_idx,
+    ), uid, sid, rid]
+    if state is not None:
+        parts.append(_ALERT_STATE.pack(state.severity, state.merged,
+                                       _NONE if state.sent_at is None else alert_now - state.sent_at,
+                                       state.bucket.tokens, alert_now - state.bucket.stamp))
+        for name, (severity, data, raised_at) in alerts:
+            name, data = name.encode(), _encode(data).encode()
+            parts.append(_ALERT.pack(len(name), severity, alert_now - raised_at, len(data)))
+            parts.append(name)
+            parts.append(data)
+    parts.append(route.flat.tobytes())
+    parts.append(fixes.tobytes())
+    return b"".join(parts)
+
+
+def load_session(buf, new_session, new_alert_state, alert_now):
+    """(session, touched_age, deadline) from dump_session() bytes; new_session(user_id) makes a blank one.
+
+    new_alert_state() makes a blank AlertState; alert times are rebuilt as
+    alert_now less their ages, so pass the coalescer's clock less the time
+    since the snapshot was written.
+    """
+    (flags, kind, n_uid, n_sid, n_rid, n_route, n_fixes, n_alerts, start_time, last_update, touched_age,
+     deadline_in, last_seg_t, along, remaining, speed, seg_idx) = _HEAD.unpack_from(buf)
+    off = _HEAD.size
+    session = new_session(str(buf[off:off + n_uid], "utf-8"))
+    off += n_uid
+    session.walking_session_id = str(buf[off:off + n_sid], "utf-8") if n_sid else None
+    off += n_sid
+    session.route_id = str(buf[off:off + n_rid], "utf-8") if flags & _HAS_ROUTE_ID else None
+    off += n_rid
+    if flags & _HAS_ALERTS:
+        severity, merged, sent_age, tokens, bucket_age = _ALERT_STATE.unpack_from(buf, off)
+        off += _ALERT_STATE.size
+        state = new_alert_state()
+        state.severity, state.merged = severity, merged
+        state.sent_at = None if sent_age != sent_age else alert_now - sent_age
+        state.bucket.tokens, state.bucket.stamp = tokens, alert_now - bucket_age
+        for _ in range(n_alerts):
+            n, severity, age, n_data = _ALERT.unpack_from(buf, off)
+            off += _ALERT.size
+            name = str(buf[off:off + n], "utf-8")
+            off += n
+            state.active[name] = (severity, json.loads(bytes(buf[off:off + n_data])), alert_now - age)
+            off += n_data
+        session.alerts = state
+    if n_route:                     # read in place from the mapped file
+        session.route = PackedRoute(buf[off:off + 16 * n_route].cast("d"))
+        off += 16 * n_route
+    fixes = array("d")
+    fixes.frombytes(buf[off:off + 24 * n_fixes])
+    session.locations.load_packed(fixes)
+
+    session.is_active = bool(flags & _ACTIVE)
+    session.start_time = _utc(start_time)
+    session.last_update = _utc(last_update)
+    session._last_seg_idx = None if seg_idx < 0 else seg_idx
+    session._last_seg_t = last_seg_t
+    session.distance_along_m = None if along != along else along        # NaN stands for None
+    session.remaining_m = None if remaining != remaining else remaining
+    session.last_speed_mps = None if speed != speed else speed
+    return session, touched_age, (deadline_in, _DEADLINE_KINDS[kind]) if kind else None
+
+
+def write_snapshot(path, records, written_at):
+    """Write length-prefixed records to path atomically (temp file, fsync, rename)."""
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(_FILE_HEAD.pack(written_at, len(records)))
+        for r in records:
+            f.write(_LEN.pack(len(r)))
+            f.write(r)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def read_snapshot(path):
+    """(written_at, [memoryview per record]) from a snapshot file; None if there is none. Raises ValueError if corrupt."""
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return None
+    with f:
+        size = os.fstat(f.fileno()).st_size
+        if size < len(MAGIC) + _FILE_HEAD.size:
+            raise ValueError("snapshot file truncated")
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    buf = memoryview(mm)
+    if bytes(buf[:len(MAGIC)]) != MAGIC:
+        raise ValueError("not a session snapshot")
+    written_at, count = _FILE_HEAD.unpack_from(buf, len(MAGIC))
+    off, records = len(MAGIC) + _FILE_HEAD.size, []
+    for _ in range(count):
+        if off + _LEN.size > size:
+            raise ValueError("snapshot file truncated")
+        (n,) = _LEN.unpack_from(buf, off)
+        off += _LEN.size
+        records.append(buf[off:off + n])
+        off += n
+    if off > size:
+        raise ValueError("snapshot file truncated")
+    return written_at, records
+
+
+class SnapshotGate:
+    """Coordinates message handlers with snapshots so a snapshot covers exactly the messages acked after it.
+
+    Handlers run concurrently through run(); a snapshot pauses new handlers,
+    waits for running ones, and collects each consumer's newest ack. Those
+    acks are sent only once the snapshot is on disk, so after a crash the
+    broker redelivers just what the last snapshot missed. With deferred=False
+    every message is acked as soon as it is handled.
+    """
+
+    def __init__(self, deferred=True):
+        self.deferred = deferred
+        self._cond = threading.Condition()
+        self._busy = 0
+        self._paused = False
+        self._acks = {}                 # consumer -> ack(), covering all its earlier messages
+
+    def run(self, consumer, handler, ack):
+        with self._cond:
+            while self._paused:
+                self._cond.wait()
+            self._busy += 1
+        try:
+            handler()
+        finally:
+            with self._cond:
+                self._busy -= 1
+                if self.deferred:
+                    self._acks[consumer] = ack
+                if not self._busy:
+                    self._cond.notify_all()
+        if not self.deferred:
+            ack()
+
+    @contextmanager
+    def paused(self):
+        """Hold off handlers; yields the acks to send once what is captured inside is durable."""
+        with self._cond:
+            self._paused = True
+            while self._busy:
+                self._cond.wait()
+            acks, self._acks = self._acks, {}
+        try:
+            yield acks
+        finally:
+            with self._cond:
+                self._paused = False
+                self._cond.notify_all()
+
+    def retry(self, acks):
+        """Put back acks whose snapshot failed (unless a newer ack for that consumer has arrived)."""
+        with self._cond:
+            for consumer, ack in acks.items():
+                self._acks.setdefault(consumer, ack)
+
+    def forget(self, consumer):
+        """Drop a consumer's pending ack (its channel is gone; the broker will redeliver)."""
+        with self._cond:
+            self._acks.pop(consumer, None)
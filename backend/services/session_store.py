@@ -0,0 +1,115 @@
+import threading, time
+
+
+class SessionStore:
+    """Sessions keyed by user_id, split over lock-striped shards.
+
+    Each shard is a dict guarded by its own RLock, so threads working on users
+    in different shards never contend. lock(key) hands out the shard lock for
+    callers that need to read-modify-write a session atomically. Entries not
+    touched for ttl seconds are dropped by evict_expired().
+    """
+
+    def __init__(self, shards=16, ttl=None, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self._shards = [({}, {}, threading.RLock()) for _ in range(shards)]   # (items, last_touch, lock)
+
+    def _shard(self, key):
+        return self._shards[hash(key) % len(self._shards)]
+
+    def lock(self, key):
+        """The lock guarding key's shard (re-entrant)."""
+        return self._shard(key)[2]
+
+    def get(self, key, default=None):
+        items, _, lock = self._shard(key)
+        with lock:
+            return items.get(key, default)
+
+    def get_or_create(self, key, factory):
+        """Return the value for key, creating it with factory(key) if missing; marks key as touched."""
+        items, touched, lock = self._shard(key)
+        with lock:
+            value = items.get(key)
+            if value is None:
+                value = items[key] = factory(key)
+            touched[key] = self.clock()
+            return value
+
+    def put(self, key, value, age=0.0):
+        """Insert or replace key, as if last touched age seconds ago (used when restoring)."""
+        items, touched, lock = self._shard(key)
+        with lock:
+            items[key] = value
+            touched[key] = self.clock() - age
+
+    def put_many(self, entries):
+        """put() for many (key, value, age) at once, taking each shard lock once."""
+        now = self.clock()
+        by_shard = {}
+        for key, value, age in entries:
+            by_shard.setdefault(hash(key) % len(self._shards), []).append((key, value, now - age))
+        for i, group in by_shard.items():
+            items, touched, lock = self._shards[i]
+            with lock:
+                for key, value, t in group:
+                    items[key] = value
+                    touched[key] = t
+
+    def last_touch(self, key):
+        """Clock reading of key's last touch, or None."""
+        _, touched, lock = self._shard(key)
+        with lock:
+            return touched.get(key)
+
+    def touch(self, key):
+        items, touched, lock = self._shard(key)
+        with lock:
+            if key in items:
+                touched[key] = self.clock()
+
+    def pop(self, key, default=None):
+        items, touched, lock = self._shard(key)
+        with lock:
+            touched.pop(key, None)
+            return items.pop(key, default)
+
+    def __contains__(self, key):
+        items, _, lock = self._shard(key)
+        with lock:
+            return key in items
+
+    def __len__(self):
+        return sum(len(items) for items, _, _ in self._shards)
+
+    def clear(self):
+        for items, touched, lock in self._shards:
+            with lock:
+                items.clear()
+                touched.clear()
+
+    def snapshot(self):
+        """Point-in-time list of (key, value), copied one shard at a time."""
+        out = []
+        for items, _, lock in self._shards:
+            with lock:
+                out.extend(items.items())
+        return out
+
+    def items(self):
+        return iter(self.snapshot())
+
+    def evict_expired(self, now=None):
+        """Drop entries not touched within ttl; return the evicted (key, value) pairs."""
+        if self.ttl is None:
+            return []
+        cutoff = (self.clock() if now is None else now) - self.ttl
+        evicted = []
+        for items, touched, lock in self._shards:
+            with lock:
+                stale = [k for k, t in touched.items() if t < cutoff]
+                for k in stale:
+                    del touched[k]
+                    evicted.append((k, items.pop(k, None)))
+        return evicted
@@ -0,0 +1,62 @@
+import math
+
+M_PER_DEG_LAT = 111195.0
+
+
+class TrackSmoother:
+    """Streaming alpha-beta filter over one walker's fixes, in a local metric frame.
+
+    Each fix is blended with the position predicted from the previous
+    estimate and velocity: alpha weighs the new fix, beta how fast the
+    velocity follows. alpha=1, beta=0 passes fixes through unchanged. After a
+    gap longer than reset_after_s the filter restarts at the new fix.
+
+    It also remembers where route matching last ran (due()), so callers can
+    skip matching while the smoothed position barely moves.
+    """
+
+    __slots__ = ("alpha", "beta", "reset_after_s", "lat0", "_kx", "x", "y", "vx", "vy", "ts",
+                 "checked_x", "checked_y", "checked_ts", "route_dist")
+
+    def __init__(self, alpha=0.5, beta=0.1, reset_after_s=30.0):
+        self.alpha = alpha
+        self.beta = beta
+        self.reset_after_s = reset_after_s
+        self.lat0 = None
+        self.ts = None
+        self.checked_ts = None
+        self.route_dist = None          # distance from the route at the last check
+
+    def update(self, lat, lon, ts):
+        """Feed a raw fix; returns the smoothed (lat, lon)."""
+        if self.lat0 is None:
+            self.lat0 = lat
+            self._kx = M_PER_DEG_LAT * math.cos(math.radians(lat))
+        zx, zy = lon * self._kx, lat * M_PER_DEG_LAT
+        dt = ts - self.ts if self.ts is not None else None
+        if dt is None or dt > self.reset_after_s:
+            self.x, self.y, self.vx, self.vy = zx, zy, 0.0, 0.0
+        elif dt > 0:
+            px, py = self.x + self.vx * dt, self.y + self.vy * dt
+            rx, ry = zx - px, zy - py
+            self.x, self.y = px + self.alpha * rx, py + self.alpha * ry
+            self.vx += self.beta * rx / dt
+            self.vy += self.beta * ry / dt
+        else:                           # same or older timestamp: correct position only
+            self.x += self.alpha * (zx - self.x)
+            self.y += self.alpha * (zy - self.y)
+        if dt is None or dt > 0:
+            self.ts = ts
+        return self.y / M_PER_DEG_LAT, self.x / self._kx
+
+    def speed(self):
+        """Smoothed speed in m/s."""
+        return math.hypot(self.vx, self.vy) if self.ts is not None else 0.0
+
+    def due(self, min_move_m, max_age_s):
+        """True (and marks a check) unless the last check is within max_age_s and min_move_m of now."""
+        if self.checked_ts is not None and self.ts - self.checked_ts < max_age_s \
+                and math.hypot(self.x - self.checked_x, self.y - self.checked_y) < min_move_m:
+            return False
+        self.checked_x, self.checked_y, self.checked_ts = self.x, self.y, self.ts
+        return True
@@ -0,0 +1,196 @@
+import os, sqlite3, sys, threading, time, zlib
+from array import array
+from itertools import accumulate
+
+from services.fix_codec import COORD_SCALE, TIME_SCALE
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS chunks (user_id TEXT NOT NULL, session_id TEXT, t_start REAL NOT NULL, "
+    "t_end REAL NOT NULL, n INTEGER NOT NULL, lat0 INTEGER NOT NULL, lon0 INTEGER NOT NULL, "
+    "ts0 INTEGER NOT NULL, data BLOB NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS chunks_user_time ON chunks (user_id, t_start)",
+)
+_SUFFIX = ".db"
+
+
+def _day(ts):
+    return time.strftime("%Y-%m-%d", time.gmtime(ts))
+
+
+def encode_chunk(lats, lons, tss):
+    """Columns of scaled ints -> (lat0, lon0, ts0, blob): each column delta-encoded as int32, then zlib'd together."""
+    cols = array("i")
+    for col in (lats, lons, tss):
+        cols.append(0)
+        cols.extend([b - a for a, b in zip(col, col[1:])])
+    if sys.byteorder == "big":
+        cols.byteswap()
+    return lats[0], lons[0], tss[0], zlib.compress(cols.tobytes(), 6)
+
+
+def decode_chunk(n, lat0, lon0, ts0, blob):
+    """[(lat, lon, ts), ...] from encode_chunk() output."""
+    cols = array("i")
+    cols.frombytes(zlib.decompress(blob))
+    if sys.byteorder == "big":
+        cols.byteswap()
+    if len(cols) != 3 * n:
+        raise ValueError("chunk length mismatch")
+    lats = accumulate(cols[1:n], initial=lat0)
+    lons = accumulate(cols[n + 1:2 * n], initial=lon0)
+    tss = accumulate(cols[2 * n + 1:], initial=ts0)
+    return [(a / COORD_SCALE, o / COORD_SCALE, t / TIME_SCALE) for a, o, t in zip(lats, lons, tss)]
+
+
+class TrajectoryStore:
+    """Walk history as compressed columnar chunks in one SQLite file per UTC day under root.
+
+    append() buffers fixes per (user, session) in memory; flush() seals
+    buffers that are full, older than max_age or ended, and writes them with
+    one transaction per day file. Chunks never cross midnight, so a time
+    window query only opens the days it covers, and pruning old history is
+    deleting files. Writes go through one thread at a time; any number of
+    processes can read (WAL mode).
+    """
+
+    def __init__(self, root, chunk_fixes=600, clock=time.monotonic):
+        self.root = root
+        self.chunk_fixes = chunk_fixes
+        self.clock = clock
+        os.makedirs(root, exist_ok=True)
+        self._open = {}             # (user_id, session_id) -> [day, opened_at, lats, lons, tss]
+        self._sealed = []           # (user_id, session_id, day, lats, lons, tss)
+        self._lock = threading.Lock()
+        self._dbs = {}              # day -> sqlite3.Connection
+        self._db_lock = threading.Lock()
+
+    # ----- writing -----
+    def append(self, user_id, session_id, lat, lon, ts):
+        day = _day(ts)
+        key = (user_id, session_id)
+        with self._lock:
+            buf = self._open.get(key)
+            if buf is None or buf[0] != day or len(buf[2]) >= self.chunk_fixes:
+                if buf is not None:
+                    self._sealed.append((user_id, session_id, buf[0], buf[2], buf[3], buf[4]))
+                buf = self._open[key] = [day, self.clock(), [], [], []]
+            buf[2].append(round(lat * COORD_SCALE))
+            buf[3].append(round(lon * COORD_SCALE))
+            buf[4].append(round(ts * TIME_SCALE))
+
+    def end_session(self, user_id, session_id):
+        """Seal the session's open chunk so the next flush() writes it."""
+        with self._lock:
+            buf = self._open.pop((user_id, session_id), None)
+            if buf is not None:
+                self._sealed.append((user_id, session_id, buf[0], buf[2], buf[3], buf[4]))
+
+    def flush(self, max_age=0.0):
+        """Write sealed chunks and open ones buffered for max_age seconds or more; returns fixes written."""
+        cutoff = self.clock() - max_age
+        with self._lock:
+            for key in [k for k, buf in self._open.items() if buf[1] <= cutoff]:
+                buf = self._open.pop(key)
+                self._sealed.append((key[0], key[1], buf[0], buf[2], buf[3], buf[4]))
+            sealed, self._sealed = self._sealed, []
+        if not sealed:
+            return 0
+
+        by_day = {}
+        for user_id, session_id, day, lats, lons, tss in sealed:
+            lat0, lon0, ts0, blob = encode_chunk(lats, lons, tss)
+            by_day.setdefault(day, []).append((user_id, session_id, min(tss) / TIME_SCALE, max(tss) / TIME_SCALE,
+                                               len(tss), lat0, lon0, ts0, blob))
+        with self._db_lock:
+            for day, rows in by_day.items():
+                db = self._db(day, create=True)
+                with db:
+                    db.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        return sum(len(s[5]) for s in sealed)
+
+    def pending(self):
+        """Fixes buffered but not yet written."""
+        with self._lock:
+            return sum(len(buf[2]) for buf in self._open.values()) + sum(len(s[5]) for s in self._sealed)
+
+    # ----- reading -----
+    def query(self, user_id, t_from, t_to, session_id=None):
+        """Written fixes for user_id with t_from <= ts <= t_to, in time order; optionally one session only."""
+        sql = "SELECT n, lat0, lon0, ts0, data FROM chunks WHERE user_id = ? AND t_start <= ? AND t_end >= ?"
+        args = [user_id, t_to, t_from]
+        if session_id is not None:
+            sql += " AND session_id = ?"
+            args.append(session_id)
+        fixes = []
+        with self._db_lock:
+            for day in self.days(t_from, t_to):
+                db = self._db(day)
+                if db is None:
+                    continue
+                for row in db.execute(sql, args).fetchall():
+                    fixes.extend(f for f in decode_chunk(*row) if t_from <= f[2] <= t_to)
+        fixes.sort(key=lambda f: f[2])
+        return fixes
+
+    def sessions(self, user_id, t_from, t_to):
+        """[(session_id, first ts, last ts, fixes), ...] for user_id's walks overlapping the window."""
+        walks = {}
+        with self._db_lock:
+            for day in self.days(t_from, t_to):
+                db = self._db(day)
+                if db is None:
+                    continue
+                for sid, t0, t1, n in db.execute(
+                        "SELECT session_id, MIN(t_start), MAX(t_end), SUM(n) FROM chunks "
+                        "WHERE user_id = ? AND t_start <= ? AND t_end >= ? GROUP BY session_id",
+                        (user_id, t_to, t_from)):
+                    w = walks.get(sid)
+                    walks[sid] = (sid, t0, t1, n) if w is None else (sid, min(w[1], t0), max(w[2], t1), w[3] + n)
+        return sorted(walks.values(), key=lambda w: w[1])
+
+    def days(self, t_from, t_to):
+        """Day partitions on disk that can hold fixes in the window."""
+        lo, hi = _day(max(t_from, 0)), _day(max(t_to, 0))
+        names = (f[:-len(_SUFFIX)] for f in os.listdir(self.root) if f.endswith(_SUFFIX))
+        return sorted(d for d in names if lo <= d <= hi)
+
+    def prune(self, before_ts):
+        """Delete whole days that end before before_ts; returns how many."""
+        cutoff = _day(before_ts)
+        dropped = 0
+        with self._db_lock:
+            for day in self.days(0, before_ts):
+                if day >= cutoff:
+                    continue
+                db = self._dbs.pop(day, None)
+                if db is not None:
+                    db.close()
+                for suffix in (_SUFFIX, _SUFFIX + "-wal", _SUFFIX + "-shm"):
+                    try:
+                        os.remove(os.path.join(self.root, day + suffix))
+                    except FileNotFoundError:
+                        pass
+                dropped += 1
+        return dropped
+
+    def close(self):
+        with self._db_lock:
+            for db in self._dbs.values():
+                db.close()
+            self._dbs.clear()
+
+    def _db(self, day, create=False):
+        db = self._dbs.get(day)
+        if db is not None:
+            return db
+        path = os.path.join(self.root, day + _SUFFIX)
+        if not create and not os.path.exists(path):
+            return None
+        db = sqlite3.connect(path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        for stmt in _SCHEMA:
+            db.execute(stmt)
+        db.commit()
+        self._dbs[day] = db
+        return db
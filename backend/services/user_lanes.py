@@ -0,0 +1,46 @@
+import asyncio, logging
+from collections import deque
+
+log = logging.getLogger(__name__)
+
+
+class UserLanes:
+    """Per-key FIFO lanes on one event loop.
+
+    Items submitted for the same key are processed strictly in order by one
+    task; different keys run concurrently, so one user awaiting I/O (e.g. a
+    publish confirm) never holds up another. A lane's task exits when its
+    queue drains and is recreated on the next submit.
+    """
+
+    def __init__(self, process):
+        self.process = process          # async process(item)
+        self._lanes = {}                # key -> deque of items
+        self._tasks = set()
+
+    def submit(self, key, item):
+        lane = self._lanes.get(key)
+        if lane is not None:
+            lane.append(item)
+            return
+        lane = self._lanes[key] = deque([item])
+        task = asyncio.get_running_loop().create_task(self._drain(key, lane))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _drain(self, key, lane):
+        while lane:
+            try:
+                await self.process(lane[0])
+            except Exception:
+                log.exception("[!] Lane %s error", key)
+            lane.popleft()
+        del self._lanes[key]
+
+    async def join(self):
+        """Wait until every lane has drained."""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks))
+
+    def __len__(self):
+        return len(self._lanes)
@@ -1,20 +1,36 @@
 # twilio-api.py
 import os
 from flask import Flask, request, jsonify
+from requests.adapters import HTTPAdapter
+from twilio.base.exceptions import TwilioRestException
+from twilio.http.http_client import TwilioHttpClient
 from twilio.rest import Client
 from dotenv import load_dotenv
 from flask_cors import CORS
 
+from services.call_dispatcher import CHANNELS, CallDispatcher, PermanentError
+from services.metrics import Registry, instrument_flask
+
 load_dotenv()
 
 app = Flask(__name__)
 CORS(app)
 
+# GET /metrics: per-route latency plus the outcome and duration of Twilio calls
+metrics = Registry()
+instrument_flask(app, metrics, "twilio_api")
+REQUESTS = metrics.counter("twilio_api_emergency_requests_total", "Emergency requests by outcome", label="outcome")
+TWILIO_SECONDS = metrics.histogram("twilio_api_twilio_seconds", "Twilio create round trip by channel", label="channel")
+metrics.counter_fn("twilio_api_tasks_total", "Guardian calls / SMS by outcome", lambda: {
+    "placed": dispatcher.placed, "failed": dispatcher.failed, "retried": dispatcher.retried}, label="outcome")
+metrics.gauge("twilio_api_tasks_pending", "Calls / SMS waiting for a worker or a retry", lambda: dispatcher.pending())
+
 # Twilio credentials
 TWILIO_SID = os.getenv("TWILIO_ACCOUNT_SID")
 TWILIO_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
 # Support both names just in case
 TWILIO_NUMBER = os.getenv("TWILIO_PHONE_NUMBER") or os.getenv("TWILIO_FROM_NUMBER")
+TWILIO_API_BASE = os.getenv("TWILIO_API_BASE")   # e.g. http://localhost:8089 for a local stub of the REST API
 # MY_NUMBER = "+16135012873"     # your phone number (receiver)
 
 # Voice + message config
@@ -24,25 +40,10 @@ ALERT_MESSAGE = os.getenv(
     "TWILIO_GUARDIAN_ALERT_MESSAGE",
     "HELLO, THIS IS AN AUTO GENERATE IMPORTANT CALL. YOU ARE THE GUARDIAN AND THE PERSON IS IN DANGER, PLEASE SEEK HELP IMMEDIATELY."
 )
+SMS_MESSAGE = os.getenv("TWILIO_GUARDIAN_SMS_MESSAGE", ALERT_MESSAGE)
 
-client = Client(TWILIO_SID, TWILIO_TOKEN)
-
-@app.route("/api/call_emergency", methods=["POST"])
-def call_emergency():
-    try:
-        data = request.get_json(force=True)
-        phone = data.get("phone")
-        # to_number = MY_NUMBER
-
-        if not phone:
-            return jsonify({"error": "Missing 'phone' field"}), 400
-        if not TWILIO_SID or not TWILIO_TOKEN:
-            return jsonify({"error": "Twilio credentials missing"}), 500
-        if not TWILIO_NUMBER:
-            return jsonify({"error": "TWILIO_PHONE_NUMBER (or TWILIO_FROM_NUMBER) not set"}), 500
-
-        # Build TwiML that repeats the message twice with a pause
-        twiml = f"""
+# TwiML that repeats the message twice with a pause
+TWIML = f"""
 <Response>
   <Say voice="{TWILIO_VOICE}">{ALERT_MESSAGE}</Say>
   <Pause length="1"/>
@@ -50,19 +51,102 @@ def call_emergency():
 </Response>
 """.strip()
 
-        call = client.calls.create(
-            to=phone, # to_number,
-            from_=TWILIO_NUMBER,
-            twiml=twiml
-        )
+# ------------------------------
+# Dispatcher: requests only queue a job; a worker pool places the calls / SMS
+# in parallel, retrying transient failures with exponential backoff.
+# ------------------------------
+CALL_WORKERS = int(os.getenv("CALL_WORKERS", "16"))
+CALL_MAX_ATTEMPTS = int(os.getenv("CALL_MAX_ATTEMPTS", "4"))
+CALL_RETRY_BASE_SEC = float(os.getenv("CALL_RETRY_BASE_SEC", "2"))    # 2 s, 4 s, 8 s… between attempts
+CALL_JOB_TTL_SEC = float(os.getenv("CALL_JOB_TTL_SEC", "3600"))       # job status (and dedup) kept this long
+TWILIO_TIMEOUT_SEC = float(os.getenv("TWILIO_TIMEOUT_SEC", "10"))
+MAX_GUARDIANS = 20
+
+# One connection per worker, and a timeout so a hung request can't hold a worker forever
+http_client = TwilioHttpClient(timeout=TWILIO_TIMEOUT_SEC)
+for prefix in ("https://", "http://"):
+    http_client.session.mount(prefix, HTTPAdapter(pool_maxsize=CALL_WORKERS))
+client = Client(TWILIO_SID, TWILIO_TOKEN, http_client=http_client)
+if TWILIO_API_BASE:
+    client.api.base_url = TWILIO_API_BASE.rstrip("/")
+
+def place(channel, to):
+    """Place one call or SMS through Twilio; returns its sid. Client errors other than 429 are not retried."""
+    try:
+        with TWILIO_SECONDS.time(channel):
+            if channel == "sms":
+                return client.messages.create(to=to, from_=TWILIO_NUMBER, body=SMS_MESSAGE).sid
+            return client.calls.create(to=to, from_=TWILIO_NUMBER, twiml=TWIML).sid
+    except TwilioRestException as e:
+        if 400 <= e.status < 500 and e.status != 429:
+            raise PermanentError(f"Twilio {e.status}: {e.msg}") from e
+        raise
+
+dispatcher = CallDispatcher(place, workers=CALL_WORKERS, max_attempts=CALL_MAX_ATTEMPTS,
+                            retry_base_s=CALL_RETRY_BASE_SEC, job_ttl_s=CALL_JOB_TTL_SEC)
+
+def parse_guardians(data):
+    """[(channel, phone), ...] from "guardians" (or the single "phone"), or (None, error)."""
+    guardians = data.get("guardians")
+    if guardians is None:
+        guardians = [data["phone"]] if data.get("phone") else []
+    if not isinstance(guardians, list) or not guardians:
+        return None, "Missing 'guardians' (or 'phone') field"
+    if len(guardians) > MAX_GUARDIANS:
+        return None, f"At most {MAX_GUARDIANS} guardians"
+    default_channels = data.get("channels") or ["call"]
+    targets = []
+    for g in guardians:
+        phone, channels = (g.get("phone"), g.get("channels") or default_channels) if isinstance(g, dict) else (g, default_channels)
+        if not isinstance(phone, str) or not phone.strip():
+            return None, "Each guardian needs a 'phone' string"
+        if not isinstance(channels, list) or not channels or not set(channels) <= set(CHANNELS):
+            return None, f"channels must be a non-empty list of {list(CHANNELS)}"
+        targets.extend((c, phone.strip()) for c in channels)
+    return list(dict.fromkeys(targets)), None   # the same number twice is still one call
+
+@app.route("/api/call_emergency", methods=["POST"])
+def call_emergency():
+    """
+    Body:
+    {
+      "walking_session_id": "...",
+      "guardians": ["+1613...", {"phone": "+1416...", "channels": ["call", "sms"]}],
+      "channels": ["call"],              # for guardians given as plain numbers (default: call)
+      "idempotency_key": "..."           # or an Idempotency-Key header
+    }
+    "phone": "+1613..." still works for a single guardian. Answers 202 with
+    the job right away; a repeat for the same walk and key places nothing
+    new and answers 200 with the first job. Poll GET /api/call_emergency/<job_id>.
+    """
+    data = request.get_json(force=True, silent=True)
+    if not isinstance(data, dict):
+        REQUESTS.inc("rejected")
+        return jsonify({"error": "Invalid JSON"}), 400
+    targets, error = parse_guardians(data)
+    if error:
+        REQUESTS.inc("rejected")
+        return jsonify({"error": error}), 400
+    if not TWILIO_SID or not TWILIO_TOKEN:
+        REQUESTS.inc("misconfigured")
+        return jsonify({"error": "Twilio credentials missing"}), 500
+    if not TWILIO_NUMBER:
+        REQUESTS.inc("misconfigured")
+        return jsonify({"error": "TWILIO_PHONE_NUMBER (or TWILIO_FROM_NUMBER) not set"}), 500
 
-        return jsonify({"message": "Call placed", "call_sid": call.sid}), 200
+    key = request.headers.get("Idempotency-Key") or data.get("idempotency_key") or ""
+    job, created = dispatcher.submit(data.get("walking_session_id"), str(key), targets)
+    REQUESTS.inc("accepted" if created else "duplicate")
+    job["status_url"] = f"/api/call_emergency/{job['job_id']}"
+    return jsonify(job), 202 if created else 200
 
-    except Exception as e:
-        # Print to server logs to aid debugging
-        print("❌ ERROR during Twilio call:", e)
-        import traceback; traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+@app.get("/api/call_emergency/<job_id>")
+def call_emergency_status(job_id):
+    job = dispatcher.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job"}), 404
+    job["status_url"] = f"/api/call_emergency/{job_id}"
+    return jsonify(job), 200
 
 if __name__ == "__main__":
     # 0.0.0.0 so ngrok can reach it
@@ -50,6 +50,11 @@ function App() {
 
   const emergencyAudioRef = useRef(null);
   const [emergencyOn, setEmergencyOn] = useState(false);
+  // One Idempotency-Key per emergency (until it is switched off): repeat presses,
+  // the safe word and retries all reuse it, so guardians are called once
+  const emergencyKeyRef = useRef(null);
+  const callJobRef = useRef(false);
+  const [callJobActive, setCallJobActive] = useState(false);
   // Load emergency phone from localStorage if available
   const [emergencyPhone, setEmergencyPhone] = useState(() => {
     return localStorage.getItem("emergency_phone") || "6135012873";
@@ -99,6 +104,8 @@ function App() {
   // }
 
   const [riskScore, setRiskScore] = useState(40);
+  const [riskSeverity, setRiskSeverity] = useState(0);  // 1–3 from the coalesced alert, 0 = none yet
+  const [riskAlerts, setRiskAlerts] = useState([]);     // message of every alert active for the walk
 
 
   useEffect(() => {
@@ -260,20 +267,34 @@ function App() {
 
   // 🔔 Trigger emergency call (Twilio integration)
   const triggerEmergencyCall = async () => {
-    try {
-      // If running on a mobile browser, use the device dialer directly
-      if (/Mobi|Android/i.test(navigator.userAgent)) {
-        window.location.href = `tel:${emergencyPhone}`;
-        return;
-      }
+    // If running on a mobile browser, use the device dialer directly
+    if (/Mobi|Android/i.test(navigator.userAgent)) {
+      window.location.href = `tel:${emergencyPhone}`;
+      return;
+    }
+    if (callJobRef.current) return; // a call job is already queued or running
+    callJobRef.current = true;
+    setCallJobActive(true);
+    if (!emergencyKeyRef.current) emergencyKeyRef.current = crypto.randomUUID();
 
-      // Otherwise, call backend Twilio API
+    try {
+      // Otherwise, call backend Twilio API; the key makes resending safe
       const backendUrl = import.meta.env.VITE_BACKEND_URL || "http://localhost:3001";
-      const res = await fetch(`${backendUrl}/api/call_emergency`, {
+      const post = () => fetch(`${backendUrl}/api/call_emergency`, {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ phone: emergencyPhone }),
+        headers: { "Content-Type": "application/json", "Idempotency-Key": emergencyKeyRef.current },
+        body: JSON.stringify({ phone: emergencyPhone, walking_session_id: sessionId }),
       });
+      let res;
+      for (let attempt = 1; ; attempt++) {
+        try {
+          res = await post();
+          if (res.status < 500 || attempt === 3) break;
+        } catch (err) {
+          if (attempt === 3) throw err;
+        }
+        await new Promise((r) => setTimeout(r, 1000));
+      }
 
       if (!res.ok) {
         const err = await res.json().catch(() => ({}));
@@ -282,12 +303,32 @@ function App() {
         return;
       }
 
-      const json = await res.json();
-      console.log("Call placed:", json);
-      alert("✅ Emergency call placed via backend (Twilio).");
+      // The backend only queues the call (202); poll the job until Twilio has answered
+      let job = await res.json();
+      const deadline = Date.now() + 30000;
+      while ((job.status === "queued" || job.status === "in_progress") && Date.now() < deadline) {
+        await new Promise((r) => setTimeout(r, 1000));
+        const poll = await fetch(`${backendUrl}${job.status_url}`);
+        if (poll.ok) job = await poll.json();
+      }
+      console.log("Call job:", job);
+
+      const failed = (job.tasks || []).filter((t) => t.status === "failed");
+      if (job.status === "placed") {
+        alert("✅ Emergency call placed via backend (Twilio).");
+      } else if (job.status === "partial") {
+        alert(`⚠️ Some emergency calls failed: ${failed.map((t) => `${t.to} (${t.error})`).join(", ")}`);
+      } else if (job.status === "failed") {
+        alert(`Failed to place the emergency call: ${failed.map((t) => t.error).join(", ")}`);
+      } else {
+        alert("⏳ Emergency call still being placed. Call your contact directly if you can.");
+      }
     } catch (err) {
       console.error("Error triggering Twilio call:", err);
       alert("⚠️ Could not contact backend.");
+    } finally {
+      callJobRef.current = false;
+      setCallJobActive(false);
     }
   };
 
@@ -325,6 +366,7 @@ function App() {
       audio.pause();
       audio.currentTime = 0; // reset to start
       setEmergencyOn(false);
+      emergencyKeyRef.current = null; // the next emergency is a new call job
     }
   };
 
@@ -417,17 +459,36 @@ function App() {
 
   useEffect(() => {
     if (!sessionId) return;           // wait until /start_walk returns
+    // { alert_type, message, severity, alerts: {type: message}, risk_score? (0–1) }, as /risk/latest and /risk/stream send it
+    const SEVERITY_SCORE = { 1: 45, 2: 60, 3: 85 };   // onto the 0–100 scale the UI bands use (33 / 66)
+    const applyRisk = (json) => {
+      if (!json || !json.alert_type) return;          // {} until the walk's first alert
+      const fromSeverity = SEVERITY_SCORE[json.severity] ?? 45;
+      const fromScore = typeof json.risk_score === 'number' ? Math.round(json.risk_score * 100) : 0;
+      setRiskScore(Math.max(fromSeverity, fromScore));
+      setRiskSeverity(json.severity ?? 1);
+      const active = json.alerts ? Object.entries(json.alerts) : [[json.alert_type, json.message]];
+      setRiskAlerts(active.map(([type, message]) => message || type));
+    };
+
+    // server pushes alerts as they happen; EventSource reconnects and resumes by itself
+    if (typeof EventSource !== 'undefined') {
+      const es = new EventSource(`/risk/stream?sid=${sessionId}`);
+      es.addEventListener('risk', (e) => {
+        try {
+          applyRisk(JSON.parse(e.data));
+        } catch (err) {
+          // ignore malformed events
+        }
+      });
+      return () => es.close();
+    }
+
     const t = setInterval(async () => {
       try {
         const res = await fetch(`/risk/latest?sid=${sessionId}`);
         if (!res.ok) return;
-        const json = await res.json();   // { riskScore: number }
-        if (typeof json.riskScore === 'number') {
-          setRiskScore(json.riskScore);
-          const { level, pos } = scoreToUi(json.riskScore);
-          setRiskLevel(level);
-          setRiskPosition(pos);
-        }
+        applyRisk(await res.json());
       } catch (e) {
         // ignore transient network errors
       }
@@ -646,7 +707,9 @@ function App() {
     </div>
 
     <div className="emergency-row">
-      <button className="sos" onClick={toggleEmergency}>🆘 Emergency</button>
+      <button className="sos" onClick={toggleEmergency} disabled={callJobActive}>
+        {callJobActive ? "📞 Calling guardians…" : "🆘 Emergency"}
+      </button>
       <button className="dark" onClick={() => setShowGuardian(true)}>🔈 GuardianDashboard</button>
     </div>
 
@@ -696,6 +759,14 @@ function App() {
       <p className="problem-text">
         ⚠️ {riskScore <= 66 ? 'Moderate risk detected! Are you okay?' : 'High risk detected! Are you okay?'}
       </p>
+      {riskSeverity > 0 && (
+        <div className="hint">
+          Severity {riskSeverity}/3
+          <ul>
+            {riskAlerts.map((m, i) => <li key={i}>{m}</li>)}
+          </ul>
+        </div>
+      )}
       <div className="checkin-buttons">
         <button className="ok-btn">I'm OK</button>
         <button className="need-help-btn" onClick={handleNeedHelp}>Need Help</button>
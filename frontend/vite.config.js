@@ -20,6 +20,7 @@ export default defineConfig({
       },
        '/update_location': { target: 'http://localhost:5001', changeOrigin: true },
         '/risk/latest': { target: 'http://localhost:5001', changeOrigin: true },
+        '/risk/stream': { target: 'http://localhost:5001', changeOrigin: true },
         '/risk_update':  { target: 'http://localhost:5001', changeOrigin: true },
 
     },